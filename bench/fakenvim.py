@@ -0,0 +1,271 @@
+# ============================================================================
+# FILE: fakenvim.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+""" An in-process stand-in for the pynvim Nvim object, enough of it for
+    the plugin to run headless. Every call that would be a request to
+    nvim is counted by its API method name, together with the characters
+    sent to buffers, so that the benchmarks can report the RPC cost of
+    an action next to its latency.
+"""
+import re
+import threading
+import time
+from collections import Counter
+
+# Command modifiers that make no difference here
+MODIFIERS = ('silent', 'rightbelow', 'leftabove', 'botright', 'topleft',
+             'vertical', 'keepalt', 'noautocmd')
+# get(g:, 'name', default) as eval() is asked for it
+GET_VAR = re.compile(r"get\(g:, '(\w+)'")
+
+
+class stats(object):
+    def __init__(self):
+        self.requests = Counter()
+        # Characters sent through nvim_buf_set_lines, newlines included
+        self.chars = 0
+
+    def total(self):
+        return sum(self.requests.values())
+
+
+class fakeVars(dict):
+    """ g: variables, set and read through the API """
+    def __init__(self, nvim):
+        dict.__init__(self)
+        self.nvim = nvim
+
+    def __setitem__(self, name, value):
+        self.nvim.record('nvim_set_var')
+        dict.__setitem__(self, name, value)
+
+    def __getitem__(self, name):
+        self.nvim.record('nvim_get_var')
+        return dict.__getitem__(self, name)
+
+
+class fakeBuffer(object):
+    def __init__(self, nvim, number, name):
+        self.nvim = nvim
+        self.number = number
+        self.name = name
+        self.lines = ['']
+        self.valid = True
+        self.vars = {}
+
+    def sent(self, lines):
+        self.nvim.record('nvim_buf_set_lines')
+        self.nvim.stats.chars += sum(len(line) + 1 for line in lines)
+
+    def __len__(self):
+        self.nvim.record('nvim_buf_line_count')
+        return len(self.lines)
+
+    def __getitem__(self, i):
+        self.nvim.record('nvim_buf_get_lines')
+        return self.lines[i]
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            value = list(value)
+            self.sent(value)
+            self.lines[i] = value
+            if not self.lines:
+                # A buffer always has a line
+                self.lines.append('')
+        else:
+            self.sent([value])
+            self.lines[i] = value
+
+    def append(self, lines, index=-1):
+        if isinstance(lines, str):
+            lines = [lines]
+        self.sent(lines)
+        if index == -1:
+            self.lines.extend(lines)
+        else:
+            self.lines[index:index] = lines
+
+
+class fakeWindow(object):
+    def __init__(self, nvim, buffer):
+        self.nvim = nvim
+        self.buffer = buffer
+        self.height = 40
+        self.width = 120
+        self._cursor = (1, 0)
+        self.valid = True
+
+    @property
+    def cursor(self):
+        self.nvim.record('nvim_win_get_cursor')
+        return self._cursor
+
+    @cursor.setter
+    def cursor(self, pos):
+        self.nvim.record('nvim_win_set_cursor')
+        self._cursor = pos
+
+
+class fakeCurrent(object):
+    def __init__(self, nvim):
+        self.nvim = nvim
+
+    @property
+    def buffer(self):
+        self.nvim.record('nvim_get_current_buf')
+        return self.nvim.window.buffer
+
+    @buffer.setter
+    def buffer(self, buffer):
+        self.nvim.record('nvim_set_current_buf')
+        self.nvim.window.buffer = buffer
+
+    @property
+    def window(self):
+        self.nvim.record('nvim_get_current_win')
+        return self.nvim.window
+
+    @window.setter
+    def window(self, window):
+        self.nvim.record('nvim_set_current_win')
+        self.nvim.window = window
+
+    @property
+    def line(self):
+        self.nvim.record('nvim_get_current_line')
+        return self.nvim.window.buffer.lines[self.nvim.window.cursor[0] - 1]
+
+    @line.setter
+    def line(self, value):
+        self.nvim.record('nvim_set_current_line')
+        buf = self.nvim.window.buffer
+        buf.lines[self.nvim.window._cursor[0] - 1] = value
+
+
+class fakeApi(object):
+    def __init__(self, nvim):
+        self.nvim = nvim
+        self.namespaces = {}
+
+    def create_namespace(self, name):
+        self.nvim.record('nvim_create_namespace')
+        return self.namespaces.setdefault(name, len(self.namespaces) + 1)
+
+
+class fakeNvim(object):
+    """ Buffers and windows are created by the :e/:split/:vsplit commands
+        the plugin uses, :r !cmd reads shellOutput into the current
+        buffer and input() answers with the queued inputs """
+    def __init__(self):
+        self.stats = stats()
+        self.vars = fakeVars(self)
+        self.bufferList = []
+        self.windows = []
+        self.window = fakeWindow(self, self.newBuffer('[No Name]'))
+        self.windows.append(self.window)
+        self.current = fakeCurrent(self)
+        self.api = fakeApi(self)
+        # Lines :r ! reads, as if the command printed them
+        self.shellOutput = []
+        # Answers to input(), in order
+        self.inputs = []
+        # What the plugin wrote to the message area
+        self.messages = []
+        self.queue = []
+        self.lock = threading.Lock()
+
+    @property
+    def buffers(self):
+        return {b.number: b for b in self.bufferList}
+
+    def record(self, method):
+        self.stats.requests[method] += 1
+
+    def reset(self):
+        """ Starts counting from zero, returns the counts so far """
+        ret, self.stats = self.stats, stats()
+        return ret
+
+    def newBuffer(self, name):
+        buf = fakeBuffer(self, len(self.bufferList) + 1, name)
+        self.bufferList.append(buf)
+        return buf
+
+    def bufferNamed(self, name):
+        for buf in self.bufferList:
+            if buf.name == name and buf.valid:
+                return buf
+        return self.newBuffer(name)
+
+    def command(self, cmd):
+        self.record('nvim_command')
+        parts = cmd.split(None, 1)
+        while parts and parts[0] in MODIFIERS and len(parts) > 1:
+            parts = parts[1].split(None, 1)
+        if not parts:
+            return
+        verb, arg = parts[0], parts[1] if len(parts) > 1 else ''
+        if verb == 'e':
+            self.window.buffer = self.bufferNamed(arg.split()[-1])
+        elif verb in ('split', 'vsplit'):
+            self.window = fakeWindow(self, self.bufferNamed(arg))
+            self.windows.append(self.window)
+        elif verb == 'wincmd' and arg == 'j':
+            # The input window is the one the explorer was opened from
+            self.window = self.windows[0]
+        elif verb == 'bwipeout':
+            for buf in self.bufferList:
+                if str(buf.number) == arg:
+                    buf.valid = False
+        elif verb == 'r' and arg.startswith('!'):
+            self.window.buffer.lines.extend(self.shellOutput)
+
+    def command_output(self, cmd):
+        self.record('nvim_command_output')
+        return ''
+
+    def eval(self, expr):
+        self.record('nvim_eval')
+        if expr == 'user_input':
+            return self.inputs.pop(0) if self.inputs else ''
+        m = GET_VAR.match(expr)
+        if m:
+            return dict.get(self.vars, m.group(1), {})
+        return ''
+
+    def call(self, name, *args):
+        self.record('nvim_call_function')
+
+    def exec_lua(self, code, *args):
+        self.record('nvim_exec_lua')
+
+    def out_write(self, msg):
+        self.record('nvim_out_write')
+        self.messages.append(msg)
+
+    def async_call(self, fn, *args):
+        # Runs on the "loop", i.e. on the next pump
+        with self.lock:
+            self.queue.append((fn, args))
+
+    def pump(self):
+        """ Runs the callbacks queued by background work, returns how
+            many ran """
+        with self.lock:
+            queue, self.queue = self.queue, []
+        for fn, args in queue:
+            fn(*args)
+        return len(queue)
+
+    def drain(self, until, timeout=60.0):
+        """ Pumps until until() holds """
+        deadline = time.monotonic() + timeout
+        while not until():
+            if not self.pump():
+                if time.monotonic() > deadline:
+                    raise TimeoutError('background work did not finish')
+                time.sleep(0.001)
+        self.pump()
@@ -0,0 +1,78 @@
+# ============================================================================
+# FILE: listing_memory.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+""" Peak memory of a listing, sorted and filtered, held as index vectors
+    into the entry table versus the lists of names it used to be.
+
+    python3 bench/listing_memory.py [entries] [pattern]
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'rplugin', 'python3'))
+
+from vim_tc_explorer.filter import filter  # noqa: E402
+from vim_tc_explorer.listing import entry, sortKeys, sortIndices, view  # noqa
+
+
+def synthetic(count):
+    # Every 20th entry is a folder, as in a typical build tree
+    return [(sys.intern('file_%07d.o' % i), i % 20 == 0)
+            for i in range(count)]
+
+
+def lists(names, pattern):
+    """ The listing as lists of names, with the copies made on every
+        filter and sort """
+    entries = {n: entry(n, isDir) for n, isDir in names}
+    keys = {n: n.lower() for n in entries}
+    ordered = sorted(keys, key=keys.__getitem__)
+    currentFiles = ([n for n in ordered if entries[n].isDir] +
+                    [n for n in ordered if not entries[n].isDir])
+    fileredFiles = currentFiles[:]
+    filtCopy = fileredFiles[:]
+    c_currentFiles = currentFiles[:]
+    filter().filter(c_currentFiles, pattern, fileredFiles)
+    if not fileredFiles:
+        fileredFiles[:] = filtCopy[:]
+    return entries, currentFiles, fileredFiles
+
+
+def vectors(names, pattern):
+    """ The listing as one table with index vectors into it """
+    table = [entry(n, isDir) for n, isDir in names]
+    keys = sortKeys(table, '.', 'name')
+    currentFiles = view(table, sortIndices(table, keys, 'name'))
+    fileredFiles = currentFiles.copy()
+    matches = filter().filterView(currentFiles, pattern)
+    if matches:
+        fileredFiles = matches
+    return table, currentFiles, fileredFiles
+
+
+def measure(fn, names, pattern):
+    tracemalloc.start()
+    held = fn(names, pattern)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return current, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    pattern = sys.argv[2] if len(sys.argv) > 2 else '5'
+    names = synthetic(count)
+    print('%d entries, pattern %r' % (count, pattern))
+    for label, fn in (('lists', lists), ('vectors', vectors)):
+        current, peak = measure(fn, names, pattern)
+        print('%-8s held %7.1f MiB  peak %7.1f MiB' %
+              (label, current / 2.0**20, peak / 2.0**20))
+
+
+if __name__ == '__main__':
+    main()
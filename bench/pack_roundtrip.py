@@ -0,0 +1,97 @@
+# ============================================================================
+# FILE: pack_roundtrip.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+""" Packs a small tree into .zip and .tar.gz and reads both back with
+    zipfile and tarfile, the check to run on a new Python version as the
+    zip writer goes through ZipFile internals (pack.ZIP_INTERNALS).
+
+    python3 bench/pack_roundtrip.py
+
+    Covers empty, small and spooled (larger than pack.SPOOL) members,
+    folders and symlinks. Exits non-zero on the first mismatch.
+"""
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'rplugin', 'python3'))
+
+from vim_tc_explorer import pack  # noqa: E402
+
+
+def makeTree(root):
+    """ Returns {archive name: content} of the files written """
+    files = {
+        'empty': b'',
+        'small.txt': b'hello bolt\n' * 100,
+        os.path.join('sub', 'nested.bin'): bytes(range(256)) * 64,
+        # Random enough not to compress below the spool limit
+        os.path.join('sub', 'large.bin'): os.urandom(pack.SPOOL + 12345),
+    }
+    os.makedirs(os.path.join(root, 'sub', 'deeper'))
+    for rel, data in files.items():
+        with open(os.path.join(root, rel), 'wb') as f:
+            f.write(data)
+    os.symlink('small.txt', os.path.join(root, 'link'))
+    return {rel.replace(os.sep, '/'): data for rel, data in files.items()}
+
+
+def checkZip(target, files):
+    with zipfile.ZipFile(target) as zf:
+        bad = zf.testzip()
+        if bad is not None:
+            return 'bad CRC in %s' % bad
+        names = set(zf.namelist())
+        for rel, data in files.items():
+            if zf.read(rel) != data:
+                return '%s differs' % rel
+        if 'sub/deeper/' not in names:
+            return 'folder missing'
+        if zf.read('link') != b'small.txt':
+            return 'symlink target differs'
+    return None
+
+
+def checkTarGz(target, files):
+    with tarfile.open(target, 'r:gz') as tf:
+        for rel, data in files.items():
+            if tf.extractfile(rel).read() != data:
+                return '%s differs' % rel
+        if not tf.getmember('sub/deeper').isdir():
+            return 'folder missing'
+        if tf.getmember('link').linkname != 'small.txt':
+            return 'symlink target differs'
+    return None
+
+
+def main():
+    work = tempfile.mkdtemp(prefix='bolt-pack-')
+    try:
+        src = os.path.join(work, 'src')
+        files = makeTree(src)
+        names = sorted(os.listdir(src))
+        failed = False
+        for ext, check in (('.zip', checkZip), ('.tar.gz', checkTarGz)):
+            target = os.path.join(work, 'out' + ext)
+            pack.pack(target, src, names, lambda done, total=None: None)
+            err = check(target, files)
+            print('%-7s %s' % (ext, err or 'ok'))
+            failed = failed or err is not None
+        leftovers = [n for n in os.listdir(work) if n.startswith('.bolt-')]
+        if leftovers:
+            print('temp files left behind: %s' % ', '.join(leftovers))
+            failed = True
+    finally:
+        shutil.rmtree(work)
+    print('Python %s' % sys.version.split()[0])
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
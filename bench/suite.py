@@ -0,0 +1,391 @@
+# ============================================================================
+# FILE: suite.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+""" Headless benchmarks, the plugin is driven through vim_tc_explorer
+    with the fake nvim in fakenvim.py against synthetic trees.
+
+    python3 bench/suite.py [--sizes 1k,10k,100k] [--full] [--save]
+                           [--check] [--trees DIR]
+
+    Reports the plugin load time, the filter latency per keystroke, the
+    requests and characters a draw sends, cd latency (cold and from the
+    listing cache), how fast search results are parsed and the copy
+    throughput,
+    and compares them against bench/baseline.json (--save replaces it).
+    The trees are generated once into --trees and reused. The report is
+    also written to bench_output.txt in the repository root.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(ROOT, 'rplugin', 'python3'))
+
+from fakenvim import fakeNvim  # noqa: E402
+from vim_tc_explorer import clipboard, frecency, listing  # noqa: E402
+from vim_tc_explorer.copy import CopyUtilitiy  # noqa: E402
+from vim_tc_explorer.vim_tc_explorer import vim_tc_explorer  # noqa: E402
+
+BASELINE = os.path.join(HERE, 'baseline.json')
+OUTPUT = os.path.join(ROOT, 'bench_output.txt')
+SIZES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+EXTENSIONS = ['c', 'h', 'py', 'o', 'txt', 'md', 'json']
+# Typed one key at a time, narrows down to a few percent of the entries
+PATTERN = 'file_01'
+# A change larger than this (either way) is reported, unless it is
+# within the timer noise of the sub-millisecond timings
+THRESHOLD = 0.2
+NOISE_MS = 0.5
+# Copy workloads, (files, bytes per file)
+SMALL_FILES = (2000, 8 * 1024)
+LARGE_FILES = (4, 32 * 1024 * 1024)
+# Lines of rg --vimgrep output, over this many files
+GREP_LINES = 200000
+GREP_FILES = 5000
+
+
+def name(i):
+    # Every 20th entry is a folder, as in a typical build tree
+    if i % 20 == 0:
+        return 'dir_%07d' % i
+    return 'file_%07d.%s' % (i, EXTENSIONS[i % len(EXTENSIONS)])
+
+
+def tree(base, count):
+    """ A folder with count (empty) entries, made once """
+    path = os.path.join(base, 'flat_%d' % count)
+    done = os.path.join(base, '.flat_%d.done' % count)
+    if os.path.exists(done):
+        return path
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    for i in range(count):
+        p = os.path.join(path, name(i))
+        if i % 20 == 0:
+            os.mkdir(p)
+        else:
+            os.close(os.open(p, os.O_CREAT | os.O_WRONLY, 0o644))
+    open(done, 'w').close()
+    return path
+
+
+def copySource(base, label, count, size):
+    path = os.path.join(base, 'copy_%s' % label)
+    done = os.path.join(base, '.copy_%s.done' % label)
+    if os.path.exists(done):
+        return path
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    chunk = os.urandom(min(size, 1024 * 1024))
+    for i in range(count):
+        with open(os.path.join(path, 'blob_%05d.bin' % i), 'wb') as f:
+            left = size
+            while left > 0:
+                f.write(chunk[:left])
+                left -= len(chunk)
+    open(done, 'w').close()
+    return path
+
+
+def grepOutput():
+    return ['src/mod_%04d/file_%04d.c:%d:%d:    match(%d);' %
+            (i % 97, i % GREP_FILES, i // GREP_FILES + 1, 5, i)
+            for i in range(GREP_LINES)]
+
+
+# Run in a fresh interpreter, as the host loads the plugin
+STARTUP = '''
+import json, sys, time
+from fakenvim import fakeNvim
+start = time.perf_counter()
+import vim_tc_explorer
+imported = time.perf_counter()
+nvim = fakeNvim()
+handlers = vim_tc_explorer.VimTcExplorerHandlers(nvim)
+loaded = time.perf_counter()
+handlers.tc_explore([], None)
+nvim.drain(lambda: handlers.explorer().explorers[0].loadJob is None)
+first = time.perf_counter()
+print(json.dumps([imported - start, loaded - imported, first - loaded]))
+'''
+
+
+def clearListingCache():
+    with listing.cacheLock:
+        listing.cache.clear()
+        listing.cacheEntries = 0
+
+
+class session(object):
+    """ A plugin instance in a fake nvim with the single pane explorer
+        open, the way :Bolt leaves it """
+    def __init__(self, start):
+        self.nvim = fakeNvim()
+        cwd = os.getcwd()
+        os.chdir(start)
+        try:
+            self.tc = vim_tc_explorer(self.nvim)
+        finally:
+            os.chdir(cwd)
+        self.tc.tc_explore([], None)
+        self.nvim.drain(self.idle)
+
+    def exp(self):
+        return self.tc.explorers[self.tc.selectedExplorer]
+
+    def idle(self):
+        return self.exp().isSearcher or self.exp().loadJob is None
+
+    def close(self):
+        self.tc.prefetcher.cancel()
+
+    def type(self, text):
+        """ Types text into the input line one key at a time, returns the
+            seconds each key took """
+        ret = []
+        line = ''
+        for key in text:
+            line += key
+            self.nvim.current.line = line
+            start = time.perf_counter()
+            self.tc.handle_input()
+            ret.append(time.perf_counter() - start)
+            line = self.nvim.current.line
+        return ret
+
+    def clearInput(self):
+        self.nvim.current.line = ''
+        self.tc.abortFilter(None, None)
+
+
+def benchListing(results, base, label, count, repeat):
+    folder = tree(base, count)
+    s = session(base)
+    try:
+        cold = []
+        warm = []
+        for i in range(repeat):
+            clearListingCache()
+            start = time.perf_counter()
+            s.exp().cd(folder)
+            s.nvim.drain(s.idle)
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            s.exp().cd('.')
+            s.nvim.drain(s.idle)
+            warm.append(time.perf_counter() - start)
+        results['cd_cold_ms/%s' % label] = min(cold) * 1e3
+        results['cd_warm_ms/%s' % label] = min(warm) * 1e3
+
+        s.exp().updateListing('')
+        s.nvim.reset()
+        start = time.perf_counter()
+        s.exp().draw()
+        results['draw_ms/%s' % label] = (time.perf_counter() - start) * 1e3
+        drawn = s.nvim.reset()
+        results['draw_rpcs/%s' % label] = drawn.total()
+        results['draw_chars/%s' % label] = drawn.chars
+
+        keys = []
+        rpcs = []
+        for i in range(repeat):
+            s.clearInput()
+            s.nvim.reset()
+            keys += s.type(PATTERN)
+            rpcs.append(s.nvim.reset().total() / len(PATTERN))
+        s.clearInput()
+        results['key_p50_ms/%s' % label] = statistics.median(keys) * 1e3
+        results['key_max_ms/%s' % label] = max(keys) * 1e3
+        results['key_rpcs/%s' % label] = min(rpcs)
+
+        # Moving the selection, the common case between keystrokes
+        s.nvim.reset()
+        start = time.perf_counter()
+        for i in range(20):
+            s.tc.tc_down(None, None)
+        results['down_ms/%s' % label] = \
+            (time.perf_counter() - start) * 1e3 / 20
+        results['down_rpcs/%s' % label] = s.nvim.reset().total() / 20
+    finally:
+        s.close()
+
+
+def benchSearch(results, base, repeat):
+    s = session(base)
+    s.nvim.shellOutput = grepOutput()
+    try:
+        times = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            s.tc.tc_grep(['match'], None)
+            times.append(time.perf_counter() - start)
+            s.tc.restoreExplorer()
+        results['grep_parse_klines_s'] = GREP_LINES / min(times) / 1e3
+    finally:
+        s.close()
+
+
+def benchStartup(results, base, label, count, repeat):
+    """ Loading the plugin with nvim started in the tree, and the first
+        :Bolt after it """
+    folder = tree(base, count)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [HERE, os.path.join(ROOT, 'rplugin', 'python3')] +
+        [p for p in [env.get('PYTHONPATH')] if p])
+    runs = []
+    for i in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', STARTUP],
+                                      cwd=folder, env=env)
+        runs.append(json.loads(out.decode().strip().splitlines()[-1]))
+    results['startup_import_ms'] = min(r[0] for r in runs) * 1e3
+    results['startup_init_ms'] = min(r[1] for r in runs) * 1e3
+    results['first_bolt_ms/%s' % label] = min(r[2] for r in runs) * 1e3
+
+
+def benchCopy(results, base, repeat):
+    nvim = fakeNvim()
+    util = CopyUtilitiy(nvim)
+    for label, (count, size) in (('small', SMALL_FILES),
+                                 ('large', LARGE_FILES)):
+        src = copySource(base, label, count, size)
+        rates = []
+        rpcs = []
+        for i in range(repeat):
+            dest = tempfile.mkdtemp(prefix='bolt-bench-copy-', dir=base)
+            try:
+                nvim.reset()
+                start = time.perf_counter()
+                util.copy_list([src], dest)
+                rates.append(count * size / 2.0**20 /
+                             (time.perf_counter() - start))
+                rpcs.append(nvim.reset().total())
+            finally:
+                shutil.rmtree(dest, ignore_errors=True)
+        results['copy_%s_mb_s' % label] = max(rates)
+        results['copy_%s_rpcs' % label] = min(rpcs)
+
+
+def benchClipboard(results, base, repeat):
+    """ Copying every entry of the 100k tree and reading it back """
+    s = session(tree(base, SIZES['100k']))
+    try:
+        s.tc.markBulk(None, None, 'all')
+        times = []
+        rpcs = []
+        for i in range(repeat):
+            s.nvim.reset()
+            start = time.perf_counter()
+            s.tc.copy(None, None)
+            op, paths = clipboard.get(s.nvim)
+            times.append(time.perf_counter() - start)
+            rpcs.append(s.nvim.reset().total())
+        assert len(paths) == SIZES['100k']
+        results['clipboard_ms/100k'] = min(times) * 1e3
+        results['clipboard_rpcs/100k'] = min(rpcs)
+    finally:
+        s.close()
+
+
+def better(metric):
+    """ 1 when higher is better, -1 when lower is """
+    return 1 if metric.split('/')[0].endswith('_s') else -1
+
+
+def compare(results, baseline):
+    """ Report lines and the metrics that regressed """
+    lines = ['%-26s %12s %12s %8s' % ('metric', 'now', 'baseline',
+                                       'change')]
+    regressed = []
+    for metric in sorted(results):
+        now = results[metric]
+        was = baseline.get(metric)
+        if was is None or was == 0:
+            lines.append('%-26s %12.2f %12s %8s' % (metric, now, '-', '-'))
+            continue
+        change = now / was - 1.0
+        flag = ''
+        if '_ms' in metric and abs(now - was) < NOISE_MS:
+            pass
+        elif change * better(metric) < -THRESHOLD:
+            flag = '  REGRESSION'
+            regressed.append(metric)
+        elif change * better(metric) > THRESHOLD:
+            flag = '  improved'
+        lines.append('%-26s %12.2f %12.2f %+7.0f%%%s' %
+                     (metric, now, was, change * 100, flag))
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1k,10k,100k')
+    parser.add_argument('--full', action='store_true',
+                        help='include the 1M entry tree')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--trees', default=os.path.join(
+        tempfile.gettempdir(), 'bolt-bench'))
+    parser.add_argument('--save', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with 1 on regressions')
+    opts = parser.parse_args()
+    labels = [s.strip().lower() for s in opts.sizes.split(',') if s.strip()]
+    if opts.full and '1m' not in labels:
+        labels.append('1m')
+    os.makedirs(opts.trees, exist_ok=True)
+    # Visits must not end up in the user's history
+    frecency.instance = frecency.frecency(
+        path=os.path.join(opts.trees, 'frecency'))
+    clipboard.SPOOL_PATH = os.path.join(opts.trees, 'clipboard')
+
+    results = {}
+    for label in labels:
+        print('listing %s...' % label, file=sys.stderr)
+        benchListing(results, opts.trees, label, SIZES[label], opts.repeat)
+    print('startup...', file=sys.stderr)
+    benchStartup(results, opts.trees, labels[-1], SIZES[labels[-1]],
+                 opts.repeat)
+    print('search...', file=sys.stderr)
+    benchSearch(results, opts.trees, opts.repeat)
+    print('copy...', file=sys.stderr)
+    benchCopy(results, opts.trees, opts.repeat)
+    print('clipboard...', file=sys.stderr)
+    benchClipboard(results, opts.trees, opts.repeat)
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)['results']
+    lines, regressed = compare(results, baseline)
+    lines.insert(0, 'bolt bench, %s, python %s' %
+                 (platform.platform(), platform.python_version()))
+    report = '\n'.join(lines)
+    print(report)
+    with open(OUTPUT, 'w') as f:
+        f.write(report + '\n')
+    if opts.save:
+        # Merged, so that a partial run only replaces what it measured
+        baseline.update(results)
+        with open(BASELINE, 'w') as f:
+            json.dump({'machine': platform.platform(),
+                       'python': platform.python_version(),
+                       'results': baseline}, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if opts.check and regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
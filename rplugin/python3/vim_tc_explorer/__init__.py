@@ -6,123 +6,226 @@
 
 import neovim
 import vim_tc_explorer.logger
-from vim_tc_explorer.vim_tc_explorer import vim_tc_explorer
+import vim_tc_explorer.profiler
 
 
 @neovim.plugin
+@profiler.instrument
 class VimTcExplorerHandlers(object):
     def __init__(self, nvim):
         self.nvim = nvim
-        # Enable logging
-        logger.init_log(True)
-        self.TcExplorer = vim_tc_explorer(nvim)
+        # Off unless g:bolt_log_level is set (debug/info/warning/error)
+        logger.init_log(nvim.vars.get('bolt_log_level'))
+        # Handler timings, :BoltProfile start does the same
+        profiler.enabled = bool(nvim.vars.get('bolt_profile'))
+        # Created by the first :Bolt* command, loading the host must not
+        # list (and stat) the startup folder
+        self.TcExplorer = None
         logger.log('Plugin Initialized')
 
+    def explorer(self):
+        # Not a property, the host looks up every attribute of the
+        # handlers when the plugin is loaded
+        if self.TcExplorer is None:
+            # The rest of the plugin is only imported once it is used
+            from vim_tc_explorer.vim_tc_explorer import vim_tc_explorer
+            self.TcExplorer = vim_tc_explorer(self.nvim)
+            logger.log('Explorer Initialized')
+        return self.TcExplorer
+
     @neovim.command("Bolt", range='', nargs='*', sync=True)
     def tc_explore(self, args, range):
-        self.TcExplorer.tc_explore(args, range)
+        self.explorer().tc_explore(args, range)
         logger.log('Explorer Spawned')
 
     @neovim.command("BoltCwd", range='', nargs='*', sync=True)
     def tc_explore_cwd(self, args, range):
-        self.TcExplorer.tc_explore_cwd(args, range)
+        self.explorer().tc_explore_cwd(args, range)
 
     @neovim.command("Boltd", range='', nargs='*', sync=True)
     def tc_explore_dual(self, args, range):
-        self.TcExplorer.tc_explore_dual(args, range)
+        self.explorer().tc_explore_dual(args, range)
 
     @neovim.command("BoltExpEnter", range='', nargs='*', sync=True)
     def tc_enter(self, args, range):
-        self.TcExplorer.tc_enter(args, range)
+        self.explorer().tc_enter(args, range)
 
     @neovim.command("BoltExpUp", range='', nargs='*', sync=True)
     def tc_up(self, args, range):
-        self.TcExplorer.tc_up(args, range)
+        self.explorer().tc_up(args, range)
 
     @neovim.command("BoltExpDown", range='', nargs='*', sync=True)
     def tc_down(self, args, range):
-        self.TcExplorer.tc_down(args, range)
+        self.explorer().tc_down(args, range)
 
     @neovim.command("BoltPgUp", range='', nargs='*', sync=True)
     def pg_up(self, args, range):
-        self.TcExplorer.pg_up(args, range)
+        self.explorer().pg_up(args, range)
 
     @neovim.command("BoltPgDown", range='', nargs='*', sync=True)
     def pg_down(self, args, range):
-        self.TcExplorer.pg_down(args, range)
+        self.explorer().pg_down(args, range)
 
     @neovim.command("BoltExpClose", range='', nargs='*', sync=True)
     def tc_close(self, args, range):
-        self.TcExplorer.tc_close(args, range)
+        self.explorer().tc_close(args, range)
 
     @neovim.command("BoltExpTab", range='', nargs='*', sync=True)
     def tc_tab(self, args, range):
-        self.TcExplorer.tc_tab(args, range)
+        self.explorer().tc_tab(args, range)
+
+    @neovim.command("BoltQuickView", range='', nargs='*', sync=True)
+    def tc_quick_view(self, args, range):
+        self.explorer().quickView(args, range)
 
     @neovim.command("BoltSetCwd", range='', nargs='*', sync=True)
     def tc_set_cwd(self, args, range):
-        self.TcExplorer.tc_set_cwd(args, range)
+        self.explorer().tc_set_cwd(args, range)
 
     @neovim.command("BoltMove", range='', nargs='*', sync=True)
     def bolt_move(self, args, range):
-        self.TcExplorer.move(args, range)
+        self.explorer().move(args, range)
 
     @neovim.command("BoltRename", range='', nargs='*', sync=True)
     def bolt_rename(self, args, range):
-        self.TcExplorer.rename(args, range)
+        self.explorer().rename(args, range)
+
+    @neovim.command("BoltMultiRename", range='', nargs='*', sync=True)
+    def bolt_multi_rename(self, args, range):
+        self.explorer().multiRename(args, range)
+
+    @neovim.command("BoltUndoRename", range='', nargs='*', sync=True)
+    def bolt_undo_rename(self, args, range):
+        self.explorer().undoRename(args, range)
 
     @neovim.command("BoltCopy", range='', nargs='*', sync=True)
     def bolt_copy(self, args, range):
-        self.TcExplorer.copy(args, range)
+        self.explorer().copy(args, range)
 
     @neovim.command("BoltPaste", range='', nargs='*', sync=True)
     def bolt_paste(self, args, range):
-        self.TcExplorer.paste(args, range)
+        self.explorer().paste(args, range)
 
     @neovim.command("BoltMkdir", range='', nargs='*', sync=True)
     def bolt_mkdir(self, args, range):
-        self.TcExplorer.mkdir(args, range)
+        self.explorer().mkdir(args, range)
 
     @neovim.command("BoltCreateFile", range='', nargs='*', sync=True)
     def bolt_createFile(self, args, range):
-        self.TcExplorer.createFile(args, range)
+        self.explorer().createFile(args, range)
 
     @neovim.command("BoltDelete", range='', nargs='*', sync=True)
     def bolt_delete(self, args, range):
-        self.TcExplorer.delete(args, range)
+        self.explorer().delete(args, range)
+
+    @neovim.command("BoltUndoDelete", range='', nargs='*', sync=True)
+    def bolt_undo_delete(self, args, range):
+        self.explorer().undoDelete(args, range)
 
     @neovim.command("BoltToggleMark", range='', nargs='*', sync=True)
     def bolt_toggle_mark(self, args, range):
-        self.TcExplorer.toggleMark(args, range)
+        self.explorer().toggleMark(args, range)
+
+    @neovim.command("BoltMark", range='', nargs='*', sync=True)
+    def bolt_mark(self, args, range):
+        self.explorer().markPattern(args, range)
+
+    @neovim.command("BoltUnmark", range='', nargs='*', sync=True)
+    def bolt_unmark(self, args, range):
+        self.explorer().markPattern(args, range, mark=False)
+
+    @neovim.command("BoltMarkAll", range='', nargs='*', sync=True)
+    def bolt_mark_all(self, args, range):
+        self.explorer().markBulk(args, range, 'all')
+
+    @neovim.command("BoltMarkInvert", range='', nargs='*', sync=True)
+    def bolt_mark_invert(self, args, range):
+        self.explorer().markBulk(args, range, 'invert')
+
+    @neovim.command("BoltMarkRange", range='', nargs='*', sync=True)
+    def bolt_mark_range(self, args, range):
+        self.explorer().markBulk(args, range, 'range')
 
     @neovim.command("BoltDisplayLog", range='', nargs='*', sync=True)
     def bolt_display_log(self, args, range):
-        logger.display(self.nvim)
+        logger.display(self.nvim, args[0] if args else None)
+
+    @neovim.command("BoltProfile", range='', nargs='*', sync=True)
+    def bolt_profile(self, args, range):
+        profiler.command(self.nvim, args)
 
     @neovim.command("BoltGitStatus", range='', nargs='*', sync=True)
     def bolt_git_status(self, args, range):
-        self.TcExplorer.gitStatus(args, range)
+        self.explorer().gitStatus(args, range)
 
     @neovim.command("BoltSearch", range='', nargs='*', sync=True)
     def tc_search(self, args, range):
-        self.TcExplorer.tc_search(args, range)
+        self.explorer().tc_search(args, range)
 
     @neovim.command("BoltFind", range='', nargs='*', sync=True)
     def tc_find(self, args, range):
-        self.TcExplorer.tc_find(args, range)
+        self.explorer().tc_find(args, range)
 
     @neovim.command("BoltGrep", range='', nargs='*', sync=True)
     def tc_grep(self, args, range):
-        self.TcExplorer.tc_grep(args, range)
+        self.explorer().tc_grep(args, range)
+
+    @neovim.command("BoltReplace", range='', nargs='*', sync=True)
+    def tc_replace(self, args, range):
+        self.explorer().replace(args, range)
+
+    @neovim.command("BoltReplaceApply", range='', nargs='*', sync=True)
+    def tc_replace_apply(self, args, range):
+        self.explorer().replaceApply(args, range)
+
+    @neovim.command("BoltDuplicates", range='', nargs='*', sync=True)
+    def tc_duplicates(self, args, range):
+        self.explorer().tc_duplicates(args, range)
+
+    @neovim.command("BoltJump", range='', nargs='*', sync=True)
+    def tc_jump(self, args, range):
+        self.explorer().jump(args, range)
+
+    @neovim.command("BoltDirSizes", range='', nargs='*', sync=True)
+    def tc_dir_sizes(self, args, range):
+        self.explorer().dirSizes(args, range)
+
+    @neovim.command("BoltPack", range='', nargs='*', sync=True)
+    def tc_pack(self, args, range):
+        self.explorer().pack(args, range)
+
+    @neovim.command("BoltBranch", range='', nargs='*', sync=True)
+    def tc_branch(self, args, range):
+        self.explorer().branchView(args, range)
+
+    @neovim.command("BoltHide", range='', nargs='*', sync=True)
+    def tc_hide(self, args, range):
+        self.explorer().hide(args, range)
+
+    @neovim.command("BoltDetails", range='', nargs='*', sync=True)
+    def tc_details(self, args, range):
+        self.explorer().toggleDetails(args, range)
+
+    @neovim.command("BoltSort", range='', nargs='*', sync=True)
+    def tc_sort(self, args, range):
+        self.explorer().sort(args, range)
+
+    @neovim.command("BoltSync", range='', nargs='*', sync=True)
+    def tc_sync(self, args, range):
+        self.explorer().tc_sync(args, range)
+
+    @neovim.command("BoltSyncApply", range='', nargs='*', sync=True)
+    def tc_sync_apply(self, args, range):
+        self.explorer().syncApply(args, range)
 
     @neovim.command("BoltAbortFilter", range='', nargs='*', sync=True)
     def tc_abort_filter(self, args, range):
-        self.TcExplorer.abortFilter(args, range)
+        self.explorer().abortFilter(args, range)
 
     @neovim.command("BoltSearchToggle", range='', nargs='*', sync=True)
     def tc_search_toggle(self, args, range):
-        self.TcExplorer.tc_search_toggle(args, range)
+        self.explorer().tc_search_toggle(args, range)
 
     @neovim.autocmd("TextChangedI", pattern='TC_Input', sync=True)
     def insert_changed(self):
-        self.TcExplorer.handle_input()
+        self.explorer().handle_input()
@@ -0,0 +1,430 @@
+# ============================================================================
+# FILE: archive.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import atexit
+import bz2
+import errno
+import gzip
+import hashlib
+import lzma
+import os
+import shutil
+import stat
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from vim_tc_explorer.listing import entry
+from vim_tc_explorer.utils import batcher
+
+# Archives that can be entered like folders
+ZIP_SUFFIXES = ('.zip', '.jar', '.whl')
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.xz', '.txz', '.tar.bz2',
+                '.tbz2')
+ERRORS = (OSError, tarfile.TarError, zipfile.BadZipFile, lzma.LZMAError,
+          EOFError, ValueError)
+BLOCK = 512
+EMPTY_BLOCK = bytes(BLOCK)
+# Types without data in the stream, whatever their size field says (as
+# tarfile reads them)
+NO_DATA = (b'1', b'2', b'3', b'4', b'5', b'6')
+
+# archive -> ((mtime_ns, size), index), the last few archives entered
+cache = OrderedDict()
+cacheLock = threading.Lock()
+CACHE_MAX = 8
+# Members extracted so far, (archive, mtime_ns, member) -> temp file
+extracted = {}
+tempDir = None
+
+
+class member(object):
+    """ An entry of the index, path is the full name in the archive and
+        offset the position of the data in an uncompressed tar. The data
+        of viaTarfile members (sparse files, hard links) isn't stored as
+        it is, tarfile extracts those """
+    __slots__ = ('path', 'isDir', 'size', 'mtime', 'mode', 'offset',
+                 'viaTarfile')
+
+    def __init__(self, path, isDir, size, mtime, mode, offset=None,
+                 viaTarfile=False):
+        self.path = path
+        self.isDir = isDir
+        self.size = size
+        self.mtime = mtime
+        self.mode = mode
+        self.offset = offset
+        self.viaTarfile = viaTarfile
+
+
+def isArchive(path):
+    return (path.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES) and
+            os.path.isfile(path))
+
+
+def split(path):
+    """ (archive, folder in the archive) when path lies inside (or is)
+        an archive, otherwise None """
+    # Only a path with a component named like an archive can lie in one,
+    # the others are answered without touching a (possibly hung) mount
+    if not any(part.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES)
+               for part in path.split(os.sep)):
+        return None
+    inner = []
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        inner.insert(0, os.path.basename(path))
+        path = parent
+    if not isArchive(path):
+        return None
+    return path, '/'.join(inner)
+
+
+def folderOf(index, folder, archiveMtime):
+    # The listing of folder, folders the archive only implies by the
+    # paths of their files are added on the way
+    names = index.get(folder)
+    if names is None:
+        parent, _, name = folder.rpartition('/')
+        parentNames = folderOf(index, parent, archiveMtime)
+        if name not in parentNames:
+            parentNames[name] = member(None, True, 0, archiveMtime,
+                                       stat.S_IFDIR | 0o755)
+        names = index[folder] = {}
+    return names
+
+
+def add(index, path, m, archiveMtime):
+    if path.startswith('./') or '//' in path or '/./' in path:
+        path = '/'.join(p for p in path.split('/') if p and p != '.')
+    path = path.strip('/')
+    if not path or path == '.':
+        return
+    folder, _, name = path.rpartition('/')
+    folderOf(index, folder, archiveMtime)[name] = m
+    if m.isDir:
+        # Empty folders are listed too
+        index.setdefault(path, {})
+
+
+def readZip(path, st):
+    index = {'': {}}
+    mtimes = {}
+    with zipfile.ZipFile(path) as zf:
+        # Only the central directory is read
+        for info in zf.infolist():
+            isDir = info.is_dir()
+            mode = info.external_attr >> 16
+            if not stat.S_IFMT(mode):
+                mode = (stat.S_IFDIR | 0o755) if isDir else \
+                    (stat.S_IFREG | 0o644)
+            # Members tend to share their (2s resolution) timestamps
+            mtime = mtimes.get(info.date_time)
+            if mtime is None:
+                try:
+                    mtime = time.mktime(info.date_time + (0, 0, -1))
+                except (OverflowError, ValueError):
+                    mtime = st.st_mtime
+                mtimes[info.date_time] = mtime
+            add(index, info.filename,
+                member(info.filename, isDir, info.file_size, mtime, mode),
+                st.st_mtime)
+    return index
+
+
+def number(field):
+    # Octal, or base-256 (two's complement, the top bit set as a marker)
+    # for the values that don't fit
+    if field[0] & 0x80:
+        value = int.from_bytes(bytes([field[0] & 0x7f]) + field[1:], 'big')
+        if field[0] & 0x40:
+            value -= 1 << (8 * len(field) - 1)
+        return value
+    return int(field.strip(b' \0') or b'0', 8)
+
+
+def text(field):
+    return field.split(b'\0', 1)[0].decode('utf-8', 'surrogateescape')
+
+
+def openTar(path):
+    """ The (decompressed) tar stream and whether it is compressed """
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    if magic.startswith(b'\x1f\x8b'):
+        return gzip.open(path), True
+    elif magic == b'\xfd7zXZ\x00':
+        return lzma.open(path), True
+    elif magic.startswith(b'BZh'):
+        return bz2.open(path), True
+    return open(path, 'rb'), False
+
+
+def tarMembers(f):
+    """ Yields (path, type, size, mtime, mode, offset, link) for the
+        members of the tar stream f, which is positioned at the data of
+        the member while it is handed out. The headers are parsed here as
+        tarfile spends ~100x longer per member. Sparse members are of
+        type 'S' with their full size, link is the target of links """
+    pos = 0
+    longName = None
+    longLink = None
+    pax = {}
+    while True:
+        header = f.read(BLOCK)
+        if len(header) < BLOCK or header == EMPTY_BLOCK:
+            return
+        pos += BLOCK
+        if sum(header[:148]) + 256 + sum(header[156:]) != \
+                number(header[148:156]):
+            raise tarfile.ReadError('bad checksum at %d' % (pos - BLOCK))
+        kind = header[156:157]
+        size = number(header[124:136])
+        if kind in (b'L', b'K', b'x', b'g'):
+            data = f.read((size + BLOCK - 1) // BLOCK * BLOCK)
+            pos += len(data)
+            if kind == b'L':
+                longName = text(data[:size])
+            elif kind == b'K':
+                longLink = text(data[:size])
+            elif kind == b'x':
+                pax = parsePax(data[:size])
+            continue
+        if longName is not None:
+            path = longName
+        elif 'path' in pax:
+            path = pax['path']
+        else:
+            path = text(header[:100])
+            # POSIX ustar only, GNU headers keep other fields there
+            if header[257:263] == b'ustar\0' and header[345] != 0:
+                path = text(header[345:500]) + '/' + path
+        size = int(pax.get('size', size))
+        # Bytes stored in the stream, the listed size can differ
+        stored = 0 if kind in NO_DATA else size
+        if kind == b'S':
+            # Old GNU sparse, the map continues in extension blocks
+            size = number(header[483:495])
+            more = header[482]
+            while more:
+                ext = f.read(BLOCK)
+                if len(ext) < BLOCK:
+                    return
+                pos += BLOCK
+                more = ext[504]
+        elif 'GNU.sparse.realsize' in pax or 'GNU.sparse.size' in pax:
+            # PAX sparse, 0.x and 1.0 formats
+            kind = b'S'
+            path = pax.get('GNU.sparse.name', path)
+            size = int(pax.get('GNU.sparse.realsize') or
+                       pax['GNU.sparse.size'])
+        link = longLink or pax.get('linkpath') or text(header[157:257])
+        mtime = float(pax.get('mtime', number(header[136:148])))
+        yield (path, kind, max(0, size), mtime,
+               number(header[100:108]) & 0o7777, pos, link)
+        padded = (stored + BLOCK - 1) // BLOCK * BLOCK
+        f.seek(pos + padded)
+        pos += padded
+        longName = None
+        longLink = None
+        pax = {}
+
+
+def parsePax(data):
+    # Records of "<length> <key>=<value>\n"
+    ret = {}
+    i = 0
+    while i < len(data):
+        space = data.find(b' ', i)
+        if space == -1:
+            break
+        length = int(data[i:space])
+        key, _, value = data[space + 1:i + length - 1].partition(b'=')
+        ret[key.decode('utf-8', 'surrogateescape')] = \
+            value.decode('utf-8', 'surrogateescape')
+        i += length
+    return ret
+
+
+def readTar(path, st):
+    index = {'': {}}
+    f, compressed = openTar(path)
+    # A single streaming pass, the data of the members is skipped (with
+    # seeks when uncompressed)
+    # Files by their name, what hard links resolve to
+    files = {}
+    with f:
+        for name, kind, size, mtime, mode, offset, link in tarMembers(f):
+            isDir = kind == b'5' or name.endswith('/')
+            if isDir:
+                mode |= stat.S_IFDIR
+            elif kind == b'2':
+                mode |= stat.S_IFLNK
+            else:
+                mode |= stat.S_IFREG
+            m = member(name, isDir, size, mtime, mode,
+                       None if compressed else offset, kind == b'S')
+            if kind == b'1':
+                target = files.get(link)
+                if target is None:
+                    # Not seen (yet), tarfile looks for it
+                    m.size = 0
+                    m.offset = None
+                    m.viaTarfile = True
+                else:
+                    m.path = target.path
+                    m.size = target.size
+                    m.offset = target.offset
+                    m.viaTarfile = target.viaTarfile
+            elif not isDir and kind != b'2':
+                files[name] = m
+            add(index, name, m, st.st_mtime)
+    return index
+
+
+def readIndex(path):
+    """ {folder: {name: member}} of the archive, the folders are relative
+        to the root of the archive ('' is the root). Cached as long as
+        the archive doesn't change """
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    with cacheLock:
+        hit = cache.get(path)
+        if hit is not None and hit[0] == key:
+            cache.move_to_end(path)
+            return hit[1]
+    if path.lower().endswith(ZIP_SUFFIXES):
+        index = readZip(path, st)
+    else:
+        index = readTar(path, st)
+    with cacheLock:
+        cache[path] = (key, index)
+        while len(cache) > CACHE_MAX:
+            cache.popitem(last=False)
+    return index
+
+
+def listFolder(index, archive, inner):
+    """ The entries of a folder of the archive, with the stat based
+        fields filled in from the index """
+    names = index.get(inner)
+    if names is None:
+        raise FileNotFoundError(errno.ENOENT, 'No such folder in archive',
+                                os.path.join(archive, inner))
+    ret = []
+    for name, m in names.items():
+        e = entry(name, m.isDir)
+        e.size, e.mode, e.mtime = m.size, m.mode, m.mtime
+        ret.append(e)
+    return ret
+
+
+def lookup(path):
+    """ The member at path if it lies inside an archive, else None """
+    inside = split(path)
+    if inside is None or not inside[1]:
+        return None
+    archive, inner = inside
+    try:
+        index = readIndex(archive)
+    except ERRORS:
+        return None
+    folder, name = os.path.split(inner)
+    return index.get(folder, {}).get(name)
+
+
+def isFolder(path):
+    """ os.path.isdir that also knows about archives and their folders """
+    if os.path.isdir(path) or isArchive(path):
+        return True
+    m = lookup(path)
+    return m is not None and m.isDir
+
+
+def extract(path):
+    """ Path of a temp file with the content of the archive member at
+        path, only that member is read. Paths outside archives are
+        returned as they are """
+    global tempDir
+    inside = split(path)
+    if inside is None or not inside[1]:
+        return path
+    archive, inner = inside
+    m = lookup(path)
+    if m is None or m.isDir or m.path is None:
+        raise FileNotFoundError(errno.ENOENT, 'No such file in archive',
+                                path)
+    key = (archive, os.stat(archive).st_mtime_ns, m.path)
+    if key in extracted and os.path.exists(extracted[key]):
+        return extracted[key]
+    if tempDir is None:
+        tempDir = tempfile.mkdtemp(prefix='bolt-archive-')
+        atexit.register(shutil.rmtree, tempDir, True)
+    # Keep the name so that the filetype is detected
+    sub = hashlib.blake2b(repr(key).encode('utf-8', 'surrogateescape'),
+                          digest_size=8).hexdigest()
+    dest = os.path.join(tempDir, sub, os.path.basename(inner))
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with open(dest, 'wb') as out:
+        if archive.lower().endswith(ZIP_SUFFIXES):
+            with zipfile.ZipFile(archive) as zf, zf.open(m.path) as src:
+                shutil.copyfileobj(src, out, 1024 * 1024)
+        elif m.viaTarfile:
+            with tarfile.open(archive) as tf:
+                src = tf.extractfile(m.path)
+                if src is None:
+                    raise FileNotFoundError(errno.ENOENT,
+                                            'No data in archive', path)
+                with src:
+                    shutil.copyfileobj(src, out, 1024 * 1024)
+        elif m.offset is not None:
+            with open(archive, 'rb') as src:
+                src.seek(m.offset)
+                copyBytes(src, out, m.size)
+        else:
+            # Compressed, streamed up to the member
+            f, compressed = openTar(archive)
+            with f:
+                for name, kind, size, mtime, mode, offset, link in \
+                        tarMembers(f):
+                    if name == m.path:
+                        copyBytes(f, out, size)
+                        break
+    extracted[key] = dest
+    return dest
+
+
+def copyBytes(src, out, size):
+    while size > 0:
+        buf = src.read(min(size, 1024 * 1024))
+        if not buf:
+            break
+        out.write(buf)
+        size -= len(buf)
+
+
+class indexJob(batcher):
+    """ Indexes an archive on a thread of its own, the index is in index
+        once finished is set and delivered as {'index': index} """
+    def __init__(self, nvim, archive, callback):
+        batcher.__init__(self, nvim, callback)
+        self.archive = archive
+        self.index = None
+        self.error = None
+        self.finished = threading.Event()
+        self.expect(1)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        try:
+            self.index = readIndex(self.archive)
+        except ERRORS as err:
+            self.error = err
+        self.finished.set()
+        self.put('index', self.index)
@@ -0,0 +1,75 @@
+# ============================================================================
+# FILE: clipboard.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import os
+import time
+from vim_tc_explorer.logger import log, WARNING
+
+# Shared by every nvim instance, the latest copy or cut of any of them
+SPOOL_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'bolt',
+                          'clipboard')
+MAGIC = b'bolt-clipboard'
+# Larger selections are only in the spool, g:BoltCb points to it
+LIST_MAX = 10000
+
+
+def writeSpool(spool, op, paths, stamp):
+    """ A header line and the NUL separated paths, which can hold any
+        file name. Returns False when it could not be written """
+    tmp = '%s.%d.tmp' % (spool, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(spool), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            f.write(b'%s\t%s\t%d\n' % (MAGIC, op.encode(), stamp))
+            f.write(b'\0'.join(os.fsencode(p) for p in paths))
+        os.replace(tmp, spool)
+        return True
+    except OSError as err:
+        log('Writing %s failed: %s', spool, err, level=WARNING)
+        return False
+
+
+def readSpool(spool):
+    """ (op, stamp, paths) or None """
+    try:
+        with open(spool, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as err:
+        log('Reading %s failed: %s', spool, err, level=WARNING)
+        return None
+    header, sep, body = data.partition(b'\n')
+    parts = header.split(b'\t')
+    if not sep or len(parts) != 3 or parts[0] != MAGIC:
+        return None
+    paths = [os.fsdecode(p) for p in body.split(b'\0')] if body else []
+    return parts[1].decode(), int(parts[2]), paths
+
+
+def put(nvim, op, paths):
+    """ Puts the paths on the clipboard with op ('cp' or 'mv'). They go
+        to g:BoltCb as a list through the API, and to the spool for the
+        other instances """
+    spool = SPOOL_PATH
+    stamp = time.time_ns()
+    shared = writeSpool(spool, op, paths, stamp)
+    small = len(paths) <= LIST_MAX or not shared
+    nvim.vars['BoltCb'] = {'op': op, 'stamp': stamp, 'count': len(paths),
+                           'paths': paths if small else [],
+                           'spool': '' if small else spool}
+
+
+def get(nvim):
+    """ (op, paths) of the latest copy or cut, made here or in another
+        instance. (None, []) when there is none """
+    local = nvim.eval("get(g:, 'BoltCb', {})")
+    if not isinstance(local, dict):
+        # The string older versions kept there
+        local = {}
+    shared = readSpool(SPOOL_PATH)
+    if shared is not None and shared[1] >= local.get('stamp', 0):
+        return shared[0], shared[2]
+    return local.get('op'), list(local.get('paths', []))
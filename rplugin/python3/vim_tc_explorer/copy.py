@@ -3,10 +3,12 @@
 # AUTHOR: Philip Karlsson <philipkarlsson at me.com>
 # License: MIT license
 # ============================================================================
+import errno
 import sys
 import shutil
+import stat
 import os
-from vim_tc_explorer.logger import log, log_list
+from vim_tc_explorer.logger import log, log_list, WARNING
 from vim_tc_explorer.utils import python_input
 
 class CopyUtilitiy(object):
@@ -15,18 +17,42 @@ class CopyUtilitiy(object):
         self.nvim = nvim
         self.progBar = None
         self.lastProgTxt = ''
+        # (dest, stat of source) pairs applied once the copy is done
+        self.pendingMeta = []
 
     # I N T E R F A C E
     # ====================
     def copy_list(self, li, dest):
         self.fileForAllAction = '--'
         self.dirForAllAction = '--'
-        self._copy_list(li, dest)
+        self.pendingMeta = []
+        try:
+            self._copy_list(li, dest)
+        finally:
+            self.applyMetadata()
         self.fileForAllAction = '--'
         self.dirForAllAction = '--'
     
     def move_list(self, li):
         pass
+
+    def sync_list(self, pairs):
+        # Copy (src, dst) pairs, replacing whatever exists at dst
+        self.fileForAllAction = 'o'
+        self.dirForAllAction = 'm'
+        self.pendingMeta = []
+        try:
+            for src, dst in pairs:
+                destDir = os.path.dirname(dst)
+                os.makedirs(destDir, exist_ok=True)
+                if os.path.isdir(src):
+                    self.copy_folder(src, destDir)
+                else:
+                    self.copy_file(src, destDir)
+        finally:
+            self.applyMetadata()
+        self.fileForAllAction = '--'
+        self.dirForAllAction = '--'
     # ====================
 
     # Used in order to ease recursion
@@ -72,6 +98,10 @@ class CopyUtilitiy(object):
             os.makedirs(destDir)
         # Do the copy
         self._copy_list(contents, destDir)
+        # Queued after the children so that it is applied before them
+        # in the (reversed) metadata pass, i.e. the children never touch
+        # the restored directory timestamps
+        self.pendingMeta.append((destDir, os.stat(src)))
 
 
 
@@ -108,6 +138,24 @@ class CopyUtilitiy(object):
             self.nvim.command("redraw | echo '%s'" % progTxt)
             self.lastProgTxt = progTxt
 
+    def applyMetadata(self):
+        # Batched metadata pass, run once all the data has been written.
+        # Reversed so that files come before the folders containing them
+        for dst, st in reversed(self.pendingMeta):
+            try:
+                os.chmod(dst, stat.S_IMODE(st.st_mode))
+                os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+            except OSError as err:
+                log('Could not preserve metadata for %s: %s', dst, err,
+                    level=WARNING)
+        self.pendingMeta = []
+
+    def isSparse(self, st):
+        # Fewer allocated blocks than the size implies that there are holes
+        if not hasattr(os, 'SEEK_DATA') or not hasattr(st, 'st_blocks'):
+            return False
+        return st.st_blocks * 512 < st.st_size
+
     def uniquify(self, path):
         start = 0
         testPath = path
@@ -159,10 +207,14 @@ class CopyUtilitiy(object):
         if not follow_symlinks and os.path.islink(src):
             os.symlink(os.readlink(src), dst)
         else:
-            size = os.stat(src).st_size
+            st = os.stat(src)
             with open(src, 'rb') as fsrc:
                 with open(dst, 'wb') as fdst:
-                    self.copyfileobj(fsrc, fdst, total=size)
+                    if self.isSparse(st):
+                        self.copysparse(fsrc, fdst, total=st.st_size)
+                    else:
+                        self.copyfileobj(fsrc, fdst, total=st.st_size)
+            self.pendingMeta.append((dst, st))
         return dst
 
     def copyfileobj(self, fsrc, fdst, total, length=16*1024):
@@ -175,6 +227,38 @@ class CopyUtilitiy(object):
             copied += len(buf)
             self.progCallback(copied, total=total)
 
+    def copysparse(self, fsrc, fdst, total, length=1024*1024):
+        """Copy only the data extents of fsrc, holes are recreated in fdst
+        by seeking past them and truncating to the full size at the end."""
+        fd = fsrc.fileno()
+        pos = 0
+        while pos < total:
+            try:
+                start = os.lseek(fd, pos, os.SEEK_DATA)
+                end = os.lseek(fd, start, os.SEEK_HOLE)
+            except OSError as err:
+                if err.errno == errno.ENXIO:
+                    # No more data after pos, the rest is a hole
+                    break
+                # SEEK_DATA/SEEK_HOLE not supported here, copy it all
+                log('Sparse copy not possible: %s', err, level=WARNING)
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+                self.copyfileobj(fsrc, fdst, total=total)
+                return
+            fdst.seek(start)
+            while start < end:
+                buf = os.pread(fd, min(length, end - start), start)
+                if not buf:
+                    break
+                fdst.write(buf)
+                start += len(buf)
+                self.progCallback(start, total=total)
+            pos = end
+        fdst.truncate(total)
+        self.progCallback(total, total=total)
+
 class ProgressBar(object):
     def __init__(self, message, width=20, progressSymbol=u'█', emptySymbol=u'░'):
         self.width = width
@@ -0,0 +1,60 @@
+# ============================================================================
+# FILE: dirsize.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import os
+import stat
+from vim_tc_explorer.logger import log, WARNING
+from vim_tc_explorer.utils import batcher, thread_pool
+
+
+def dirSize(path, job=None):
+    """ Recursive size of path in bytes, symlinks are not followed. Not
+        cached, a file written in place changes no folder mtime """
+    size = 0
+    try:
+        with os.scandir(path) as it:
+            for e in it:
+                if job is not None and job.cancelled:
+                    return size
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        size += dirSize(e.path, job)
+                    else:
+                        size += e.stat(follow_symlinks=False).st_size
+                except OSError:
+                    pass
+    except OSError as err:
+        log('dirsize: cannot list %s: %s', path, err, level=WARNING)
+    return size
+
+
+class dirSizeJob(batcher):
+    """ Computes the sizes of the entries of a folder concurrently,
+        callback(results, done) is called on the nvim loop with
+        {name: size} batches as the walkers finish """
+    def __init__(self, nvim, folder, names, callback):
+        batcher.__init__(self, nvim, callback)
+        self.folder = folder
+        ready = {}
+        todo = []
+        for name in names:
+            path = os.path.join(folder, name)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if not stat.S_ISDIR(st.st_mode):
+                ready[name] = st.st_size
+            else:
+                todo.append(name)
+        # The files are known up front, delivered as one unit through the
+        # nvim loop so the caller holds the job before the first callback
+        self.expect(len(todo) + 1)
+        self.putAll(ready)
+        for name in todo:
+            thread_pool().submit(self.run, name)
+
+    def run(self, name):
+        self.put(name, dirSize(os.path.join(self.folder, name), self))
@@ -0,0 +1,282 @@
+# ============================================================================
+# FILE: duplicates.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import os
+import mmap
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from vim_tc_explorer.filter import filter
+from vim_tc_explorer.logger import log, WARNING
+from vim_tc_explorer.sync import walkTree
+from vim_tc_explorer.utils import batcher, python_input, thread_pool
+
+# Size of the head and tail blocks used for the partial hash
+BLOCK = 4096
+
+
+def partialHash(path):
+    """ Hash of the first and last block, runs in the worker processes """
+    try:
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                h = hashlib.blake2b(m[:BLOCK])
+                h.update(m[max(BLOCK, len(m) - BLOCK):])
+                return path, h.digest()
+    except (OSError, ValueError):
+        return path, None
+
+
+def fullHash(path):
+    """ Hash of the whole file, runs in the worker processes """
+    try:
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return path, hashlib.blake2b(m).digest()
+    except (OSError, ValueError):
+        return path, None
+
+
+def bucketBy(pool, func, groups):
+    """ Split every group of paths further on the result of func """
+    paths = [p for g in groups for p in g]
+    chunk = max(1, len(paths) // (4 * (os.cpu_count() or 1)))
+    buckets = {}
+    for g, (path, digest) in zip(
+            (i for i, g in enumerate(groups) for p in g),
+            pool.map(func, paths, chunksize=chunk)):
+        if digest is not None:
+            buckets.setdefault((g, digest), []).append(path)
+    return [b for b in buckets.values() if len(b) > 1]
+
+
+class duplicatesJob(batcher):
+    """ Finds the files with equal content below root in the background,
+        callback(results, done) gets {group id: (size, [relative paths])}
+        batches on the nvim loop. Files are bucketed by size, then by a
+        partial hash and only the remaining candidates are read in full """
+    def __init__(self, nvim, root, callback):
+        batcher.__init__(self, nvim, callback)
+        self.root = root
+        self.groupId = 0
+        self.expect(1)
+        thread_pool().submit(self.run)
+
+    def run(self):
+        try:
+            self.find()
+        except Exception as err:
+            log('Finding duplicates in %s failed: %s', self.root, err,
+                level=WARNING)
+        self.putAll({})
+
+    def report(self, size, group):
+        self.groupId += 1
+        self.putAll({self.groupId: (size, sorted(
+            os.path.relpath(p, self.root) for p in group))}, unitDone=False)
+
+    def find(self):
+        bySize = {}
+        for rel, (isDir, size, mtime) in walkTree(self.root, self).items():
+            # Empty files are all equal, but hardly what we're after
+            if not isDir and size > 0:
+                bySize.setdefault(size, []).append(
+                    os.path.join(self.root, rel))
+        groups = [[p for p in g if not os.path.islink(p)]
+                  for g in bySize.values() if len(g) > 1]
+        groups = [g for g in groups if len(g) > 1]
+        if not groups or self.cancelled:
+            return
+        sizeOf = {p: size for size, g in bySize.items() for p in g}
+        with ProcessPoolExecutor() as pool:
+            groups = bucketBy(pool, partialHash, groups)
+            if self.cancelled:
+                return
+            # For small files the partial hash already covered every byte
+            large = []
+            for g in groups:
+                if sizeOf[g[0]] <= 2 * BLOCK:
+                    self.report(sizeOf[g[0]], g)
+                else:
+                    large.append(g)
+            # Every group is reported as soon as all its files are hashed
+            pending = {}
+            futures = {}
+            for i, g in enumerate(large):
+                pending[i] = [len(g), {}]
+                for p in g:
+                    futures[pool.submit(fullHash, p)] = i
+            for future in as_completed(futures):
+                if self.cancelled:
+                    for f in futures:
+                        f.cancel()
+                    return
+                i = futures[future]
+                path, digest = future.result()
+                left = pending[i]
+                left[0] -= 1
+                if digest is not None:
+                    left[1].setdefault(digest, []).append(path)
+                if left[0] == 0:
+                    for b in left[1].values():
+                        if len(b) > 1:
+                            self.report(sizeOf[b[0]], b)
+                    del pending[i]
+        log('Found %d groups of duplicates in %s', self.groupId, self.root)
+
+
+class duplicateFinder(object):
+    """ Pane that lists groups of duplicate files below a folder, used in
+        the same way as the searcher """
+    def __init__(self, nvim, buffer, cwd):
+        self.nvim = nvim
+        self.filter = filter()
+        self.buffer = buffer
+        # Behave like a searcher, i.e. <bs> restores the explorer
+        self.isSearcher = True
+        self.selected = 0
+        self.cwd = cwd
+        self.groups = []
+        self.allFiles = []
+        self.matches = []
+        # One entry per row, the relative path or None for group headers
+        self.fileredFiles = []
+        self.markers = []
+        self.pattern = ''
+        # The search running in the background and what it reports to
+        self.job = None
+        self.onUpdate = None
+        # Header takes up 6 rows
+        self.headerLength = 6
+
+    def find(self, onUpdate=None):
+        """ Searches in the background, onUpdate(done) is called on the
+            nvim loop as the groups come in """
+        self.onUpdate = onUpdate
+        prevbuffer = self.nvim.current.buffer
+        self.nvim.current.buffer = self.buffer
+        self.nvim.command('setlocal filetype=vim_tc_search_result')
+        self.nvim.current.buffer = prevbuffer
+        self.cancel()
+        self.groups = []
+        self.job = duplicatesJob(self.nvim, self.cwd, self.arrived)
+
+    def arrived(self, results, done):
+        if done:
+            self.job = None
+        if results:
+            self.groups += results.values()
+            # Most wasted space first
+            self.groups.sort(key=lambda g: g[0] * (len(g[1]) - 1),
+                             reverse=True)
+            self.allFiles = [p for size, g in self.groups for p in g]
+            self.updateListing(self.pattern)
+        if self.onUpdate is not None:
+            self.onUpdate(done)
+
+    def cancel(self):
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+
+    def getRows(self):
+        matches = set(self.matches)
+        self.fileredFiles = []
+        self.rowText = []
+        for size, g in self.groups:
+            members = [p for p in g if p in matches]
+            if not members:
+                continue
+            self.fileredFiles.append(None)
+            self.rowText.append('+%d bytes | %d copies' % (size, len(g)))
+            for p in members:
+                self.fileredFiles.append(p)
+                self.rowText.append(p)
+        self.changeSelection(0)
+
+    def updateListing(self, pattern):
+        self.pattern = pattern
+        self.filter.filter(self.allFiles, pattern, self.matches)
+        self.getRows()
+
+    def changeSelection(self, offset):
+        self.selected += offset
+        if self.selected < 0:
+            self.selected = 0
+        elif self.selected >= len(self.fileredFiles):
+            self.selected = len(self.fileredFiles)-1
+
+    def toggle(self):
+        # Mark all but the first file of every group, or clear the marks
+        if self.markers:
+            self.markers = []
+        else:
+            self.markers = [p for size, g in self.groups for p in g[1:]]
+
+    def addMarker(self, index):
+        if self.fileredFiles[index] is not None:
+            self.markers.append(self.fileredFiles[index])
+
+    def removeMarker(self, index):
+        self.markers.remove(self.fileredFiles[index])
+
+    def isMarked(self, val):
+        return val in self.markers
+
+    def delete(self, trash):
+        yesno = python_input('Delete %d marked duplicates (y/n - default)?' %
+                             len(self.markers))
+        if yesno == "y":
+            staged = trash.stage([os.path.join(self.cwd, it)
+                                  for it in self.markers])
+            staged = set(os.path.relpath(it, self.cwd) for it in staged)
+            self.groups = [(size, [p for p in g if p not in staged])
+                           for size, g in self.groups]
+            self.groups = [(size, g) for size, g in self.groups if len(g) > 1]
+            self.allFiles = [p for size, g in self.groups for p in g]
+            self.matches = [p for p in self.matches if p not in staged]
+            self.markers = []
+            self.getRows()
+
+    def draw(self):
+        # Drawn in one go, it is redrawn as the groups come in
+        rows = self.getUIHeader()
+        markers = set(self.markers)
+        for idx, val in enumerate(self.fileredFiles):
+            if idx == self.selected:
+                token = '-->'
+            else:
+                token = '   '
+            if val is None:
+                rows.append(token + self.rowText[idx])
+            elif val in markers:
+                rows.append(token + '  <-{' + val + '}->')
+            else:
+                rows.append(token + '  -' + val)
+        self.buffer[:] = rows
+
+    def getSelected(self):
+        idx = self.selected
+        # Group headers open their first file
+        if self.fileredFiles[idx] is None:
+            idx += 1
+        return os.path.join(self.cwd, self.fileredFiles[idx]), None
+
+    def selectedIsFolder(self):
+        return False
+
+    def getUIHeader(self):
+        bar = "==============================================================="
+        leadingC = '#'
+        wasted = sum(size * (len(g) - 1) for size, g in self.groups)
+        ret = []
+        ret.append(leadingC + bar)
+        searching = ', searching...' if self.job is not None else ''
+        ret.append(leadingC + ' Bolt duplicates (%d groups, %d bytes wasted%s)'
+                   % (len(self.groups), wasted, searching))
+        ret.append(leadingC + '  $>' + self.cwd)
+        qhStr = '  Quick Help: <Ret>:Open <C-a>:Mark copies <F8>:Delete'
+        ret.append(leadingC + qhStr)
+        ret.append(leadingC + bar)
+        return ret
@@ -3,174 +3,563 @@
 # AUTHOR: Philip Karlsson <philipkarlsson at me.com>
 # License: MIT license
 # ============================================================================
+import fnmatch
 import os
-import shutil
-from vim_tc_explorer.logger import log, log_list
+import re
+from array import array
+from vim_tc_explorer.logger import log, log_list, WARNING
 from vim_tc_explorer.filter import filter
-from vim_tc_explorer.utils import python_input
+from vim_tc_explorer.listing import scan, sortKeys, sortIndices, DESCENDING
+from vim_tc_explorer.listing import details, statEntries, entry, listJob, view
+from vim_tc_explorer.listing import entries as listed
+from vim_tc_explorer.walker import walkJob
+from vim_tc_explorer.archive import split, readIndex, listFolder, indexJob
+from vim_tc_explorer.archive import ZIP_SUFFIXES, TAR_SUFFIXES
+from vim_tc_explorer.frecency import history
+from vim_tc_explorer.gitignore import ignoredIn
+from vim_tc_explorer.gitstatus import requestStatus, decorate, HIGHLIGHT
+from vim_tc_explorer import utils
+from vim_tc_explorer.utils import python_input, human_size
+
+
+# Seconds to wait for a folder to be listed before the listing is
+# streamed in the background instead
+LIST_TIMEOUT = 0.2
 
 
 class explorer(object):
     """ Class for an explorer that is used in the panes """
-    def __init__(self, cwd):
+    def __init__(self, cwd, hideHidden=False, hideIgnored=False):
         self.isSearcher = False
         # Instance of the filter
         self.filter = filter()
         self.cwd = cwd
-        # The the current files
-        self.currentFiles = os.listdir(self.cwd)
-        # Sort based on folders
-        self.sortFiles()
-        self.fileredFiles = self.currentFiles[:]
+        # Sizes in bytes (recursive for folders) once computed, by name
+        self.sizes = {}
+        self.sizeJob = None
+        self.sortMode = 'name'
+        self.sortReverse = False
+        # Show the mode/size/mtime columns, stat'ed for visible rows only
+        self.detailView = False
+        self.window = None
+        # Flat listing of every file below cwd, by relative path
+        self.branchView = False
+        self.branchGitignore = False
+        self.branchJob = None
+        # Leave out the dot entries / what .gitignore ignores
+        self.hideHidden = hideHidden
+        self.hideIgnored = hideIgnored
+        # Set while a slow folder is being listed in the background
+        self.loadJob = None
+        # (archive, folder in it) while browsing an archive
+        self.archive = None
+        # (cwd, archive, table, keyCache) left for a folder that is being
+        # listed in the background, put back when that is given up on
+        self.before = None
+        self.buffer = None
+        # Git status of the entries, by name
+        self.gitStatus = {}
         # Index that tracks which file that is selected
         self.selected = 0
         self.active = True
+        # False while a searcher style pane borrows the buffer
+        self.inBuffer = True
         self.pattern = ''
         # The header takes up 9 rows
         self.headerLength = 9
-        self.markers = []
-
-    def getFirstFileInFolder(self, folder):
-        log(folder)
-        currentFiles = os.listdir(folder)
-        for f in currentFiles:
-            cf = os.path.abspath(os.path.join(folder, f))
-            if os.path.isdir(os.path.abspath(cf)):
-                return self.getFirstFileInFolder(cf)
-            else:
-                return f
-        return None
-
-    def getFirstFile(self):
-        return self.getFirstFileInFolder(os.path.abspath(self.cwd))
+        self.clearMarkers()
+        # The the current files, views into the entries in self.table
+        self.refreshListing()
+        self.fileredFiles = self.currentFiles.copy()
 
     def sortFiles(self):
-        ogFiles = []
-        ogFiles[:] = self.currentFiles[:]
-        self.currentFiles[:] = []
-        # First folders
-        for file in ogFiles:
-            if(os.path.isdir(os.path.abspath(os.path.join(self.cwd, file)))):
-                self.currentFiles.append(file)
-        # Then files
-        for file in ogFiles:
-            if(not os.path.isdir(os.path.abspath(os.path.join(self.cwd,
-                                                              file)))):
-                self.currentFiles.append(file)
+        # The keys are computed once per listing and mode, switching
+        # back and forth between modes doesn't touch the disk
+        if self.sortMode not in self.keyCache:
+            self.keyCache[self.sortMode] = sortKeys(self.table, self.cwd,
+                                                    self.sortMode, self.sizes)
+        self.currentFiles = view(self.table,
+                                 sortIndices(self.table,
+                                             self.keyCache[self.sortMode],
+                                             self.sortMode, self.sortReverse))
+
+    def setSortMode(self, mode, reverse=False):
+        self.sortMode = mode
+        self.sortReverse = reverse
+        self.sortFiles()
+        self.fileredFiles = self.currentFiles.copy()
+        self.updateListing(self.pattern)
+
+    def updateSizes(self, sizes):
+        self.sizes.update(sizes)
+        self.keyCache.pop('size', None)
 
     def assignBuffer(self, buffer):
         self.buffer = buffer
 
     def draw(self):
-        explorer = self.buffer
-        # New way of getting the header
-        explorer[:] = self.getUIHeader()
+        # The whole listing is sent in one go
+        self.buffer[:] = self.getUIHeader() + [
+            self.getRowString(row, i)
+            for row, i in enumerate(self.fileredFiles.idx)]
+        self.requestDetails()
+        self.requestGitStatus()
+
+    def getRowString(self, row, i):
+        # i is the index of the entry in the table
+        if row == self.selected and self.active:
+            token = "-->"
+        else:
+            token = "   "
+        e = self.table[i]
+        val = e.name
+        if e.isDir:
+            # Folder
+            lineStr = '+' + val + '/'
+        else:
+            lineStr = val
+        if self.detailView:
+            lineStr = details(e, self.sizes.get(val)) + ' ' + lineStr
+        elif val in self.sizes:
+            lineStr += '  ' + human_size(self.sizes[val])
+        if self.isMarked(val):
+            baseStr = token + '<-{' + lineStr + '}->'
+        else:
+            baseStr = token + ' ' + lineStr
+        return baseStr
+
+    def visibleRange(self):
+        # Rows that can be on screen with the selection visible
+        height = self.window.height if self.window is not None else 50
+        lo = max(0, self.selected - height)
+        return lo, min(len(self.fileredFiles), self.selected + height)
+
+    def requestDetails(self):
+        """ Stat the rows in the visible window that lack details """
+        if not self.detailView or utils.nvim is None:
+            return
+        lo, hi = self.visibleRange()
+        missing = [self.table[i] for i in self.fileredFiles.idx[lo:hi]
+                   if self.table[i].mtime is None and
+                   self.table[i].name not in self.statPending]
+        if not missing:
+            return
+        self.statPending.update(e.name for e in missing)
+        table = self.table
+        statEntries(utils.nvim, self.cwd, missing,
+                    lambda names, done: self.detailsArrived(table, names))
+
+    def detailsArrived(self, table, names):
+        # Stale results from a previous listing are dropped
+        if table is not self.table or not self.isShown():
+            return
+        self.statPending.difference_update(names)
+        lo, hi = self.visibleRange()
+        rows = self.fileredFiles.idx[lo:hi]
+        if not any(table[i].name in names for i in rows):
+            return
+        offset = self.headerLength - 1
+        self.buffer[lo + offset:hi + offset] = [
+            self.getRowString(row, i) for row, i in enumerate(rows, lo)]
+
+    def requestGitStatus(self):
+        """ Decorate the rows with the git status once it is known """
+        if utils.nvim is None or not self.isShown():
+            return
+        if self.loadJob is not None:
+            # Looking for the repository would stat the slow folder,
+            # asked again by the draw once it is listed
+            return
+        folder = self.cwd
+        if self.archive or not requestStatus(
+                utils.nvim, folder,
+                lambda status: self.gitArrived(folder, status)):
+            # The marks of the previous folder would stay on the rows
+            if self.gitStatus:
+                self.gitStatus = {}
+                self.decorate()
+
+    def gitArrived(self, folder, status):
+        if folder != self.cwd or not self.isShown():
+            return
+        self.gitStatus = status
+        self.decorate()
+
+    def decorate(self):
+        offset = self.headerLength - 1
+        marks = []
         for idx, val in enumerate(self.fileredFiles):
-            if idx == self.selected and self.active:
-                token = "-->"
-            else:
-                token = "   "
-            baseStr = val
-            if(os.path.isdir(os.path.abspath(os.path.join(self.cwd, val)))):
-                # Folder
-                lineStr = '+' + val + '/'
-            else:
-                lineStr = val
-            if self.isMarked(val):
-                baseStr = token + '<-{' + lineStr + '}->'
-            else:
-                baseStr = token + ' ' + lineStr
-            explorer.append(baseStr)
+            code = self.gitStatus.get(val)
+            if code is not None:
+                marks.append([idx + offset, code, HIGHLIGHT[code]])
+        decorate(utils.nvim, self.buffer, marks)
+
+    def undecorate(self):
+        """ Clears the git status marks, before another pane takes
+            over the buffer """
+        if self.gitStatus and utils.nvim is not None and self.isShown():
+            self.gitStatus = {}
+            decorate(utils.nvim, self.buffer, [])
+
+    def toggleDetails(self):
+        self.detailView = not self.detailView
+
+    def setBranchView(self, on, gitignore=False):
+        self.branchView = on
+        self.branchGitignore = gitignore
+        self.cd('.')
+        self.updateListing(self.pattern)
+
+    def setHide(self, what, on):
+        """ Hides the 'hidden' (dot) or 'ignored' (.gitignore) entries """
+        if what == 'hidden':
+            self.hideHidden = on
+        elif what == 'ignored':
+            self.hideIgnored = on
+        self.cd('.')
+        self.updateListing(self.pattern)
+
+    def entryFilter(self):
+        """ keep(name, isDir) for the listing, None shows everything """
+        hidden = self.hideHidden
+        # Archives have no .gitignore to go by
+        ignoring = self.hideIgnored and self.archive is None
+        if not hidden and not ignoring:
+            return None
+        folder = self.cwd
+        # The .gitignore files are read on first use, i.e. by the worker
+        # listing the folder rather than on the nvim loop
+        ignored = []
+
+        def keep(name, isDir):
+            if hidden and name.startswith('.'):
+                return False
+            if not ignoring:
+                return True
+            if not ignored:
+                ignored.append(ignoredIn(folder))
+            return not ignored[0](name, isDir)
+        return keep
+
+    def kept(self, entries):
+        # For the listings that come with their entries, i.e. archives
+        keep = self.entryFilter()
+        if keep is None:
+            return entries
+        return [e for e in entries if keep(e.name, e.isDir)]
+
+    def isShown(self):
+        return (self.inBuffer and self.buffer is not None and
+                self.buffer.valid)
+
+    def branchArrived(self, files, done):
+        """ Streams walker results into the listing, the job of a
+            previous listing is cancelled so it never gets here """
+        if done:
+            self.branchJob = None
+        self.entriesArrived(list(files.values()), done)
+
+    def listingArrived(self, names, done):
+        """ Streams the entries of a slow folder into the listing """
+        if done:
+            if self.loadJob.error is not None:
+                log('Listing %s failed: %s', self.cwd, self.loadJob.error,
+                    level=WARNING)
+            self.loadJob = None
+            self.before = None
+        self.entriesArrived([entry(n, isDir) for n, isDir in names.items()],
+                            done)
+
+    def entriesArrived(self, entries, done):
+        first = len(self.table)
+        self.table.extend(entries)
+        if done:
+            # Sorted once everything is known
+            self.keyCache = {}
+            self.sortFiles()
+            self.fileredFiles = self.currentFiles.copy()
+            self.updateListing(self.pattern)
+            if self.isShown():
+                self.draw()
+            return
+        new = view(self.table, array('I', range(first, len(self.table))))
+        self.currentFiles.idx.extend(new.idx)
+        matches = self.filter.filterView(new, self.pattern, keepOrder=True)
+        if not matches:
+            return
+        row = len(self.fileredFiles)
+        self.fileredFiles.idx.extend(matches.idx)
+        if not self.isShown():
+            return
+        # Only the header and the new rows are sent
+        self.buffer[0:self.headerLength - 1] = self.getUIHeader()
+        self.buffer.append([self.getRowString(r, i)
+                            for r, i in enumerate(matches.idx, row)])
+        self.requestDetails()
+
+    def readOnly(self):
+        # Archives are browsed, not modified
+        return self.archive is not None
 
     def rename(self, newName):
-        os.rename(self.getSelected()[0], os.path.join(self.cwd, newName))
+        if self.readOnly():
+            return
+        path = self.getSelected()[0]
+        # In the branch view the entry may be in a subfolder
+        os.rename(path, os.path.join(os.path.dirname(path), newName))
         self.cd('.')
         self.updateListing(self.pattern)
 
-    def get_markers_as_string(self):
-        # Add the files that shall be copied to clipboard
-        # returns a string that constitutes the clipboard
-        # which can be set in the host environment
-        ret = ''
-        if len(self.markers) == 0:
-            ret = self.getSelected()[0]
-            return
-        for it in self.markers[:-1]:
-            # If someone has this in their path its their problem :)
-            ret += os.path.join(self.cwd, it) + '_{%boltSplitter%}_'
-        if(len(self.markers) > 0):
-            ret += os.path.join(self.cwd, self.markers[len(self.markers)-1])
-        return ret
+    def getMarkedPaths(self):
+        # The marked entries, or the selected one when none are marked
+        if self.markers:
+            return [os.path.join(self.cwd, it) for it in self.markers]
+        if not self.fileredFiles:
+            return []
+        return [self.getSelected()[0]]
 
-    def delete(self):
+    def delete(self, trash):
+        if self.readOnly():
+            return
         yesno = python_input('Delete selection (y/n - default)?')
         if yesno == "y":
-            for it in self.markers:
-                selFile = os.path.join(self.cwd, it)
-                if os.path.isdir(selFile):
-                    shutil.rmtree(selFile)
-                else:
-                    os.remove(selFile)
+            # The entries are only renamed into the staging area here,
+            # the space is reclaimed in the background
+            staged = trash.stage([os.path.join(self.cwd, it)
+                                  for it in self.markers])
+            staged = set(os.path.relpath(it, self.cwd) for it in staged)
+            table = self.table
+            self.currentFiles = view(table, array(
+                'I', (i for i in self.currentFiles.idx
+                      if table[i].name not in staged)))
+            self.fileredFiles = self.currentFiles.copy()
             self.clearMarkers()
-            self.cd('.')
             self.updateListing(self.pattern)
 
     def move(self, dest):
+        if self.readOnly():
+            return
         os.rename(self.getSelected()[0], dest)
         self.cd('.')
         self.updateListing(self.pattern)
 
     def mkdir(self, name):
+        if self.readOnly():
+            return
         os.makedirs(os.path.join(self.cwd, name))
         self.cd('.')
         self.updateListing(self.pattern)
 
     def createFile(self, name):
+        if self.readOnly():
+            return
         open(os.path.join(self.cwd, name), 'a').close()
         self.cd('.')
         self.updateListing(self.pattern)
 
     def cd(self, path):
-        self.cwd = os.path.abspath(os.path.join(self.cwd, path))
-        self.currentFiles = os.listdir(self.cwd)
-        self.sortFiles()
-        self.fileredFiles = self.currentFiles[:]
+        newCwd = os.path.abspath(os.path.join(self.cwd, path))
+        before = (self.cwd, self.archive, self.table, self.keyCache)
+        if newCwd != self.cwd:
+            if self.sizeJob is not None:
+                self.sizeJob.cancel()
+                self.sizeJob = None
+            self.sizes = {}
+            history().visit(newCwd)
+        self.cwd = newCwd
+        self.refreshListing()
+        if self.loadJob is None:
+            self.before = None
+        elif self.before is None:
+            # The last complete listing, not one that was still loading
+            self.before = before
+        self.fileredFiles = self.currentFiles.copy()
         self.selected = 0
         self.changeSelection(0)
         self.clearMarkers()
 
     def refreshListing(self):
-        self.currentFiles = os.listdir(self.cwd)
+        self.keyCache = {}
+        self.statPending = set()
+        if self.branchJob is not None:
+            self.branchJob.cancel()
+            self.branchJob = None
+        if self.loadJob is not None:
+            self.loadJob.cancel()
+            self.loadJob = None
+        self.archive = split(self.cwd)
+        if self.archive is not None:
+            self.listArchive()
+            return
+        if self.branchView:
+            # Filled in by branchArrived as the walk proceeds
+            self.table = []
+            self.currentFiles = view(self.table)
+            self.branchJob = walkJob(utils.nvim, self.cwd,
+                                     self.branchArrived,
+                                     self.branchGitignore or self.hideIgnored,
+                                     self.hideHidden)
+            return
+        # Applied while the entries are created, the hidden ones are
+        # never sorted or filtered
+        keep = self.entryFilter()
+        if utils.nvim is None:
+            self.table = scan(self.cwd, keep)
+            self.sortFiles()
+            return
+        job = listJob(utils.nvim, self.cwd, self.listingArrived, keep=keep)
+        if job.finished.wait(LIST_TIMEOUT):
+            # The common case, listed right away
+            job.cancel()
+            if job.error is not None:
+                raise job.error
+            self.table = listed(job.names, keep)
+            self.sortFiles()
+            return
+        # Slow (network) mount, show what we have and stream in the rest
+        self.loadJob = job
+        self.table = []
+        self.currentFiles = view(self.table)
+
+    def cancelLoad(self):
+        """ Gives up on the folder being listed in the background and
+            goes back to the listing before it, without touching the disk
+            (the folder may be on a hung mount) """
+        self.loadJob.cancel()
+        self.loadJob = None
+        if self.before is None:
+            # Refreshed in place, what has come in so far is kept
+            return
+        self.cwd, self.archive, self.table, self.keyCache = self.before
+        self.before = None
+        self.statPending = set()
+        self.sortFiles()
+        self.fileredFiles = self.currentFiles.copy()
+        self.selected = 0
+        self.changeSelection(0)
+        self.clearMarkers()
+
+    def selectedIsFolder(self):
+        """ From the listing, entering a folder doesn't stat it first """
+        e = self.fileredFiles.entry(self.selected)
+        if e.isDir:
+            return True
+        # Archives are entered like folders, not those inside archives
+        return (self.archive is None and
+                e.name.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES))
+
+    def listArchive(self):
+        """ Lists the folder of the archive from its (cached) index """
+        archive, inner = self.archive
+        if utils.nvim is None:
+            self.table = self.kept(listFolder(readIndex(archive), archive,
+                                              inner))
+            self.sortFiles()
+            return
+        job = indexJob(utils.nvim, archive, self.indexArrived)
+        if job.finished.wait(LIST_TIMEOUT):
+            job.cancel()
+            if job.error is not None:
+                raise job.error
+            self.table = self.kept(listFolder(job.index, archive, inner))
+            self.sortFiles()
+            return
+        # Indexing a large compressed archive takes a while
+        self.loadJob = job
+        self.table = []
+        self.currentFiles = view(self.table)
+
+    def indexArrived(self, results, done):
+        job = self.loadJob
+        self.loadJob = None
+        self.before = None
+        entries = []
+        if job.error is not None:
+            log('Indexing %s failed: %s', job.archive, job.error,
+                level=WARNING)
+        else:
+            try:
+                entries = self.kept(listFolder(job.index, *self.archive))
+            except OSError as err:
+                log('Listing %s failed: %s', self.cwd, err, level=WARNING)
+        self.entriesArrived(entries, True)
 
     def updateListing(self, pattern):
         ret = 0
         self.pattern = pattern
-        filtCopy = []
-        filtCopy[:] = self.fileredFiles[:]
-        self.filter.filter(self.currentFiles, pattern, self.fileredFiles)
-        if(len(self.fileredFiles) > 0):
+        # Newest/largest first is the point of those modes, so their
+        # order wins over the match quality
+        matches = self.filter.filterView(self.currentFiles, pattern,
+                                         keepOrder=self.sortMode in DESCENDING)
+        if(len(matches) > 0):
+            self.fileredFiles = matches
             ret = 1
-        else:
-            self.fileredFiles[:] = filtCopy[:]
         self.changeSelection(0)
         return ret
 
     def clearMarkers(self):
-        self.markers = []
+        # Ordered set of the marked names (the values are unused), they
+        # outlive filter changes
+        self.markers = {}
+        # Where the last mark was toggled, for markRange
+        self.markAnchor = None
 
     def addMarker(self, index):
         # Operate on file
-        self.markers.append(self.fileredFiles[index])
+        self.markAnchor = self.fileredFiles[index]
+        self.markers[self.markAnchor] = None
 
     def removeMarker(self, index):
         # Operate on file instead of index
-        self.markers.remove(self.fileredFiles[index])
+        self.markAnchor = self.fileredFiles[index]
+        self.markers.pop(self.markAnchor, None)
 
     def isMarked(self, val):
-        ret = False
-        if val in self.markers:
-            ret = True
-        return ret
+        return val in self.markers
+
+    def markPattern(self, pattern, isRegex=False, mark=True):
+        """ (Un)marks every entry of the listing, filtered or not, whose
+            name matches the glob (or regex). Returns the match count """
+        if isRegex:
+            match = re.compile(pattern).search
+        else:
+            match = re.compile(fnmatch.translate(pattern)).match
+        names = [n for n in self.currentFiles if match(n)]
+        if mark:
+            self.markers.update(dict.fromkeys(names))
+        else:
+            for n in names:
+                self.markers.pop(n, None)
+        return len(names)
+
+    def markAll(self):
+        """ Marks the rows that pass the filter """
+        self.markers.update(dict.fromkeys(self.fileredFiles))
+
+    def invertMarks(self):
+        """ Inverts the marks of the rows that pass the filter, the marks
+            of the filtered out entries are kept """
+        markers = self.markers
+        for n in self.fileredFiles:
+            if n in markers:
+                del markers[n]
+            else:
+                markers[n] = None
+
+    def markRange(self):
+        """ Marks the rows from where a mark was last toggled down (or
+            up) to the selection """
+        if not self.fileredFiles:
+            return
+        anchor = self.selected
+        if self.markAnchor is not None:
+            for row, n in enumerate(self.fileredFiles):
+                if n == self.markAnchor:
+                    anchor = row
+                    break
+        lo, hi = sorted((anchor, self.selected))
+        self.markers.update(dict.fromkeys(self.fileredFiles[lo:hi + 1]))
+        self.markAnchor = self.fileredFiles[self.selected]
 
     def changeSelection(self, offset):
         self.selected += offset
@@ -197,8 +586,16 @@ class explorer(object):
             leadingC = '" '
         ret = []
         ret.append(leadingC + bar)
-        ret.append(leadingC + 'Bolt for Neovim (%d files)' %
-                   len(self.fileredFiles))
+        if self.loadJob is not None:
+            ret.append(leadingC + 'Bolt for Neovim (loading\u2026 %d files, '
+                       '<bs> to cancel)' % len(self.fileredFiles))
+        else:
+            hiding = [what for what, on in (('hidden', self.hideHidden),
+                                            ('ignored', self.hideIgnored))
+                      if on]
+            ret.append(leadingC + 'Bolt for Neovim (%d files%s)' % (
+                len(self.fileredFiles),
+                ', %s not shown' % ' and '.join(hiding) if hiding else ''))
         # Shall be highlighted
         ret.append(leadingC + '  $>' + self.cwd)
         qhStr = '  Quick Help: <Ret>:Open   <C-q>:Quit   <C-s>:Set CWD'
@@ -4,30 +4,56 @@
 # License: MIT license
 # ============================================================================
 import re
+from array import array
+from vim_tc_explorer.listing import view
+from vim_tc_explorer.profiler import section
 
 
 class filter(object):
     def __init__(self):
         pass
 
-    def __search(self, input, pattern, output):
-        for entry in input[:]:
-            res = re.search(pattern, entry, re.IGNORECASE)
-            if res is not None:
-                output.append(entry)
-                input.remove(entry)
+    def __patterns(self, pattern):
+        # Setup patterns for the search, best matches first. They are
+        # searched for, so no leading/trailing .* (which only makes the
+        # regex engine backtrack), and the gaps are matched lazily
+        beginningString = '^' + pattern
+        wholeString = pattern
+        fuzzy = '.*?'.join(pattern)
+        return [re.compile(p, re.IGNORECASE)
+                for p in (beginningString, wholeString, fuzzy)]
 
-    def filter(self, input, pattern, output):
-        # Setup patterns for the search
-        beginningString = '^' + pattern + '.*'
-        wholeString = '.*' + pattern + '.*'
-        fuzzy = '.*'
-        for c in pattern:
-            fuzzy += c + '.*'
-        # Perform the search
-        c_currentFiles = []
-        c_currentFiles[:] = input[:]
-        output[:] = []
-        self.__search(c_currentFiles, beginningString, output)
-        self.__search(c_currentFiles, wholeString, output)
-        self.__search(c_currentFiles, fuzzy, output)
+    def __search(self, items, pattern, keepOrder, tiers):
+        # Single pass, every item lands in the tier of its best match.
+        # The fuzzy pattern covers the two others, so it is tried first
+        # and a non-match costs one search
+        beginning, whole, fuzzy = [r.search for r in self.__patterns(pattern)]
+        if keepOrder:
+            tiers[0].extend(item for item, name in items if fuzzy(name))
+            return
+        for item, name in items:
+            if not fuzzy(name):
+                continue
+            if beginning(name):
+                tiers[0].append(item)
+            elif whole(name):
+                tiers[1].append(item)
+            else:
+                tiers[2].append(item)
+
+    def filter(self, input, pattern, output, keepOrder=False):
+        tiers = ([], [], [])
+        with section('filter'):
+            self.__search(((entry, entry) for entry in input), pattern,
+                          keepOrder, tiers)
+        output[:] = tiers[0] + tiers[1] + tiers[2]
+
+    def filterView(self, input, pattern, keepOrder=False):
+        """ filter() for a listing view, the matches are returned as a new
+            view into the same table """
+        if not pattern:
+            return input.copy()
+        tiers = (array('I'), array('I'), array('I'))
+        with section('filter'):
+            self.__search(zip(input.idx, input), pattern, keepOrder, tiers)
+        return view(input.table, tiers[0] + tiers[1] + tiers[2])
@@ -0,0 +1,238 @@
+# ============================================================================
+# FILE: frecency.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import atexit
+import os
+import threading
+import time
+from vim_tc_explorer.filter import filter
+from vim_tc_explorer.logger import log, WARNING
+from vim_tc_explorer.utils import thread_pool
+
+HISTORY_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'bolt',
+                            'frecency')
+# Once the ranks add up to more than this they are scaled down and the
+# folders that drop below one visit are forgotten, which bounds the store
+MAX_AGE = 10000
+# Seconds between a visit and the store being written back
+FLUSH_DELAY = 5
+# Seconds a ranking is reused, the weights only change by the hour
+RANKING_TTL = 60
+
+instance = None
+
+
+def history():
+    """ The shared store of the visited folders """
+    global instance
+    if instance is None:
+        instance = frecency()
+    return instance
+
+
+def weight(age):
+    # Recent visits count for more
+    if age < 3600:
+        return 4.0
+    elif age < 86400:
+        return 2.0
+    elif age < 604800:
+        return 0.5
+    return 0.25
+
+
+class frecency(object):
+    """ Visited folders ranked by how often and how recently they were
+        visited. Kept in memory, the file is read in the background and
+        written back in batches """
+    def __init__(self, path=HISTORY_PATH, maxAge=MAX_AGE,
+                 flushDelay=FLUSH_DELAY):
+        self.path = path
+        self.maxAge = maxAge
+        self.flushDelay = flushDelay
+        # folder -> [rank, time of the last visit]
+        self.folders = {}
+        # Sum of the ranks
+        self.total = 0
+        self.ranked = None
+        self.rankedAt = 0
+        self.timer = None
+        self.lock = threading.Lock()
+        self.loaded = thread_pool().submit(self.load)
+        atexit.register(self.flush)
+
+    def load(self):
+        folders = {}
+        try:
+            with open(self.path, encoding='utf-8',
+                      errors='surrogateescape') as f:
+                for line in f:
+                    try:
+                        rank, last, folder = line.rstrip('\n').split('\t', 2)
+                        folders[folder] = [float(rank), float(last)]
+                    except ValueError:
+                        continue
+        except OSError:
+            return
+        with self.lock:
+            # Visits made while loading win
+            folders.update(self.folders)
+            self.folders = folders
+            self.total = sum(rank for rank, last in folders.values())
+            self.ranked = None
+            self.age()
+
+    def visit(self, folder):
+        with self.lock:
+            hit = self.folders.get(folder)
+            if hit is None:
+                self.folders[folder] = [1.0, time.time()]
+            else:
+                hit[0] += 1
+                hit[1] = time.time()
+            self.total += 1
+            self.age()
+            self.ranked = None
+            if self.timer is None:
+                self.timer = threading.Timer(self.flushDelay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def age(self):
+        if self.total <= self.maxAge:
+            return
+        factor = 0.9 * self.maxAge / self.total
+        aged = {}
+        for folder, (rank, last) in self.folders.items():
+            if rank * factor >= 1:
+                aged[folder] = [rank * factor, last]
+        self.folders = aged
+        self.total = sum(rank for rank, last in aged.values())
+
+    def forget(self, folder):
+        with self.lock:
+            hit = self.folders.pop(folder, None)
+            if hit is not None:
+                self.total -= hit[0]
+                self.ranked = None
+
+    def ranking(self, recent=False):
+        """ The folders best first, or most recently visited first """
+        self.loaded.result()
+        now = time.time()
+        with self.lock:
+            if recent:
+                return sorted(self.folders,
+                              key=lambda f: self.folders[f][1], reverse=True)
+            if self.ranked is None or now - self.rankedAt > RANKING_TTL:
+                scores = {f: rank * weight(now - last)
+                          for f, (rank, last) in self.folders.items()}
+                self.ranked = sorted(scores, key=scores.__getitem__,
+                                     reverse=True)
+                self.rankedAt = now
+            return self.ranked
+
+    def flush(self):
+        with self.lock:
+            self.timer = None
+            lines = ['%.3f\t%d\t%s\n' % (rank, last, folder)
+                     for folder, (rank, last) in self.folders.items()]
+        if not lines:
+            return
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, 'w', encoding='utf-8',
+                      errors='surrogateescape') as f:
+                f.writelines(lines)
+            os.replace(tmp, self.path)
+        except OSError as err:
+            log('Writing %s failed: %s', self.path, err, level=WARNING)
+
+
+class jumper(object):
+    """ Searcher style pane listing the visited folders, best first.
+        Typing narrows the list with the fuzzy matcher """
+    def __init__(self, nvim, buffer, cwd, store):
+        self.nvim = nvim
+        self.buffer = buffer
+        self.window = None
+        self.store = store
+        # Behave like a searcher, i.e. <bs> restores the explorer
+        self.isSearcher = True
+        self.filter = filter()
+        self.cwd = cwd
+        self.recent = False
+        self.pattern = ''
+        self.selected = 0
+        self.folders = store.ranking()
+        self.fileredFiles = self.folders[:]
+        self.markers = []
+        # Header takes up 5 rows
+        self.headerLength = 5
+
+    def updateListing(self, pattern):
+        # A longer pattern only ever matches a subset, so the previous
+        # matches are all that needs to be searched
+        if self.pattern and pattern.startswith(self.pattern):
+            candidates = self.fileredFiles
+        else:
+            candidates = self.folders
+        matches = []
+        self.filter.filter(candidates, pattern, matches, keepOrder=True)
+        if not matches:
+            return 0
+        self.pattern = pattern
+        self.fileredFiles = matches
+        self.changeSelection(0)
+        return 1
+
+    def changeSelection(self, offset):
+        self.selected += offset
+        if self.selected < 0:
+            self.selected = 0
+        elif self.selected >= len(self.fileredFiles):
+            self.selected = len(self.fileredFiles)-1
+
+    def toggle(self):
+        # Switch between the frecency and the most recent order
+        self.recent = not self.recent
+        self.folders = self.store.ranking(self.recent)
+        pattern, self.pattern = self.pattern, ''
+        if not self.updateListing(pattern):
+            self.fileredFiles = self.folders[:]
+
+    def addMarker(self, index):
+        pass
+
+    def removeMarker(self, index):
+        pass
+
+    def isMarked(self, val):
+        return False
+
+    def draw(self):
+        self.buffer[:] = self.getUIHeader() + [
+            ('-->' if idx == self.selected else '   ') + ' ' + val
+            for idx, val in enumerate(self.fileredFiles)]
+
+    def getSelected(self):
+        return self.fileredFiles[self.selected], None
+
+    def selectedIsFolder(self):
+        return True
+
+    def getUIHeader(self):
+        bar = "==============================================================="
+        leadingC = '#'
+        ret = []
+        ret.append(leadingC + bar)
+        ret.append(leadingC + ' Bolt jump (%d folders, %s)' %
+                   (len(self.fileredFiles),
+                    'most recent first' if self.recent else 'frecency'))
+        ret.append(leadingC + '  <Ret>:Jump   <C-a>:Toggle order   '
+                   '<bs>:Back')
+        ret.append(leadingC + bar)
+        return ret
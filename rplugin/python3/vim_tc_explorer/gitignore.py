@@ -0,0 +1,204 @@
+# ============================================================================
+# FILE: gitignore.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Ignore file -> ((mtime_ns, size), matcher), compiled once per version
+cache = OrderedDict()
+cacheLock = threading.Lock()
+CACHE_MAX = 1000
+
+
+def translate(pattern):
+    """ Translates a gitignore glob into a regex (without anchors) """
+    ret = ''
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            ret += '(?:.*/)?'
+            i += 3
+            continue
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            ret += '/.*'
+            i += 3
+            continue
+        elif pattern.startswith('**', i):
+            ret += '.*'
+            i += 2
+            continue
+        elif c == '*':
+            ret += '[^/]*'
+        elif c == '?':
+            ret += '[^/]'
+        elif c == '[':
+            j = pattern.find(']', i + 1)
+            if j == -1:
+                ret += re.escape(c)
+            else:
+                cls = pattern[i + 1:j]
+                if cls.startswith('!'):
+                    cls = '^' + cls[1:]
+                ret += '[' + cls.replace('\\', '\\\\') + ']'
+                i = j
+        elif c == '\\' and i + 1 < len(pattern):
+            i += 1
+            ret += re.escape(pattern[i])
+        else:
+            ret += re.escape(c)
+        i += 1
+    return ret
+
+
+class matcher(object):
+    """ The rules of one .gitignore compiled into a single matcher,
+        paths are given relative to the folder of the .gitignore """
+    def __init__(self, lines):
+        rules = []
+        for line in lines:
+            line = line.rstrip('\n')
+            if not line.endswith('\\ '):
+                line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dirOnly = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            if '/' in line:
+                # Anchored to the folder of the .gitignore
+                regex = translate(line.lstrip('/'))
+            else:
+                regex = '(?:.*/)?' + translate(line)
+            rules.append((regex, negate, dirOnly))
+        self.hasNegation = any(negate for regex, negate, dirOnly in rules)
+        if self.hasNegation:
+            # Last match wins, so they are tried from the bottom up
+            self.rules = [(re.compile(regex + '$'), negate, dirOnly)
+                          for regex, negate, dirOnly in reversed(rules)]
+        else:
+            self.anyRe = self.combine(r for r, n, d in rules if not d)
+            self.dirRe = self.combine(r for r, n, d in rules if d)
+
+    def combine(self, regexes):
+        regexes = list(regexes)
+        if not regexes:
+            return None
+        return re.compile('(?:' + '|'.join(regexes) + ')$')
+
+    def match(self, rel, isDir):
+        """ True if ignored, False if re-included and None if no rule
+            applies """
+        if self.hasNegation:
+            for regex, negate, dirOnly in self.rules:
+                if (isDir or not dirOnly) and regex.match(rel):
+                    return not negate
+            return None
+        if self.anyRe is not None and self.anyRe.match(rel):
+            return True
+        if isDir and self.dirRe is not None and self.dirRe.match(rel):
+            return True
+        return None
+
+
+def loadFile(path):
+    """ Matcher for the ignore file at path, None if there is none """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    with cacheLock:
+        hit = cache.get(path)
+        if hit is not None and hit[0] == key:
+            cache.move_to_end(path)
+            return hit[1]
+    try:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            m = matcher(f.readlines())
+    except OSError:
+        return None
+    with cacheLock:
+        cache[path] = (key, m)
+        while len(cache) > CACHE_MAX:
+            cache.popitem(last=False)
+    return m
+
+
+def load(folder):
+    """ Matcher for the .gitignore in folder, None if there is none """
+    return loadFile(os.path.join(folder, '.gitignore'))
+
+
+def findRepoRoot(folder):
+    while True:
+        if os.path.exists(os.path.join(folder, '.git')):
+            return folder
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return None
+        folder = parent
+
+
+def matchersFor(folder):
+    """ [(base, matcher)] that apply to folder, from the repository root
+        (incl. .git/info/exclude) down to folder itself """
+    ret = []
+    root = findRepoRoot(folder)
+    if root is None:
+        m = load(folder)
+        return [(folder, m)] if m is not None else []
+    m = loadFile(os.path.join(root, '.git', 'info', 'exclude'))
+    if m is not None:
+        ret.append((root, m))
+    rel = os.path.relpath(folder, root)
+    parts = [] if rel == '.' else rel.split(os.sep)
+    base = root
+    for part in [None] + parts:
+        if part is not None:
+            base = os.path.join(base, part)
+        m = load(base)
+        if m is not None:
+            ret.append((base, m))
+    return ret
+
+
+def isIgnored(matchers, path, isDir):
+    """ Evaluates the matchers (outermost first) for path, the deepest
+        .gitignore with an opinion decides """
+    if os.path.basename(path) == '.git':
+        return True
+    for base, m in reversed(matchers):
+        # path always lies below base here
+        res = m.match(path[len(base.rstrip(os.sep)) + 1:], isDir)
+        if res is not None:
+            return res
+    return False
+
+
+def ignoredIn(folder):
+    """ ignored(name, isDir) for the entries of folder. The relative path
+        of folder below each .gitignore is worked out once, not per entry """
+    rules = []
+    for base, m in reversed(matchersFor(folder)):
+        rel = os.path.relpath(folder, base)
+        rules.append((m, '' if rel == '.' else
+                      rel.replace(os.sep, '/') + '/'))
+
+    def ignored(name, isDir):
+        if name == '.git':
+            return True
+        for m, prefix in rules:
+            res = m.match(prefix + name, isDir)
+            if res is not None:
+                return res
+        return False
+    return ignored
@@ -0,0 +1,180 @@
+# ============================================================================
+# FILE: gitstatus.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import os
+import subprocess
+import threading
+import time
+from vim_tc_explorer.gitignore import findRepoRoot
+from vim_tc_explorer.logger import log, WARNING
+from vim_tc_explorer.profiler import section
+from vim_tc_explorer.utils import batcher, thread_pool
+
+# The index doesn't change when files in the work tree are edited, so a
+# status is also re-read once it is this old
+MAX_AGE = 5
+# Higher wins when aggregating the status of a folder
+PRIORITY = {'!': 0, '?': 1, 'A': 2, 'R': 2, 'D': 2, 'M': 2, 'U': 3}
+HIGHLIGHT = {'M': 'DiffChange', 'A': 'DiffAdd', 'R': 'DiffChange',
+             'D': 'DiffDelete', 'U': 'ErrorMsg', '?': 'DiffAdd',
+             '!': 'Comment'}
+
+# Sets the virtual text of the decorated rows in one call
+DECORATE_LUA = """
+local buf, ns, marks = ...
+vim.api.nvim_buf_clear_namespace(buf, ns, 0, -1)
+for _, m in ipairs(marks) do
+  vim.api.nvim_buf_set_extmark(buf, ns, m[1], 0, {
+    virt_text = {{m[2], m[3]}}, virt_text_pos = 'eol'})
+end
+"""
+
+# root -> (index mtime, time read, {path relative to root: status})
+cache = {}
+# root -> [(folder, callback)] waiting for the git process running there
+running = {}
+runningLock = threading.Lock()
+# Of the virtual text, created on first use
+namespace = None
+
+
+def indexMtime(root):
+    try:
+        return os.stat(os.path.join(root, '.git', 'index')).st_mtime_ns
+    except OSError:
+        return None
+
+
+def cached(root):
+    hit = cache.get(root)
+    if (hit is not None and hit[0] == indexMtime(root) and
+            time.time() - hit[1] < MAX_AGE):
+        return hit[2]
+    return None
+
+
+def parse(output):
+    """ {path: status} from git status --porcelain=v2 -z, every folder
+        above a changed path gets the strongest status of its contents """
+    ret = {}
+    records = output.split('\0')
+    i = 0
+    while i < len(records):
+        rec = records[i]
+        i += 1
+        if not rec or rec.startswith('#'):
+            continue
+        kind = rec[0]
+        if kind == '1':
+            xy, path = rec[2:4], rec.split(' ', 8)[8]
+        elif kind == '2':
+            xy, path = rec[2:4], rec.split(' ', 9)[9]
+            # The original path follows as a record of its own
+            i += 1
+        elif kind == 'u':
+            xy, path = 'U', rec.split(' ', 10)[10]
+        elif kind in '?!':
+            xy, path = kind, rec[2:]
+        else:
+            continue
+        if 'U' in xy:
+            code = 'U'
+        elif kind in '?!':
+            code = kind
+        elif kind == '2':
+            code = 'R'
+        elif 'A' in xy:
+            code = 'A'
+        elif 'D' in xy:
+            code = 'D'
+        else:
+            code = 'M'
+        path = path.rstrip('/')
+        ret[path] = code
+        if code == '!':
+            # A folder doesn't become ignored by holding ignored files
+            continue
+        parent = os.path.dirname(path)
+        while parent:
+            old = ret.get(parent)
+            if old is not None and PRIORITY[old] >= PRIORITY[code]:
+                break
+            ret[parent] = code
+            parent = os.path.dirname(parent)
+    return ret
+
+
+def readStatus(root):
+    try:
+        mtime = indexMtime(root)
+        with section('git'):
+            out = subprocess.run(['git', '-C', root, 'status',
+                                  '--porcelain=v2', '-z',
+                                  '--untracked-files=normal', '--ignored'],
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL,
+                                 timeout=30, check=True).stdout
+    except (OSError, subprocess.SubprocessError) as err:
+        log('git status failed in %s: %s', root, err, level=WARNING)
+        return {}
+    ret = parse(out.decode('utf-8', errors='surrogateescape'))
+    cache[root] = (mtime, time.time(), ret)
+    return ret
+
+
+def requestStatus(nvim, folder, callback):
+    """ Status of the repository holding folder, callback(status) gets
+        {path relative to folder: status} on the nvim loop. Returns
+        False when folder isn't in a (local) repository """
+    root = findRepoRoot(folder)
+    if root is None:
+        return False
+    status = cached(root)
+    if status is not None:
+        callback(relativeTo(status, root, folder))
+        return True
+    with runningLock:
+        if root in running:
+            # Only one git process per repository at a time
+            running[root].append((folder, callback))
+            return True
+        waiters = [(folder, callback)]
+        running[root] = waiters
+
+    def deliver(results, done):
+        for f, cb in waiters:
+            cb(relativeTo(results['status'], root, f))
+    job = batcher(nvim, deliver)
+    job.expect(1)
+
+    def run():
+        try:
+            status = readStatus(root)
+        finally:
+            # Later requests are served from the cache, no waiter is
+            # added once it is popped
+            with runningLock:
+                running.pop(root, None)
+        job.put('status', status)
+    thread_pool().submit(run)
+    return True
+
+
+def decorate(nvim, buffer, marks):
+    """ Replaces the status virtual text of buffer with marks, [row,
+        text, highlight] lists. [] clears it """
+    global namespace
+    if namespace is None:
+        namespace = nvim.api.create_namespace('bolt_git_status')
+    nvim.exec_lua(DECORATE_LUA, buffer.number, namespace, marks)
+
+
+def relativeTo(status, root, folder):
+    rel = os.path.relpath(folder, root)
+    if rel == '.':
+        return status
+    prefix = rel + '/'
+    return {p[len(prefix):]: s for p, s in status.items()
+            if p.startswith(prefix)}
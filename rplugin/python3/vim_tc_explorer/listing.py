@@ -0,0 +1,299 @@
+# ============================================================================
+# FILE: listing.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import os
+import re
+import stat
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from vim_tc_explorer.profiler import section
+from vim_tc_explorer.utils import batcher, thread_pool, human_size
+
+# Sort modes, the ones in DESCENDING list the largest/newest first
+SORT_MODES = ['name', 'natural', 'ext', 'size', 'mtime']
+DESCENDING = ['size', 'mtime']
+
+digits = re.compile(r'(\d+)')
+
+# folder -> (mtime_ns, [(name, isDir)]), bounded by the number of entries
+cache = OrderedDict()
+cacheEntries = 0
+cacheLock = threading.Lock()
+CACHE_MAX_ENTRIES = 500000
+# folder -> (mtime_ns, entries read) of the folders prefetch() gave up on,
+# not read again while unchanged
+oversized = {}
+OVERSIZED_MAX = 1000
+
+
+class entry(object):
+    """ A directory entry, the stat based fields are None until needed """
+    __slots__ = ('name', 'isDir', 'size', 'mtime', 'mode')
+
+    def __init__(self, name, isDir):
+        self.name = name
+        self.isDir = isDir
+        self.size = None
+        self.mtime = None
+        self.mode = None
+
+    def stat(self, folder):
+        # mtime is set last as it flags that the fields are filled in,
+        # this runs on the worker threads for the detail view
+        if self.mtime is None:
+            try:
+                with section('stat'):
+                    st = os.stat(os.path.join(folder, self.name))
+            except OSError:
+                # Dangling symlink etc.
+                self.size, self.mode, self.mtime = 0, 0, 0
+                return
+            self.size = st.st_size
+            self.mode = st.st_mode
+            self.mtime = st.st_mtime
+
+
+class view(object):
+    """ The names of a listing in some order. Holds an index vector into
+        the entry table of the listing instead of a list of its own, so
+        sorting and filtering never copy the names """
+    __slots__ = ('table', 'idx')
+
+    def __init__(self, table, idx=None):
+        self.table = table
+        if idx is None:
+            idx = array('I', range(len(table)))
+        self.idx = idx
+
+    def __len__(self):
+        return len(self.idx)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.table[j].name for j in self.idx[i]]
+        return self.table[self.idx[i]].name
+
+    def __iter__(self):
+        table = self.table
+        return (table[i].name for i in self.idx)
+
+    def entry(self, i):
+        return self.table[self.idx[i]]
+
+    def copy(self):
+        return view(self.table, array('I', self.idx))
+
+
+def readdir(folder, limit=None):
+    """ [(name, isDir)] with a single scandir pass, None as soon as there
+        are more than limit """
+    ret = []
+    with section('listdir'), os.scandir(folder) as it:
+        for e in it:
+            try:
+                isDir = e.is_dir()
+            except OSError:
+                isDir = False
+            ret.append((sys.intern(e.name), isDir))
+            if limit is not None and len(ret) > limit:
+                return None
+    return ret
+
+
+def store(folder, mtime, names):
+    global cacheEntries
+    with cacheLock:
+        old = cache.pop(folder, None)
+        if old is not None:
+            cacheEntries -= len(old[1])
+        cache[folder] = (mtime, names)
+        cacheEntries += len(names)
+        # Least recently used listings go first
+        while cacheEntries > CACHE_MAX_ENTRIES and len(cache) > 1:
+            path, evicted = cache.popitem(last=False)
+            cacheEntries -= len(evicted[1])
+
+
+def cachedNames(folder, st):
+    with cacheLock:
+        hit = cache.get(folder)
+        if hit is None or hit[0] != st.st_mtime_ns:
+            return None
+        cache.move_to_end(folder)
+        return hit[1]
+
+
+def entries(names, keep=None):
+    """ Fresh entries for the (name, isDir) pairs keep() accepts, the
+        stat fields must not outlive the listing """
+    if keep is None:
+        return [entry(n, isDir) for n, isDir in names]
+    return [entry(n, isDir) for n, isDir in names if keep(n, isDir)]
+
+
+def scan(folder, keep=None):
+    """ Lists folder, returns the table of entries. Served from the
+        listing cache when the folder hasn't changed since it was read.
+        The cache holds every entry, keep() only applies to the table """
+    st = os.stat(folder)
+    names = cachedNames(folder, st)
+    if names is None:
+        names = readdir(folder)
+        store(folder, st.st_mtime_ns, names)
+    return entries(names, keep)
+
+
+class listJob(batcher):
+    """ Reads a folder on a thread of its own, so that a hung (network)
+        mount only blocks that thread. The entries keep() accepts are
+        delivered in batches as {name: isDir}, all of them are available
+        in names once finished is set """
+    def __init__(self, nvim, folder, callback, batchSize=2000, keep=None):
+        batcher.__init__(self, nvim, callback)
+        self.folder = folder
+        self.batchSize = batchSize
+        self.keep = keep
+        self.names = []
+        self.error = None
+        self.finished = threading.Event()
+        self.expect(1)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        batch = {}
+        try:
+            st = os.stat(self.folder)
+            names = cachedNames(self.folder, st)
+            keep = self.keep
+            if names is not None:
+                self.names = names
+                batch = {n: isDir for n, isDir in names
+                         if keep is None or keep(n, isDir)}
+            else:
+                with section('listdir'), os.scandir(self.folder) as it:
+                    for e in it:
+                        if self.cancelled:
+                            return
+                        try:
+                            isDir = e.is_dir()
+                        except OSError:
+                            isDir = False
+                        name = sys.intern(e.name)
+                        self.names.append((name, isDir))
+                        if keep is not None and not keep(name, isDir):
+                            continue
+                        batch[name] = isDir
+                        if len(batch) >= self.batchSize:
+                            self.putAll(batch, unitDone=False)
+                            batch = {}
+                store(self.folder, st.st_mtime_ns, self.names)
+        except OSError as err:
+            self.error = err
+        self.finished.set()
+        self.putAll(batch)
+
+
+def prefetch(folder, maxEntries):
+    """ Reads folder into the listing cache unless it is already there,
+        returns the number of entries read. Folders with more than
+        maxEntries are left alone """
+    try:
+        st = os.stat(folder)
+        if cachedNames(folder, st) is not None:
+            return 0
+        with cacheLock:
+            hit = oversized.get(folder)
+        if (hit is not None and hit[0] == st.st_mtime_ns and
+                hit[1] > maxEntries):
+            return 0
+        names = readdir(folder, maxEntries)
+    except OSError:
+        return 0
+    if names is None:
+        with cacheLock:
+            if len(oversized) >= OVERSIZED_MAX:
+                oversized.clear()
+            oversized[folder] = (st.st_mtime_ns, maxEntries + 1)
+        return maxEntries + 1
+    store(folder, st.st_mtime_ns, names)
+    return len(names)
+
+
+def statEntries(nvim, folder, entries, callback):
+    """ Stats entries on the thread pool, callback({name: True}, done) is
+        called on the nvim loop as they are filled in """
+    job = batcher(nvim, callback)
+    job.expect(len(entries))
+    for e in entries:
+        thread_pool().submit(statEntry, job, folder, e)
+    return job
+
+
+def statEntry(job, folder, e):
+    e.stat(folder)
+    job.put(e.name, True)
+
+
+# Width of the columns returned by details()
+DETAILS_WIDTH = 35
+
+
+def details(e, size=None):
+    """ The mode, size and mtime columns of the detail view """
+    if e.mtime is None:
+        return ' ' * DETAILS_WIDTH
+    if size is None:
+        size = '<DIR>' if e.isDir else human_size(e.size)
+    else:
+        size = human_size(size)
+    return '%s %7s %s' % (stat.filemode(e.mode), size,
+                          time.strftime('%Y-%m-%d %H:%M',
+                                        time.localtime(e.mtime)))
+
+
+def naturalKey(name):
+    # 'log2' < 'log10', the digit runs are always at the odd positions
+    parts = digits.split(name.lower())
+    parts[1::2] = [int(p) for p in parts[1::2]]
+    return parts
+
+
+def sortKeys(table, folder, mode, sizes=None):
+    """ Precomputes the sort key of every entry in table for mode """
+    if mode in DESCENDING:
+        for e in table:
+            e.stat(folder)
+    if mode == 'natural':
+        return [naturalKey(e.name) for e in table]
+    elif mode == 'ext':
+        return [(os.path.splitext(e.name)[1].lower(), e.name.lower())
+                for e in table]
+    elif mode == 'size':
+        # Computed (recursive) sizes take precedence
+        sizes = sizes or {}
+        return [sizes.get(e.name, -1 if e.isDir else e.size) for e in table]
+    elif mode == 'mtime':
+        return [e.mtime for e in table]
+    return [lowerKey(e.name) for e in table]
+
+
+def lowerKey(name):
+    # Names that are lowercase already are shared rather than copied,
+    # the keys are kept around with the listing
+    key = name.lower()
+    return name if key == name else key
+
+
+def sortIndices(table, keys, mode, reverse=False):
+    """ Sorts on the precomputed keys, folders are kept before files.
+        Returns the order as an index vector into table """
+    order = sorted(range(len(keys)), key=keys.__getitem__,
+                   reverse=(mode in DESCENDING) != reverse)
+    ret = array('I', (i for i in order if table[i].isDir))
+    ret.extend(i for i in order if not table[i].isDir)
+    return ret
@@ -3,43 +3,83 @@
 # AUTHOR: Philip Karlsson <philipkarlsson at me.com>
 # License: MIT license
 # ============================================================================
-import neovim
-import datetime
 import time
+from collections import deque
 
-# Global variable that enables logging
-logparam = False
-logstr = []
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+NAMES = {v: k.upper() for k, v in LEVELS.items()}
 
-def entry_with_ts(data):
-    ts = time.time()
-    st = datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
-    return st + " |  " + data
+# Records kept, the oldest are dropped first
+CAPACITY = 5000
 
-def init_log(_log):
-    global logparam
-    global logstr
-    logstr.append('=== Bolt Log ===')
-    logparam= _log
+# Records below this level are dropped right away, None disables logging
+loglevel = None
+# (level, monotonic time, message template, args), formatted on display
+records = deque(maxlen=CAPACITY)
+# Turns the monotonic timestamps into wall clock time for display
+wallOffset = time.time() - time.monotonic()
 
-def display(nvim):
-    global logstr
+
+def parse_level(name, default=None):
+    if isinstance(name, int):
+        return name
+    return LEVELS.get(str(name).lower(), default)
+
+
+def init_log(_log, capacity=CAPACITY):
+    """ _log is a level name (or number), anything else disables logging """
+    global loglevel
+    global records
+    loglevel = parse_level(_log)
+    if capacity != records.maxlen:
+        records = deque(records, maxlen=capacity)
+
+
+def log(msg, *args, level=INFO):
+    """ The message is only formatted (msg % args) when displayed """
+    if loglevel is None or level < loglevel:
+        return
+    # deque.append is atomic, background threads log too
+    records.append((level, time.monotonic(), msg, args))
+
+
+def log_list(data, level=DEBUG):
+    if loglevel is None or level < loglevel:
+        return
+    records.append((level, time.monotonic(), None, tuple(data)))
+
+
+def format_record(record):
+    level, ts, msg, args = record
+    if msg is None:
+        text = ' | '.join(str(it) for it in args)
+    elif args:
+        try:
+            text = msg % args
+        except (TypeError, ValueError):
+            text = '%s %r' % (msg, args)
+    else:
+        text = msg
+    wall = ts + wallOffset
+    st = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(wall))
+    return '%s.%03d %-7s |  %s' % (st, int(wall * 1000) % 1000,
+                                   NAMES.get(level, level),
+                                   text.strip('\n').replace('\n', ' '))
+
+
+def display(nvim, minLevel=None):
+    """ Shows the records at or above minLevel (all by default) """
+    minLevel = parse_level(minLevel, DEBUG) if minLevel else DEBUG
+    lines = ['=== Bolt Log ===']
+    if loglevel is None:
+        lines.append('Logging is off, let g:bolt_log_level = "debug" '
+                     '(or info/warning/error) to enable it')
+    lines += [format_record(r) for r in list(records) if r[0] >= minLevel]
     nvim.command('e bolt_log')
     nvim.command('setlocal buftype=nofile')
     nvim.command('setlocal filetype=bolt_log')
-    nvim.current.buffer.append(logstr)
-
-def log(data):
-    global logparam
-    global logstr
-    if logparam:
-        logstr.append(entry_with_ts(data.strip('\n')))
-
-def log_list(data):
-    global logparam
-    global logstr
-    resStr = ''
-    for it in data:
-        resStr += str(it) + ' | '
-    if logparam:
-        logstr.append(entry_with_ts(resStr))
+    nvim.current.buffer[:] = lines
@@ -0,0 +1,339 @@
+# ============================================================================
+# FILE: pack.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import io
+import os
+import stat
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from vim_tc_explorer.logger import log, WARNING
+from vim_tc_explorer.utils import batcher, thread_pool
+
+FORMATS = ('.zip', '.tar.gz', '.tgz')
+LEVEL = 6
+# Bytes of the tar stream per gzip member, the unit of work of tar.gz
+PIECE = 1024 * 1024
+# Zip members compressed to more than this are handed back in a temp file
+SPOOL = 8 * 1024 * 1024
+# Tasks queued per worker, bounds what waits in memory to be written
+INFLIGHT = 4
+BLOCKSIZE = tarfile.BLOCKSIZE
+RECORDSIZE = tarfile.RECORDSIZE
+# ZipFile attributes appendRaw() writes through. They are not public,
+# checked on CPython 3.11, bench/pack_roundtrip.py verifies a version
+ZIP_INTERNALS = ('fp', 'filelist', 'NameToInfo', 'start_dir')
+
+
+def fileMode():
+    """ Mode of a new file under the umask. The umask is only readable
+        by setting it, which affects every thread, so it is taken from
+        /proc where there is one and assumed to be 022 otherwise """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Umask:'):
+                    return 0o666 & ~int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0o644
+
+
+def formatOf(name):
+    for ext in FORMATS:
+        if name.endswith(ext):
+            return 'zip' if ext == '.zip' else 'tar.gz'
+    return None
+
+
+def members(cwd, names):
+    """ (archive name, path, lstat) of the entries and everything below
+        them, folders before their contents """
+    ret = []
+    stack = list(reversed(names))
+    while stack:
+        rel = stack.pop()
+        path = os.path.join(cwd, rel)
+        try:
+            st = os.lstat(path)
+        except OSError as err:
+            log('pack: skipping %s: %s', path, err, level=WARNING)
+            continue
+        ret.append((rel, path, st))
+        if stat.S_ISDIR(st.st_mode):
+            try:
+                children = sorted(os.listdir(path))
+            except OSError as err:
+                log('pack: cannot list %s: %s', path, err, level=WARNING)
+                continue
+            stack.extend(os.path.join(rel, c) for c in reversed(children))
+    return ret
+
+
+def readRange(path, offset, length):
+    """ length bytes of path from offset, zero filled if it shrank """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    if len(data) < length:
+        log('pack: %s changed while packed', path, level=WARNING)
+        data += b'\0' * (length - len(data))
+    return data
+
+
+def deflateMember(path, folder):
+    """ Raw deflate of path, runs in the worker processes. Returns
+        (crc, compressed size, size, data), data is the name of a temp
+        file in folder once it gets large """
+    comp = zlib.compressobj(LEVEL, zlib.DEFLATED, -15)
+    crc = 0
+    size = 0
+    chunks = []
+    held = 0
+    spool = None
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(PIECE)
+            if block:
+                crc = zlib.crc32(block, crc)
+                size += len(block)
+                out = comp.compress(block)
+            else:
+                out = comp.flush()
+            chunks.append(out)
+            held += len(out)
+            if held > SPOOL or (spool is not None and not block):
+                if spool is None:
+                    spool = tempfile.NamedTemporaryFile(
+                        prefix='.bolt-pack-', dir=folder, delete=False)
+                spool.writelines(chunks)
+                chunks = []
+                held = 0
+            if not block:
+                break
+    if spool is None:
+        data = b''.join(chunks)
+        return crc, len(data), size, data
+    spool.close()
+    return crc, os.path.getsize(spool.name), size, spool.name
+
+
+def gzipPiece(segments):
+    """ One gzip member holding a piece of the tar stream, runs in the
+        worker processes. Segments are header bytes or (path, offset,
+        length) ranges of member data. Returns (gzip member, data bytes) """
+    raw = b''.join(s if isinstance(s, bytes) else readRange(*s)
+                   for s in segments)
+    # Concatenated members are a valid gzip file (RFC 1952)
+    comp = zlib.compressobj(LEVEL, zlib.DEFLATED, 31)
+    # Progress counts the member data, not the headers
+    data = sum(s[2] for s in segments if not isinstance(s, bytes))
+    return comp.compress(raw) + comp.flush(), data
+
+
+def tarPieces(entries):
+    """ Cuts the tar stream of the entries into PIECE sized lists of
+        segments. The member data is only read by the workers """
+    # gettarinfo() turns repeated inodes into hard links
+    tf = tarfile.TarFile(fileobj=io.BytesIO(), mode='w')
+    piece = []
+    fill = 0
+    total = 0
+    for rel, path, st in entries:
+        try:
+            info = tf.gettarinfo(path, rel)
+        except OSError as err:
+            log('pack: skipping %s: %s', path, err, level=WARNING)
+            continue
+        if info is None:
+            # Sockets and the like
+            continue
+        header = info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+        piece.append(header)
+        fill += len(header)
+        offset = 0
+        size = info.size if info.isreg() else 0
+        while offset < size:
+            if fill >= PIECE:
+                yield piece
+                piece = []
+                fill = 0
+            length = min(size - offset, PIECE - fill)
+            piece.append((path, offset, length))
+            fill += length
+            offset += length
+        pad = -size % BLOCKSIZE
+        if pad:
+            piece.append(b'\0' * pad)
+            fill += pad
+        total += len(header) + size + pad
+        if fill >= PIECE:
+            yield piece
+            piece = []
+            fill = 0
+    # End of archive, padded to a whole record as tarfile does
+    end = 2 * BLOCKSIZE
+    end += -(total + end) % RECORDSIZE
+    piece.append(b'\0' * end)
+    yield piece
+
+
+def ordered(pool, func, tasks, workers):
+    """ pool.submit() for every task, results in order. Only a few tasks
+        per worker are queued at a time """
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(func, *task))
+        if len(pending) >= workers * INFLIGHT:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def zipInfo(rel, st):
+    name = rel.replace(os.sep, '/')
+    if stat.S_ISDIR(st.st_mode):
+        name += '/'
+    # Zip can't go before 1980
+    date = max((1980, 1, 1, 0, 0, 0), time.localtime(st.st_mtime)[:6])
+    info = zipfile.ZipInfo(name, date)
+    info.external_attr = (st.st_mode & 0xFFFF) << 16
+    if stat.S_ISDIR(st.st_mode):
+        info.external_attr |= 0x10
+    return info
+
+
+def writeZip(f, folder, entries, pool, workers, progress):
+    zf = zipfile.ZipFile(f, 'w', allowZip64=True)
+    missing = [a for a in ZIP_INTERNALS if not hasattr(zf, a)]
+    if missing:
+        raise RuntimeError('zipfile lacks %s, zip packing is not supported '
+                           'on this Python' % ', '.join(missing))
+    # Folders and symlinks are written as they come, files once their
+    # worker is done with them
+    files = [(path, folder) for rel, path, st in entries
+             if stat.S_ISREG(st.st_mode)]
+    results = ordered(pool, deflateMember, files, workers)
+    try:
+        writeZipEntries(zf, entries, results, progress)
+    except BaseException:
+        # The spools of the members that were never written
+        for crc, csize, size, data in results:
+            if not isinstance(data, bytes):
+                os.remove(data)
+        raise
+    zf.close()
+
+
+def writeZipEntries(zf, entries, results, progress):
+    done = 0
+    for rel, path, st in entries:
+        if stat.S_ISDIR(st.st_mode):
+            zf.writestr(zipInfo(rel, st), b'')
+        elif stat.S_ISLNK(st.st_mode):
+            info = zipInfo(rel, st)
+            zf.writestr(info, os.readlink(path))
+        elif stat.S_ISREG(st.st_mode):
+            crc, csize, size, data = next(results)
+            info = zipInfo(rel, st)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.CRC = crc
+            info.compress_size = csize
+            info.file_size = size
+            appendRaw(zf, info, data)
+            done += size
+            progress(done)
+
+
+def appendRaw(zf, info, data):
+    """ Adds a member compressed elsewhere, the central directory is
+        left to zf.close(). Goes through the ZIP_INTERNALS of zf, as
+        ZipFile has no public way to add raw deflate data """
+    info.header_offset = zf.fp.tell()
+    zip64 = (info.file_size > zipfile.ZIP64_LIMIT or
+             info.compress_size > zipfile.ZIP64_LIMIT)
+    zf.fp.write(info.FileHeader(zip64))
+    if isinstance(data, bytes):
+        zf.fp.write(data)
+    else:
+        try:
+            with open(data, 'rb') as spool:
+                while True:
+                    block = spool.read(PIECE)
+                    if not block:
+                        break
+                    zf.fp.write(block)
+        finally:
+            os.remove(data)
+    zf.filelist.append(info)
+    zf.NameToInfo[info.filename] = info
+    zf.start_dir = zf.fp.tell()
+
+
+def writeTarGz(f, entries, pool, workers, progress):
+    done = 0
+    for data, size in ordered(pool, gzipPiece,
+                              ((p,) for p in tarPieces(entries)), workers):
+        f.write(data)
+        done += size
+        progress(done)
+
+
+def pack(target, cwd, names, progress):
+    """ Packs the entries (relative to cwd) into target, the format is
+        picked by its extension. Written next to it and renamed into
+        place once complete. progress(bytes) follows along, starting
+        with progress(0, total bytes) """
+    entries = members(cwd, names)
+    progress(0, sum(st.st_size for rel, path, st in entries
+                    if stat.S_ISREG(st.st_mode)))
+    fmt = formatOf(target)
+    workers = os.cpu_count() or 1
+    folder = os.path.dirname(target)
+    fd, tmp = tempfile.mkstemp(prefix='.bolt-pack-', dir=folder)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                if fmt == 'zip':
+                    writeZip(f, folder, entries, pool, workers, progress)
+                else:
+                    writeTarGz(f, entries, pool, workers, progress)
+        # mkstemp() leaves it private
+        os.chmod(tmp, fileMode())
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return len(entries)
+
+
+class packJob(batcher):
+    """ Packs in the background, callback(results, done) gets
+        {'total': bytes, 'bytes': packed so far} and finally
+        {'result': (entries, error)} on the nvim loop """
+    def __init__(self, nvim, target, cwd, names, callback):
+        batcher.__init__(self, nvim, callback)
+        self.expect(1)
+        thread_pool().submit(self.run, target, cwd, names)
+
+    def run(self, target, cwd, names):
+        try:
+            count = pack(target, cwd, names, self.progress)
+            ret = (count, None)
+        except Exception as err:
+            log('Packing %s failed: %s', target, err, level=WARNING)
+            ret = (0, str(err))
+        self.put('result', ret)
+
+    def progress(self, done, total=None):
+        update = {'bytes': done}
+        if total is not None:
+            update['total'] = total
+        self.putAll(update, unitDone=False)
@@ -0,0 +1,75 @@
+# ============================================================================
+# FILE: prefetch.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from vim_tc_explorer.listing import prefetch
+
+
+class prefetcher(object):
+    """ Reads the folders the user is likely to enter next into the
+        listing cache once navigation has been idle for a moment """
+    def __init__(self, delay=0.3, maxEntries=20000, budget=100000):
+        self.delay = delay
+        # Folders larger than this are not read past it, nor cached
+        self.maxEntries = maxEntries
+        # Entries read per round at most
+        self.budget = budget
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        self.history = deque(maxlen=32)
+        self.timer = None
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def candidates(self, exp):
+        ret = []
+        if exp.fileredFiles:
+            sel = exp.fileredFiles.entry(exp.selected)
+            if sel.isDir:
+                ret.append(os.path.join(exp.cwd, sel.name))
+        parent = os.path.dirname(exp.cwd)
+        if parent != exp.cwd:
+            ret.append(parent)
+        # Recently visited siblings, the latest first
+        for folder in reversed(self.history):
+            if (os.path.dirname(folder) == parent and folder != exp.cwd and
+                    folder not in ret):
+                ret.append(folder)
+        return ret
+
+    def schedule(self, exp):
+        """ Called on navigation, restarts the idle timer """
+        self.cancel()
+        if exp.isSearcher or exp.branchView:
+            return
+        if not self.history or self.history[-1] != exp.cwd:
+            self.history.append(exp.cwd)
+        gen = self.generation
+        self.timer = threading.Timer(self.delay, self.start,
+                                     [gen, self.candidates(exp)])
+        self.timer.daemon = True
+        self.timer.start()
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+            self.remaining = self.budget
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def start(self, gen, folders):
+        for folder in folders:
+            self.pool.submit(self.fetch, gen, folder)
+
+    def fetch(self, gen, folder):
+        with self.lock:
+            if gen != self.generation or self.remaining <= 0:
+                return
+        count = prefetch(folder, min(self.maxEntries, self.remaining))
+        with self.lock:
+            self.remaining -= count
@@ -0,0 +1,311 @@
+# ============================================================================
+# FILE: preview.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import heapq
+import mmap
+import os
+import stat
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from vim_tc_explorer.archive import split, lookup, readIndex, listFolder
+from vim_tc_explorer.archive import ERRORS
+from vim_tc_explorer.listing import cachedNames, listJob, lowerKey
+from vim_tc_explorer.profiler import section
+from vim_tc_explorer.utils import human_size
+
+# Bytes per checkpoint of the line index
+CHUNK = 64 * 1024
+# Files up to this size are indexed whole, for the line count
+FULL_INDEX = 16 * CHUNK
+# Bytes looked at to tell binary files from text, as git does
+SNIFF = 8000
+# Longer lines are cut, a single line file can be gigabytes
+MAX_LINE = 1000
+# Hex rows shown for binary files
+HEX_ROWS = 32
+# path -> lineIndex, for the last few files previewed
+indexes = OrderedDict()
+indexLock = threading.Lock()
+INDEX_MAX = 16
+# Magic bytes of the common binary formats
+MAGIC = [(b'\x7fELF', 'ELF executable'), (b'MZ', 'PE executable'),
+         (b'\x89PNG', 'PNG image'), (b'\xff\xd8\xff', 'JPEG image'),
+         (b'GIF8', 'GIF image'), (b'%PDF', 'PDF document'),
+         (b'PK\x03\x04', 'zip archive'), (b'\x1f\x8b', 'gzip data'),
+         (b'\xfd7zXZ\x00', 'xz data'), (b'BZh', 'bzip2 data'),
+         (b'7z\xbc\xaf', '7z archive'),
+         (b'SQLite format 3', 'SQLite database'),
+         (b'\xcf\xfa\xed\xfe', 'Mach-O executable'),
+         (b'\0asm', 'WebAssembly')]
+
+
+class lineIndex(object):
+    """ Where the lines of a file start. lines[k] is the number of lines
+        that end before byte k * CHUNK, so any line is at most one chunk
+        of scanning away. Only built as far as it has been asked for """
+    __slots__ = ('key', 'lines')
+
+    def __init__(self, key):
+        # (mtime_ns, size) of the file it was built for
+        self.key = key
+        self.lines = array('Q', [0])
+
+    def extend(self, mm, line):
+        # Newlines are counted a chunk at a time, in C
+        size = len(mm)
+        lines = self.lines
+        k = len(lines) - 1
+        while lines[-1] < line and k * CHUNK < size:
+            chunk = mm[k * CHUNK:(k + 1) * CHUNK]
+            lines.append(lines[-1] + chunk.count(b'\n'))
+            k += 1
+
+    def offset(self, mm, line):
+        """ Byte offset of line (0 based), None when the file is shorter """
+        if line <= 0:
+            return 0
+        with section('lineindex'):
+            self.extend(mm, line)
+        # The chunk holding the newline that ends line - 1
+        k = bisect_left(self.lines, line) - 1
+        if k + 1 >= len(self.lines):
+            return None
+        pos = k * CHUNK
+        for i in range(line - self.lines[k]):
+            pos = mm.find(b'\n', pos) + 1
+        return pos
+
+    def total(self, mm):
+        """ The number of lines once the whole file has been indexed """
+        if (len(self.lines) - 1) * CHUNK < len(mm):
+            return None
+        count = self.lines[-1]
+        if len(mm) and mm[len(mm) - 1:] != b'\n':
+            count += 1
+        return count
+
+
+def indexFor(path, st):
+    key = (st.st_mtime_ns, st.st_size)
+    with indexLock:
+        idx = indexes.get(path)
+        if idx is None or idx.key != key:
+            # Rewritten or grown, the offsets are off
+            idx = indexes[path] = lineIndex(key)
+        indexes.move_to_end(path)
+        while len(indexes) > INDEX_MAX:
+            indexes.popitem(last=False)
+    return idx
+
+
+def kindOf(head):
+    for magic, kind in MAGIC:
+        if head.startswith(magic):
+            return kind
+    return 'binary data'
+
+
+def isBinary(head):
+    return b'\0' in head[:SNIFF]
+
+
+def hexRows(data, start=0):
+    ret = []
+    for pos in range(0, len(data), 16):
+        row = data[pos:pos + 16]
+        hexed = ' '.join('%02x' % b for b in row[:8])
+        if len(row) > 8:
+            hexed += '  ' + ' '.join('%02x' % b for b in row[8:])
+        text = ''.join(chr(b) if 32 <= b < 127 else '.' for b in row)
+        ret.append('%08x  %-49s |%s|' % (start + pos, hexed, text))
+    return ret
+
+
+def textLines(mm, idx, first, count):
+    """ count lines from line first on, cut at MAX_LINE characters """
+    pos = idx.offset(mm, first)
+    ret = []
+    if pos is None:
+        return ret
+    size = len(mm)
+    while len(ret) < count and pos < size:
+        end = mm.find(b'\n', pos, pos + MAX_LINE * 4)
+        if end == -1:
+            end = min(size, pos + MAX_LINE * 4)
+            # Cut short, continues after the next newline
+            nxt = mm.find(b'\n', end)
+            nxt = size if nxt == -1 else nxt + 1
+        else:
+            nxt = end + 1
+        line = mm[pos:end].decode('utf-8', 'replace').rstrip('\r')
+        ret.append(line[:MAX_LINE].replace('\0', '.'))
+        pos = nxt
+    return ret
+
+
+def previewFile(path, height, lineNum=None):
+    """ Lines showing the file, centred on lineNum (1 based) if given.
+        Returns (lines, row of lineNum in them or None) """
+    name = os.path.basename(path)
+    # Opening a FIFO blocks until a writer shows up, only regular files
+    # are opened
+    if not stat.S_ISREG(os.stat(path).st_mode):
+        return ['# %s (special file)' % name], None
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            return ['# %s (special file)' % name], None
+        if st.st_size == 0:
+            return ['# %s (empty)' % name], None
+        # Only what is shown is read, the file is never loaded whole
+        with mmap.mmap(f.fileno(), st.st_size,
+                       access=mmap.ACCESS_READ) as mm:
+            head = mm[:SNIFF]
+            if isBinary(head):
+                ret = ['# %s (%s, %s)' % (name, kindOf(head),
+                                          human_size(st.st_size))]
+                return ret + hexRows(mm[:16 * min(HEX_ROWS, height)]), None
+            idx = indexFor(path, st)
+            if st.st_size <= FULL_INDEX:
+                idx.extend(mm, st.st_size + 1)
+            first = 0
+            if lineNum is not None:
+                first = max(0, lineNum - 1 - height // 2)
+            lines = textLines(mm, idx, first, height)
+            total = idx.total(mm)
+    header = '# %s (%s%s)' % (name, human_size(st.st_size),
+                              ', %d lines' % total if total is not None
+                              else '')
+    ret = [header] + ['%6d  %s' % (first + i + 1, line)
+                      for i, line in enumerate(lines)]
+    row = None
+    if lineNum is not None and first < lineNum <= first + len(lines):
+        row = lineNum - first + 1
+    return ret, row
+
+
+def previewFolder(path, height, names):
+    """ The first rows of the folder in the order of the listing, names
+        are (name, isDir) pairs """
+    name = os.path.basename(path.rstrip('/')) or path
+    # Only the rows that fit are sorted, folders first
+    first = heapq.nsmallest(height, names,
+                            key=lambda n: (not n[1], lowerKey(n[0])))
+    ret = ['# %s/ (%d entries)' % (name, len(names))]
+    for n, isDir in first:
+        ret.append('+' + n + '/' if isDir else n)
+    return ret
+
+
+def folderHeader(path, note):
+    return ['# %s/ (%s)' % (os.path.basename(path.rstrip('/')) or path,
+                            note)]
+
+
+def previewArchived(path, inside, height):
+    archive, inner = inside
+    m = lookup(path)
+    if m is None:
+        return ['# %s (not found in the archive)' % os.path.basename(path)]
+    if m.isDir:
+        return previewFolder(path, height,
+                             [(e.name, e.isDir) for e in
+                              listFolder(readIndex(archive), archive, inner)])
+    return ['# %s (%s in %s)' % (os.path.basename(path), human_size(m.size),
+                                 os.path.basename(archive)),
+            '  <Ret> extracts and opens it']
+
+
+def render(path, height, lineNum=None):
+    """ (lines, row to put the cursor on or None) previewing path.
+        lines is None for a folder that isn't in the listing cache """
+    try:
+        inside = split(path)
+        if inside is not None and inside[1]:
+            return previewArchived(path, inside, height), None
+        if os.path.isdir(path):
+            names = cachedNames(path, os.stat(path))
+            if names is None:
+                return None, None
+            return previewFolder(path, height, names), None
+        return previewFile(path, height, lineNum)
+    except ERRORS as err:
+        return ['# %s' % os.path.basename(path), '  %s' % err], None
+
+
+class previewer(object):
+    """ The quick-view split, shows the selection of the explorer (or
+        searcher) it was opened from and follows it around """
+    def __init__(self, nvim):
+        self.nvim = nvim
+        self.buffer = None
+        self.window = None
+        # What is shown, not redrawn while the selection stays put
+        self.shown = None
+        # Lists the folder shown when it wasn't cached
+        self.listing = None
+
+    def isShown(self):
+        return (self.window is not None and self.window.valid and
+                self.buffer is not None and self.buffer.valid)
+
+    def open(self, window):
+        """ Splits window, the focus is handed back to where it was """
+        prevwindow = self.nvim.current.window
+        self.nvim.current.window = window
+        self.nvim.command('rightbelow vsplit Bolt_QuickView')
+        self.nvim.command('setlocal buftype=nofile bufhidden=wipe noswapfile')
+        self.nvim.command('setlocal nowrap nonumber cursorline')
+        self.nvim.command('setlocal filetype=vim_tc_quickview')
+        self.buffer = self.nvim.current.buffer
+        self.window = self.nvim.current.window
+        self.nvim.current.window = prevwindow
+        self.shown = None
+
+    def close(self):
+        self.cancelListing()
+        if self.buffer is not None and self.buffer.valid:
+            self.nvim.command('bwipeout %d' % self.buffer.number)
+        self.buffer = None
+        self.window = None
+
+    def show(self, path, lineNum=None):
+        if not self.isShown() or (path, lineNum) == self.shown:
+            return
+        self.shown = (path, lineNum)
+        self.cancelListing()
+        height = max(1, self.window.height - 1)
+        lines, row = render(path, height, lineNum)
+        if lines is None:
+            # A hung mount must not block the editor
+            lines = folderHeader(path, 'listing')
+            self.listInBackground(path, height)
+        self.buffer[:] = lines
+        self.window.cursor = (row or 1, 0)
+
+    def listInBackground(self, path, height):
+        shown = self.shown
+
+        def arrived(names, done):
+            if not done or self.listing is not job:
+                return
+            self.listing = None
+            if self.shown != shown or not self.isShown():
+                return
+            if job.error is not None:
+                self.buffer[:] = folderHeader(path, job.error.strerror or
+                                              str(job.error))
+            else:
+                self.buffer[:] = previewFolder(path, height, job.names)
+        # The listing ends up in the cache, entering the folder next is
+        # free
+        job = self.listing = listJob(self.nvim, path, arrived)
+
+    def cancelListing(self):
+        if self.listing is not None:
+            self.listing.cancel()
+            self.listing = None
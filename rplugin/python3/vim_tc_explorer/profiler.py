@@ -0,0 +1,261 @@
+# ============================================================================
+# FILE: profiler.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import functools
+import math
+import threading
+import time
+from contextlib import nullcontext
+from vim_tc_explorer.logger import log, WARNING
+from vim_tc_explorer.utils import echo
+
+# Opt-in, g:bolt_profile or :BoltProfile start
+enabled = False
+# Handler name -> handlerStats
+handlers = {}
+# Section name -> histogram, sections also run on worker threads
+sections = {}
+sectionLock = threading.Lock()
+# The call that is running on the nvim loop
+current = None
+loopThread = None
+NULL = nullcontext()
+# Width of the histogram buckets, 5% of the value
+GROWTH = 1.05
+
+
+class histogram(object):
+    """ Durations in us, bucketed logarithmically so recording is cheap
+        and the percentiles are within 5% """
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, us):
+        b = int(math.log(us, GROWTH)) if us > 1 else 0
+        self.buckets[b] = self.buckets.get(b, 0) + 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= p * self.count:
+                # Upper bound of the bucket
+                return min(GROWTH ** (b + 1), self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count,
+                'mean_us': self.total / self.count if self.count else 0.0,
+                'p50_us': self.percentile(0.5),
+                'p90_us': self.percentile(0.9),
+                'p99_us': self.percentile(0.99),
+                'max_us': self.max}
+
+
+class call(object):
+    __slots__ = ('rpcs', 'bytes', 'sections')
+
+    def __init__(self):
+        self.rpcs = 0
+        self.bytes = 0
+        # Section name -> us spent in it during the call
+        self.sections = {}
+
+
+class handlerStats(object):
+    def __init__(self):
+        self.wall = histogram()
+        self.rpcs = histogram()
+        self.rpcTotal = 0
+        self.bytes = 0
+        self.sections = {}
+
+    def add(self, us, c):
+        self.wall.add(us)
+        self.rpcs.add(c.rpcs)
+        self.rpcTotal += c.rpcs
+        self.bytes += c.bytes
+        for name, spent in c.sections.items():
+            self.sections[name] = self.sections.get(name, 0.0) + spent
+
+    def summary(self):
+        ret = self.wall.summary()
+        n = self.wall.count or 1
+        ret.update({'rpcs_mean': self.rpcTotal / n,
+                    'rpcs_p99': self.rpcs.percentile(0.99),
+                    'bytes_sent': self.bytes,
+                    'sections_us': dict(self.sections)})
+        return ret
+
+
+class timer(object):
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        us = (time.perf_counter() - self.start) * 1e6
+        with sectionLock:
+            hist = sections.get(self.name)
+            if hist is None:
+                hist = sections[self.name] = histogram()
+            hist.add(us)
+        c = current
+        if c is not None and threading.get_ident() == loopThread:
+            c.sections[self.name] = c.sections.get(self.name, 0.0) + us
+        return False
+
+
+def section(name):
+    """ with section('stat'): ... times the block when profiling, a
+        shared no-op context otherwise """
+    return timer(name) if enabled else NULL
+
+
+def hook(nvim):
+    """ Counts the requests sent to nvim and the characters sent to
+        buffers. Every API call (buffers included) goes through the
+        pynvim session, which is private, so without one only the
+        requests made through the public nvim.request are counted and
+        without either nothing is """
+    if getattr(nvim, 'boltProfiled', False):
+        return
+    try:
+        nvim.boltProfiled = True
+    except AttributeError:
+        return
+    target = getattr(nvim, '_session', None)
+    if not callable(getattr(target, 'request', None)):
+        target = nvim
+    request = getattr(target, 'request', None)
+    if not callable(request):
+        log('profiler: no requests to count', level=WARNING)
+        return
+
+    def counted(method, *args, **kwargs):
+        c = current
+        if c is not None and threading.get_ident() == loopThread:
+            c.rpcs += 1
+            if method == 'nvim_buf_set_lines' and args:
+                c.bytes += sum(len(line) + 1 for line in args[-1])
+        return request(method, *args, **kwargs)
+    try:
+        target.request = counted
+    except AttributeError:
+        log('profiler: cannot count the requests', level=WARNING)
+
+
+def run(name, f, handler, args, kwargs):
+    global current, loopThread
+    stats = handlers.get(name)
+    if stats is None:
+        stats = handlers[name] = handlerStats()
+    loopThread = threading.get_ident()
+    prev, current = current, call()
+    c = current
+    start = time.perf_counter()
+    try:
+        return f(handler, *args, **kwargs)
+    finally:
+        current = prev
+        stats.add((time.perf_counter() - start) * 1e6, c)
+
+
+def wrap(f, name):
+    @functools.wraps(f)
+    def wrapper(self, *args, **kwargs):
+        if not enabled:
+            return f(self, *args, **kwargs)
+        hook(self.nvim)
+        return run(name, f, self, args, kwargs)
+    return wrapper
+
+
+def instrument(cls):
+    """ Class decorator, wraps the command/autocmd handlers of cls. The
+        pynvim attributes are kept by functools.wraps """
+    for attr, f in list(vars(cls).items()):
+        rpc = getattr(f, '_nvim_rpc_method_name', None)
+        if rpc is None or rpc.endswith(':BoltProfile'):
+            continue
+        setattr(cls, attr, wrap(f, rpc.split(':', 1)[-1]))
+    return cls
+
+
+def reset():
+    handlers.clear()
+    with sectionLock:
+        sections.clear()
+
+
+def export():
+    with sectionLock:
+        sects = {n: h.summary() for n, h in sections.items()}
+    return {'handlers': {n: s.summary() for n, s in handlers.items()},
+            'sections': sects}
+
+
+def report():
+    """ Lines of the :BoltProfile report, the slowest (p99) first """
+    data = export()
+    ret = ['=== Bolt Profile (%s) ===' % ('on' if enabled else 'off'),
+           '%-24s %6s %8s %8s %8s %8s %6s %9s' %
+           ('handler', 'calls', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+            'rpcs', 'chars')]
+    rows = sorted(data['handlers'].items(), key=lambda kv: -kv[1]['p99_us'])
+    for name, s in rows:
+        ret.append('%-24s %6d %8.2f %8.2f %8.2f %8.2f %6.1f %9d' %
+                   (name, s['count'], s['p50_us'] / 1e3, s['p90_us'] / 1e3,
+                    s['p99_us'] / 1e3, s['max_us'] / 1e3, s['rpcs_mean'],
+                    s['bytes_sent']))
+        for sect, us in sorted(s['sections_us'].items()):
+            ret.append('    %-20s %8.2f ms total' % (sect, us / 1e3))
+    ret.append('')
+    ret.append('%-24s %6s %8s %8s %8s %8s' %
+               ('section', 'count', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    for name, s in sorted(data['sections'].items()):
+        ret.append('%-24s %6d %8.2f %8.2f %8.2f %8.2f' %
+                   (name, s['count'], s['p50_us'] / 1e3, s['p90_us'] / 1e3,
+                    s['p99_us'] / 1e3, s['max_us'] / 1e3))
+    return ret
+
+
+def command(nvim, args):
+    """ :BoltProfile [start|stop|reset|json <file>], shows the report
+        without arguments """
+    global enabled
+    action = args[0] if args else 'report'
+    if action == 'start':
+        enabled = True
+    elif action == 'stop':
+        enabled = False
+    elif action == 'reset':
+        reset()
+    elif action == 'json':
+        import json
+        path = args[1] if len(args) > 1 else 'bolt_profile.json'
+        with open(path, 'w') as f:
+            json.dump(export(), f, indent=2, sort_keys=True)
+        echo('Profile written to %s' % path)
+    else:
+        nvim.command('e bolt_profile')
+        nvim.command('setlocal buftype=nofile')
+        nvim.current.buffer[:] = report()
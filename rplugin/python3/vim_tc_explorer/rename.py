@@ -0,0 +1,297 @@
+# ============================================================================
+# FILE: rename.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import os
+import re
+from vim_tc_explorer.logger import log, WARNING
+
+# [N] name without extension, [E] extension with its dot,
+# [C] or [C:start:step:width] a counter
+PLACEHOLDER = re.compile(
+    r'\[(N|E|C(?::(-?\d*)(?::(-?\d*)(?::(\d*))?)?)?)\]')
+# Applied batches, (folder, [(old, new)] in the order they were done)
+journal = []
+JOURNAL_MAX = 20
+OPEN = 1
+DONE = 2
+
+
+class ruleError(Exception):
+    pass
+
+
+def parseRule(rule):
+    """ (regex or None, template). 'regex/template' rewrites the part of
+        the name the regex matches, a plain template the whole name """
+    if '/' in rule:
+        regex, template = rule.split('/', 1)
+        try:
+            return re.compile(regex), template
+        except re.error as err:
+            raise ruleError('bad regex: %s' % err)
+    return None, rule
+
+
+def expand(template, name, counter, escape=False):
+    """ The template with the placeholders filled in for name, counter
+        is the position of name in the batch (0 based). With escape the
+        result is a re.sub template, the backslashes of the filled in
+        names are not group references """
+    stem, ext = os.path.splitext(name)
+    if escape:
+        stem, ext = stem.replace('\\', r'\\'), ext.replace('\\', r'\\')
+
+    def fill(m):
+        if m.group(1) == 'N':
+            return stem
+        elif m.group(1) == 'E':
+            return ext
+        start = int(m.group(2) or 1)
+        step = int(m.group(3) or 1)
+        width = int(m.group(4) or 0)
+        return '%0*d' % (width, start + counter * step)
+    return PLACEHOLDER.sub(fill, template)
+
+
+def newNames(names, rule):
+    """ {relative path: new relative path} for the names the rule
+        changes. Only the last path component is renamed """
+    regex, template = parseRule(rule)
+    ret = {}
+    counter = 0
+    for rel in names:
+        folder, name = os.path.split(rel)
+        if regex is None:
+            new = expand(template, name, counter)
+        else:
+            if not regex.search(name):
+                continue
+            repl = expand(template, name, counter, escape=True)
+            try:
+                new = regex.sub(repl, name)
+            except (re.error, IndexError) as err:
+                raise ruleError('bad template: %s' % err)
+        counter += 1
+        if new != name:
+            if (not new or new in ('.', '..') or '/' in new or
+                    '\0' in new):
+                # Joined with the folder it would move the entry elsewhere
+                raise ruleError('invalid name %r for %s' % (new, name))
+            ret[rel] = os.path.join(folder, new)
+    return ret
+
+
+def problems(mapping, existing):
+    """ {source: reason} for the renames that can't be done. A target may
+        only be taken by an entry that is renamed away in the batch """
+    ret = {}
+    taken = {}
+    for old, new in mapping.items():
+        name = os.path.basename(new)
+        if not name or name in ('.', '..'):
+            ret[old] = 'invalid name'
+        elif new in existing and new not in mapping:
+            ret[old] = 'exists'
+        elif new in taken:
+            ret[old] = 'duplicate'
+            ret[taken[new]] = 'duplicate'
+        else:
+            taken[new] = old
+    return ret
+
+
+def tempName(folder, rel, i):
+    # Next to the entry, so that the rename stays on the filesystem
+    base = os.path.join(os.path.dirname(rel),
+                        '.bolt-rename-%d-%d' % (os.getpid(), i))
+    while os.path.lexists(os.path.join(folder, base)):
+        i += 1
+        base = os.path.join(os.path.dirname(rel),
+                            '.bolt-rename-%d-%d' % (os.getpid(), i))
+    return base
+
+
+def order(folder, mapping):
+    """ The renames as (old, new) steps that never overwrite a source
+        that has not moved yet. The sources form chains (a->b, b->c) and
+        cycles (a->b, b->a) where a target is renamed away in the batch.
+        Chains are done tail first, a cycle is cut by moving one of its
+        entries to a temporary name. Linear, every entry is visited once """
+    steps = []
+    state = {}
+    temps = 0
+    for start in mapping:
+        path = []
+        node = start
+        while node in mapping and node not in state:
+            state[node] = OPEN
+            path.append(node)
+            node = mapping[node]
+        tmp = None
+        if state.get(node) == OPEN:
+            # Back at the start (anything else would be a duplicate
+            # target), the start steps aside until the cycle has moved
+            tmp = tempName(folder, node, temps)
+            temps += 1
+            steps.append((node, tmp))
+            path = path[1:]
+        for n in reversed(path):
+            steps.append((n, mapping[n]))
+            state[n] = DONE
+        if tmp is not None:
+            steps.append((tmp, mapping[node]))
+            state[node] = DONE
+    return steps
+
+
+def run(folder, steps):
+    """ Renames the steps in order, a step whose target has appeared in
+        the meantime stops the batch and the finished steps are rolled
+        back. Returns an error message or None """
+    done = []
+    for old, new in steps:
+        src = os.path.join(folder, old)
+        dst = os.path.join(folder, new)
+        try:
+            if os.path.lexists(dst):
+                raise FileExistsError('%s exists' % new)
+            os.rename(src, dst)
+        except OSError as err:
+            log('Renaming %s failed: %s', src, err, level=WARNING)
+            for o, n in reversed(done):
+                try:
+                    os.rename(os.path.join(folder, n),
+                              os.path.join(folder, o))
+                except OSError as err2:
+                    log('Rolling back %s failed: %s', n, err2, level=WARNING)
+            return 'renaming %s failed: %s' % (old, err)
+        done.append((old, new))
+    return None
+
+
+def applyBatch(folder, mapping):
+    """ Renames the batch, recorded in the journal for undoBatch() """
+    steps = order(folder, mapping)
+    error = run(folder, steps)
+    if error is None:
+        journal.append((folder, steps))
+        del journal[:-JOURNAL_MAX]
+    return error
+
+
+def undoBatch():
+    """ Reverts the latest batch, returns (folder, error) or None when
+        there is nothing to undo """
+    if not journal:
+        return None
+    folder, steps = journal.pop()
+    error = run(folder, [(new, old) for old, new in reversed(steps)])
+    if error is not None:
+        # Left as it was, it can be retried once the conflict is gone
+        journal.append((folder, steps))
+    return folder, error
+
+
+class renamer(object):
+    """ Searcher style pane for renaming a batch of entries. The input
+        line holds the rule and the pane previews what it does """
+    def __init__(self, nvim, buffer, cwd, names, existing):
+        self.nvim = nvim
+        self.buffer = buffer
+        self.window = None
+        # Behave like a searcher, i.e. <bs> restores the explorer
+        self.isSearcher = True
+        self.cwd = cwd
+        # Relative paths, in the order the counter numbers them
+        self.names = names
+        # Everything in the listing, to find the targets that are taken
+        self.existing = existing
+        self.rule = ''
+        self.mapping = {}
+        self.problems = {}
+        self.error = None
+        # <C-a> hides the unchanged entries
+        self.showAll = True
+        self.selected = 0
+        self.fileredFiles = names[:]
+        self.headerLength = 7
+
+    def updateListing(self, pattern):
+        # Every key updates the preview, the rule is never cut short
+        self.rule = pattern
+        try:
+            self.mapping = newNames(self.names, pattern) if pattern else {}
+            self.problems = problems(self.mapping, self.existing)
+            self.error = None
+        except ruleError as err:
+            self.mapping = {}
+            self.problems = {}
+            self.error = str(err)
+        if self.showAll:
+            self.fileredFiles = self.names[:]
+        else:
+            self.fileredFiles = [n for n in self.names if n in self.mapping]
+        self.changeSelection(0)
+        return 1
+
+    def ready(self):
+        return bool(self.mapping) and not self.problems and not self.error
+
+    def changeSelection(self, offset):
+        self.selected += offset
+        if self.selected < 0:
+            self.selected = 0
+        elif self.selected >= len(self.fileredFiles):
+            self.selected = len(self.fileredFiles)-1
+
+    def toggle(self):
+        self.showAll = not self.showAll
+
+    def addMarker(self, index):
+        pass
+
+    def removeMarker(self, index):
+        pass
+
+    def isMarked(self, val):
+        return False
+
+    def getRowString(self, idx, val):
+        token = '-->' if idx == self.selected else '   '
+        if val in self.problems:
+            return '%s! %s -> %s  (%s)' % (token, val, self.mapping[val],
+                                           self.problems[val])
+        elif val in self.mapping:
+            return '%s  %s -> %s' % (token, val, self.mapping[val])
+        return '%s  %s' % (token, val)
+
+    def draw(self):
+        self.buffer[:] = self.getUIHeader() + [
+            self.getRowString(idx, val)
+            for idx, val in enumerate(self.fileredFiles)]
+
+    def getSelected(self):
+        return os.path.join(self.cwd, self.fileredFiles[self.selected]), None
+
+    def getUIHeader(self):
+        bar = "==============================================================="
+        leadingC = '#'
+        ret = []
+        ret.append(leadingC + bar)
+        if self.error:
+            status = self.error
+        else:
+            status = '%d renamed' % len(self.mapping)
+            if self.problems:
+                status += ', %d conflicts' % len(self.problems)
+        ret.append(leadingC + ' Bolt multi-rename (%d entries, %s)' %
+                   (len(self.names), status))
+        ret.append(leadingC + '  $>' + self.cwd)
+        ret.append(leadingC + '  Rule: template, or regex/template. '
+                   '[N] name  [E] .ext  [C:start:step:width] counter')
+        ret.append(leadingC + '  <Ret>:Rename  <C-a>:Show/hide unchanged  '
+                   '<bs>:Back')
+        ret.append(leadingC + bar)
+        return ret
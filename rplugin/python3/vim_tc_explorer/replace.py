@@ -0,0 +1,91 @@
+# ============================================================================
+# FILE: replace.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import os
+import shutil
+import stat
+import tempfile
+from vim_tc_explorer.logger import log, WARNING
+from vim_tc_explorer.utils import batcher, thread_pool
+
+# Outcome of a file, with the number of replacements made
+REPLACED = 'replaced'
+UNCHANGED = 'unchanged'
+MODIFIED = 'modified since the search'
+FAILED = 'failed'
+
+
+def rewrite(path, regex, replacement, lines, since):
+    """ Streams path through a temp file next to it with the matches of
+        regex on lines (1 based) replaced, and renames it over path.
+        Files modified after since (ns) are left alone. Returns
+        (outcome, replacements) """
+    # The file behind a symlink is rewritten, not the link
+    real = os.path.realpath(path)
+    last = max(lines)
+    count = 0
+    with open(real, 'rb') as src:
+        st = os.fstat(src.fileno())
+        if st.st_mtime_ns > since:
+            return MODIFIED, 0
+        fd, tmp = tempfile.mkstemp(prefix='.bolt-replace-',
+                                   dir=os.path.dirname(real))
+        try:
+            with os.fdopen(fd, 'wb') as dst:
+                n = 0
+                while n < last:
+                    raw = src.readline()
+                    if not raw:
+                        break
+                    n += 1
+                    if n in lines:
+                        body = raw.rstrip(b'\r\n')
+                        text = body.decode('utf-8', 'surrogateescape')
+                        new, k = regex.subn(replacement, text)
+                        if k:
+                            count += k
+                            raw = (new.encode('utf-8', 'surrogateescape') +
+                                   raw[len(body):])
+                    dst.write(raw)
+                # Nothing to replace after the last hit
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            if count == 0:
+                os.remove(tmp)
+                return UNCHANGED, 0
+            if os.stat(real).st_mtime_ns != st.st_mtime_ns:
+                # Written to while it was rewritten
+                os.remove(tmp)
+                return MODIFIED, 0
+            os.chmod(tmp, stat.S_IMODE(st.st_mode))
+            os.replace(tmp, real)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    return REPLACED, count
+
+
+class replaceJob(batcher):
+    """ Rewrites the files on the thread pool, callback(results, done)
+        gets {file: (outcome, replacements)} batches on the nvim loop """
+    def __init__(self, nvim, cwd, regex, replacement, lines, since,
+                 callback):
+        batcher.__init__(self, nvim, callback)
+        self.cwd = cwd
+        self.regex = regex
+        self.replacement = replacement
+        self.since = since
+        self.expect(len(lines))
+        for rel, numbers in lines.items():
+            thread_pool().submit(self.run, rel, numbers)
+
+    def run(self, rel, numbers):
+        try:
+            ret = rewrite(os.path.join(self.cwd, rel), self.regex,
+                          self.replacement, numbers, self.since)
+        except OSError as err:
+            log('Replacing in %s failed: %s', rel, err, level=WARNING)
+            ret = (FAILED, 0)
+        self.put(rel, ret)
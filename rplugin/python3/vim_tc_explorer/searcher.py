@@ -4,7 +4,10 @@
 # License: MIT license
 # ============================================================================
 import os
+import re
+import time
 from vim_tc_explorer.filter import filter
+from vim_tc_explorer.profiler import section
 
 
 class resultGroup(object):
@@ -25,6 +28,17 @@ class searcher(object):
         self.fileredFiles = []
         self.expanded = False
         self.cwd = cwd
+        # The rg pattern of the line matches, None when files are listed
+        self.pattern = None
+        # When rg was started (ns), files modified later are not replaced
+        self.searchTime = 0
+        # Replace mode, {file: [(line number, raw line, old, new)]}
+        self.replacement = None
+        self.regex = None
+        self.changes = {}
+        # {file: (outcome, replacements)} of the replace job
+        self.replaced = {}
+        self.replaceJob = None
         # Header takes up 6 rows
         self.headerLength = 6
 
@@ -55,6 +69,9 @@ class searcher(object):
     def getFileListFromResults(self):
         self.fileList = []
         self.rawFileList = []
+        if self.replacement is not None:
+            self.getReplaceListFromResults()
+            return
         for res in self.fileredFiles:
             # Add the file
             self.rawFileList.append(res)
@@ -65,12 +82,79 @@ class searcher(object):
                     self.fileList.append('  -'+l)
                     self.rawFileList.append(l)
 
+    def getReplaceListFromResults(self):
+        # Only the files with changes, each hit line as -old/+new
+        for res in self.fileredFiles:
+            changes = self.changes.get(res)
+            if not changes:
+                continue
+            row = '+%s | %d lines change' % (res, len(changes))
+            if res in self.replaced:
+                outcome, count = self.replaced[res]
+                row += ' [%s, %d replacements]' % (outcome, count)
+            self.rawFileList.append(res)
+            self.fileList.append(row)
+            if self.expanded:
+                for lineNum, raw, old, new in changes:
+                    self.fileList.append('  -%d:%s' % (lineNum, old))
+                    self.rawFileList.append(raw)
+                    self.fileList.append('  +%d:%s' % (lineNum, new))
+                    self.rawFileList.append(raw)
+
+    def setReplacement(self, replacement):
+        """ Previews replacing the matches of the pattern with replacement
+            (a re.sub template), None leaves the replace mode. Works on the
+            lines rg reported, the files are not read. Returns an error
+            message or None """
+        self.replacement = None
+        self.changes = {}
+        self.replaced = {}
+        if replacement is None:
+            return None
+        if self.pattern is None:
+            return 'Replace needs the line matches of :BoltGrep/:BoltSearch'
+        try:
+            regex = re.compile(self.pattern)
+        except re.error as err:
+            return 'The pattern is not a Python regex: %s' % err
+        changes = {}
+        try:
+            for res in self.resultFiles:
+                seen = set()
+                for l in self.results[res].lines:
+                    parts = l.split(':', 3)
+                    if len(parts) < 4 or not parts[1].isdigit():
+                        continue
+                    # --vimgrep repeats the line for every match on it
+                    lineNum = int(parts[1])
+                    if lineNum in seen:
+                        continue
+                    seen.add(lineNum)
+                    new = regex.sub(replacement, parts[3])
+                    if new != parts[3]:
+                        changes.setdefault(res, []).append(
+                            (lineNum, l, parts[3], new))
+        except (re.error, IndexError) as err:
+            return 'Bad replacement: %s' % err
+        self.regex = regex
+        self.replacement = replacement
+        self.changes = changes
+        return None
+
+    def replaceLines(self):
+        """ {file: set of line numbers} to rewrite, for the files that
+            pass the filter """
+        return {res: set(c[0] for c in self.changes[res])
+                for res in self.fileredFiles
+                if res in self.changes and res not in self.replaced}
+
     def search(self, dir, filePattern, inputPattern):
         self.prevbuffer = self.nvim.current.buffer
         self.nvim.current.buffer = self.buffer
         self.nvim.command('setlocal filetype=vim_tc_search_result')
         self.dir = dir
         self.inputPattern = inputPattern
+        self.pattern = inputPattern or None
         self.filePattern = filePattern
         self.command = "cd %s && " % dir
         if(not filePattern.startswith('-')):
@@ -81,7 +165,9 @@ class searcher(object):
             filePattern = filePattern.replace('-t', '-g')
             self.command += "rg %s --files" % (filePattern)
         self.buffer[:] = []
-        self.nvim.command("r !%s" % self.command)
+        self.searchTime = time.time_ns()
+        with section('rg'):
+            self.nvim.command("r !%s" % self.command)
         self.nvim.current.buffer = self.prevbuffer
         self.createResultStructure()
         self.getFileListFromResults()
@@ -94,7 +180,9 @@ class searcher(object):
         self.command = "cd %s && " % dir
         self.command += "rg -g *%s* --files" % (pattern)
         self.buffer[:] = []
-        self.nvim.command("r !%s" % self.command)
+        self.searchTime = time.time_ns()
+        with section('rg'):
+            self.nvim.command("r !%s" % self.command)
         self.nvim.current.buffer = self.prevbuffer
         self.createResultStructure()
         self.getFileListFromResults()
@@ -108,8 +196,11 @@ class searcher(object):
         if(filePattern is not ''):
             filePattern = '-t' + filePattern
         self.command += "rg %s %s --vimgrep" % (filePattern, pattern)
+        self.pattern = pattern
         self.buffer[:] = []
-        self.nvim.command("r !%s" % self.command)
+        self.searchTime = time.time_ns()
+        with section('rg'):
+            self.nvim.command("r !%s" % self.command)
         self.nvim.current.buffer = self.prevbuffer
         self.createResultStructure()
         self.getFileListFromResults()
@@ -132,14 +223,15 @@ class searcher(object):
         self.getFileListFromResults()
 
     def draw(self):
-        self.buffer[:] = self.getUIHeader()
-        # Draw each file
+        # Drawn in one go, the listing can be thousands of rows
+        rows = self.getUIHeader()
         for idx, val in enumerate(self.fileList):
             if idx == self.selected:
                 token = '-->'
             else:
                 token = '   '
-            self.buffer.append(token + val)
+            rows.append(token + val)
+        self.buffer[:] = rows
         # Debug
         # self.buffer.append(self.command)
 
@@ -149,23 +241,35 @@ class searcher(object):
         if(':' in currLine):
             # This is a match in a file
             lineParts = currLine.split(':')
-            self.buffer[:] = lineParts
             pathToFile = os.path.join(self.cwd, lineParts[0])
             lineNum = int(lineParts[1])
         else:
             pathToFile = os.path.join(self.cwd, currLine)
         return pathToFile, lineNum
 
+    def selectedIsFolder(self):
+        # rg only lists files
+        return False
+
     def getUIHeader(self):
         bar = "==============================================================="
         leadingC = '#'
         ret = []
         ret.append(leadingC + bar)
-        ret.append(leadingC + ' Bolt search results (%d results)' %
-                   len(self.fileList))
+        if self.replacement is None:
+            ret.append(leadingC + ' Bolt search results (%d results)' %
+                       len(self.fileList))
+        else:
+            pending = [len(self.changes[res]) for res in self.fileredFiles
+                       if res in self.changes and res not in self.replaced]
+            ret.append(leadingC + ' Bolt replace %s -> %s (%d lines in %d '
+                       'files)' % (self.pattern, self.replacement,
+                                   sum(pending), len(pending)))
         # Shall be highlighted
         ret.append(leadingC + '  $>' + self.command)
         qhStr = '  Quick Help: <Ret>:Open <C-a>:Expand <C-q>:Quit'
+        if self.replacement is not None:
+            qhStr += ' <S-F5>:Replace'
         ret.append(leadingC + qhStr)
         ret.append(leadingC + bar)
         return ret
@@ -0,0 +1,307 @@
+# ============================================================================
+# FILE: sync.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures import as_completed
+from vim_tc_explorer.filter import filter
+from vim_tc_explorer.logger import log, WARNING
+from vim_tc_explorer.utils import batcher, thread_pool
+
+# Timestamps closer than this are considered equal (FAT has 2s resolution)
+MTIME_SLACK_NS = 2 * 10**9
+
+
+def hashFile(path, length=1024*1024):
+    """ Content hash, runs in the worker processes """
+    h = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(length)
+            if not buf:
+                break
+            h.update(buf)
+    return h.digest()
+
+
+def hashDiffs(a, b, rels):
+    """ The rels whose content differs between the trees a and b, runs
+        in the worker processes. Unreadable files count as different """
+    ret = []
+    for rel in rels:
+        try:
+            if (hashFile(os.path.join(a, rel)) !=
+                    hashFile(os.path.join(b, rel))):
+                ret.append(rel)
+        except OSError:
+            ret.append(rel)
+    return ret
+
+
+def walkTree(root, job=None):
+    """ Returns {relative path: (isDir, size, mtime_ns)} for the tree,
+        cut short once job is cancelled """
+    ret = {}
+    stack = ['']
+    while stack:
+        if job is not None and job.cancelled:
+            break
+        rel = stack.pop()
+        try:
+            it = os.scandir(os.path.join(root, rel))
+        except OSError as err:
+            log('sync: cannot list %s: %s', rel, err, level=WARNING)
+            continue
+        with it:
+            for e in it:
+                relPath = os.path.join(rel, e.name)
+                try:
+                    isDir = e.is_dir(follow_symlinks=False)
+                    st = e.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                ret[relPath] = (isDir, st.st_size, st.st_mtime_ns)
+                if isDir:
+                    stack.append(relPath)
+    return ret
+
+
+def diffTrees(fa, fb, useHash=False):
+    """ Compares the walked trees fa and fb, returns ({relative path:
+        state}, files to compare the content of) with '>' for entries
+        to be copied from a to b, '<' for b to a and '!' for files that
+        differ but where none of them is newer """
+    ret = {}
+    candidates = []
+    for side, this, other in (('>', fa, fb), ('<', fb, fa)):
+        for rel, info in this.items():
+            if rel in other:
+                continue
+            # Only list the top most folder that is missing on the other side
+            parent = os.path.dirname(rel)
+            if parent and parent not in other:
+                continue
+            ret[rel] = side
+    for rel, (isDir, size, mtime) in fa.items():
+        if rel not in fb:
+            continue
+        oIsDir, oSize, oMtime = fb[rel]
+        if isDir != oIsDir:
+            # A folder on one side and a file on the other
+            ret[rel] = '!'
+        elif isDir:
+            continue
+        elif size == oSize and abs(mtime - oMtime) <= MTIME_SLACK_NS:
+            continue
+        elif useHash and size == oSize:
+            candidates.append(rel)
+        else:
+            ret[rel] = state(mtime, oMtime)
+    return ret, candidates
+
+
+class compareJob(batcher):
+    """ Compares the trees a and b in the background, callback(results,
+        done) gets {relative path: (state, isDir)} batches on the nvim
+        loop. The content comparisons (useHash) come in last """
+    def __init__(self, nvim, a, b, useHash, callback):
+        batcher.__init__(self, nvim, callback)
+        self.expect(1)
+        thread_pool().submit(self.run, a, b, useHash)
+
+    def run(self, a, b, useHash):
+        try:
+            self.compare(a, b, useHash)
+        except Exception as err:
+            log('sync: comparing %s and %s failed: %s', a, b, err,
+                level=WARNING)
+        self.putAll({})
+
+    def compare(self, a, b, useHash):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            fa, fb = pool.map(walkTree, [a, b], [self, self])
+        if self.cancelled:
+            return
+        ret, candidates = diffTrees(fa, fb, useHash)
+        # isDir of the side the entry is copied from
+        self.putAll({rel: (s, (fb if s == '<' else fa)[rel][0])
+                     for rel, s in ret.items()}, unitDone=False)
+        if not candidates:
+            return
+        chunk = max(1, len(candidates) // (4 * (os.cpu_count() or 1)))
+        with ProcessPoolExecutor() as pool:
+            futures = [pool.submit(hashDiffs, a, b, candidates[i:i + chunk])
+                       for i in range(0, len(candidates), chunk)]
+            for future in as_completed(futures):
+                if self.cancelled:
+                    for f in futures:
+                        f.cancel()
+                    return
+                self.putAll({rel: (state(fa[rel][2], fb[rel][2]), False)
+                             for rel in future.result()}, unitDone=False)
+
+
+def state(mtimeA, mtimeB):
+    if mtimeA - mtimeB > MTIME_SLACK_NS:
+        return '>'
+    elif mtimeB - mtimeA > MTIME_SLACK_NS:
+        return '<'
+    return '!'
+
+
+class syncer(object):
+    """ Pane that lists the differences between the trees of two
+        explorers, used in the same way as the searcher """
+    def __init__(self, nvim, buffer, cwd, otherCwd):
+        self.nvim = nvim
+        self.filter = filter()
+        self.buffer = buffer
+        # Behave like a searcher, i.e. <bs> restores the explorer
+        self.isSearcher = True
+        self.selected = 0
+        self.cwd = cwd
+        self.otherCwd = otherCwd
+        self.useHash = False
+        self.diffs = {}
+        # The differences that are folders (on the side copied from)
+        self.folders = set()
+        self.resultFiles = []
+        self.fileredFiles = []
+        self.markers = []
+        self.pattern = ''
+        # The comparison running in the background and what it reports to
+        self.job = None
+        self.onUpdate = None
+        # Header takes up 8 rows
+        self.headerLength = 8
+
+    def compare(self, useHash=False, onUpdate=None):
+        """ Compares the trees in the background, onUpdate(done) is
+            called on the nvim loop as the differences come in """
+        self.useHash = useHash
+        if onUpdate is not None:
+            self.onUpdate = onUpdate
+        prevbuffer = self.nvim.current.buffer
+        self.nvim.current.buffer = self.buffer
+        self.nvim.command('setlocal filetype=vim_tc_sync')
+        self.nvim.current.buffer = prevbuffer
+        self.cancel()
+        self.diffs = {}
+        self.folders = set()
+        self.resultFiles = []
+        self.fileredFiles = []
+        self.job = compareJob(self.nvim, self.cwd, self.otherCwd, useHash,
+                              self.arrived)
+
+    def arrived(self, results, done):
+        for rel, (state, isDir) in results.items():
+            self.diffs[rel] = state
+            if isDir:
+                self.folders.add(rel)
+        if done:
+            self.job = None
+            self.markers = [m for m in self.markers if m in self.diffs]
+        if results or done:
+            self.resultFiles = sorted(self.diffs)
+            self.updateListing(self.pattern)
+        if self.onUpdate is not None:
+            self.onUpdate(done)
+
+    def cancel(self):
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+
+    def comparing(self):
+        return self.job is not None
+
+    def getPairs(self, direction=None):
+        """ (src, dst) pairs for the marked (or else filtered) entries,
+            direction is '>' or '<' to override the state of each entry.
+            Returns (pairs, number of entries left out as they are a
+            folder on one side and a file on the other) """
+        ret = []
+        for rel in (self.markers or self.fileredFiles):
+            d = direction or self.diffs[rel]
+            if d == '>':
+                ret.append((os.path.join(self.cwd, rel),
+                            os.path.join(self.otherCwd, rel)))
+            elif d == '<':
+                ret.append((os.path.join(self.otherCwd, rel),
+                            os.path.join(self.cwd, rel)))
+        # Entries that only exist on the destination side can't be copied
+        ret = [(src, dst) for src, dst in ret if os.path.lexists(src)]
+        pairs = [(src, dst) for src, dst in ret
+                 if not os.path.lexists(dst) or
+                 os.path.isdir(src) == os.path.isdir(dst)]
+        return pairs, len(ret) - len(pairs)
+
+    def updateListing(self, pattern):
+        self.pattern = pattern
+        self.filter.filter(self.resultFiles, pattern, self.fileredFiles)
+        self.changeSelection(0)
+
+    def changeSelection(self, offset):
+        self.selected += offset
+        if self.selected < 0:
+            self.selected = 0
+        elif self.selected >= len(self.fileredFiles):
+            self.selected = len(self.fileredFiles)-1
+
+    def toggle(self):
+        # Re-run the comparison, with/without content hashes
+        self.compare(not self.useHash)
+
+    def addMarker(self, index):
+        self.markers.append(self.fileredFiles[index])
+
+    def removeMarker(self, index):
+        self.markers.remove(self.fileredFiles[index])
+
+    def isMarked(self, val):
+        return val in self.markers
+
+    def draw(self):
+        # Drawn in one go, it is redrawn as the differences come in
+        rows = self.getUIHeader()
+        for idx, val in enumerate(self.fileredFiles):
+            if idx == self.selected:
+                token = '-->'
+            else:
+                token = '   '
+            if self.isMarked(val):
+                rows.append(token + '<-{' + self.diffs[val] + ' ' + val +
+                            '}->')
+            else:
+                rows.append(token + ' ' + self.diffs[val] + ' ' + val)
+        self.buffer[:] = rows
+
+    def getSelected(self):
+        rel = self.fileredFiles[self.selected]
+        if self.diffs[rel] == '<':
+            return os.path.join(self.otherCwd, rel), None
+        return os.path.join(self.cwd, rel), None
+
+    def selectedIsFolder(self):
+        return self.fileredFiles[self.selected] in self.folders
+
+    def getUIHeader(self):
+        bar = "==============================================================="
+        leadingC = '#'
+        ret = []
+        ret.append(leadingC + bar)
+        ret.append(leadingC + ' Bolt synchronize dirs (%d differences%s%s)'
+                   % (len(self.fileredFiles),
+                      ', content compared' if self.useHash else '',
+                      ', comparing...' if self.comparing() else ''))
+        ret.append(leadingC + '  $>' + self.cwd)
+        ret.append(leadingC + '  $>' + self.otherCwd)
+        qhStr = '  Quick Help: >:Copy to other  <:Copy from other  !:Conflict'
+        ret.append(leadingC + qhStr)
+        qhStr = '              <M-y>:Sync  <C-a>:Toggle hash  <C-q>:Quit'
+        ret.append(leadingC + qhStr)
+        ret.append(leadingC + bar)
+        return ret
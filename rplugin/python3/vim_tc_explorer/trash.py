@@ -0,0 +1,162 @@
+# ============================================================================
+# FILE: trash.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import os
+import shutil
+import threading
+import time
+from vim_tc_explorer.logger import log, WARNING
+
+# Seconds a deleted batch can be restored before its space is reclaimed
+UNDO_WINDOW = 30
+
+
+class stagedBatch(object):
+    def __init__(self, entries, deadline):
+        # List of (original path, staged path)
+        self.entries = entries
+        self.deadline = deadline
+
+
+class trash(object):
+    """ Instant delete: entries are renamed into a staging area on the
+        same filesystem and removed by a background worker once the undo
+        window has passed """
+    def __init__(self, undoWindow=UNDO_WINDOW):
+        self.undoWindow = undoWindow
+        # st_dev -> staging folder
+        self.stagingDirs = {}
+        self.batches = []
+        self.counter = 0
+        self.cond = threading.Condition()
+        self.worker = None
+
+    def stagingDirFor(self, path):
+        """ Find (and create) a staging folder on the same device as path,
+            None when the cache folder lives on another device """
+        parent = os.path.dirname(os.path.abspath(path))
+        dev = os.lstat(parent).st_dev
+        if dev in self.stagingDirs:
+            return self.stagingDirs[dev]
+        cache = os.environ.get('XDG_CACHE_HOME') or \
+            os.path.join(os.path.expanduser('~'), '.cache')
+        cand = os.path.join(cache, 'bolt', 'trash')
+        try:
+            os.makedirs(cand, exist_ok=True)
+            if os.lstat(cand).st_dev != dev:
+                cand = None
+        except OSError:
+            cand = None
+        self.stagingDirs[dev] = cand
+        if cand is not None:
+            self.reclaimLeftovers(cand)
+        return cand
+
+    def reclaimLeftovers(self, stagingDir):
+        # Batches left behind by Bolt instances that are no longer running
+        for name in os.listdir(stagingDir):
+            try:
+                pid = int(name.split('-')[0])
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                self.queue([(None, os.path.join(stagingDir, name))], 0)
+            except (ValueError, OSError):
+                pass
+
+    def stage(self, paths):
+        """ Move paths out of the way, returns the paths that were staged """
+        entries = []
+        # Entries on devices without a staging folder, removed right away
+        doomed = []
+        batchDirs = {}
+        for path in paths:
+            try:
+                stagingDir = self.stagingDirFor(path)
+                if stagingDir is None:
+                    self.counter += 1
+                    head, tail = os.path.split(os.path.abspath(path))
+                    staged = os.path.join(head, '.%s.bolt-deleted-%d-%d' % (
+                        tail, os.getpid(), self.counter))
+                    os.rename(path, staged)
+                    doomed.append((path, staged))
+                    continue
+                if stagingDir not in batchDirs:
+                    self.counter += 1
+                    batchDir = os.path.join(stagingDir, '%d-%d-%d' % (
+                        os.getpid(), int(time.time()), self.counter))
+                    os.mkdir(batchDir)
+                    batchDirs[stagingDir] = batchDir
+                staged = os.path.join(batchDirs[stagingDir], str(len(entries)))
+                os.rename(path, staged)
+                entries.append((path, staged))
+            except OSError as err:
+                log('Could not delete %s: %s', path, err, level=WARNING)
+        # Remove the (by then empty) batch folders together with the entries
+        entries += [(None, d) for d in batchDirs.values()]
+        self.queue(entries, self.undoWindow)
+        if doomed:
+            self.queue([(None, staged) for orig, staged in doomed], 0)
+        return [orig for orig, staged in entries + doomed if orig is not None]
+
+    def queue(self, entries, delay):
+        with self.cond:
+            self.batches.append(stagedBatch(entries, time.time() + delay))
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.reclaim,
+                                               daemon=True)
+                self.worker.start()
+            self.cond.notify()
+
+    def undo(self):
+        """ Restore the latest batch that has not been reclaimed yet """
+        with self.cond:
+            for batch in reversed(self.batches):
+                if batch.deadline > time.time() and any(
+                        orig is not None for orig, staged in batch.entries):
+                    self.batches.remove(batch)
+                    break
+            else:
+                return []
+        restored = []
+        leftovers = []
+        for orig, staged in batch.entries:
+            if orig is None or os.path.lexists(orig):
+                leftovers.append((None, staged))
+                continue
+            try:
+                os.rename(staged, orig)
+                restored.append(orig)
+            except OSError as err:
+                log('Could not restore %s: %s', orig, err, level=WARNING)
+                leftovers.append((None, staged))
+        self.queue(leftovers, 0)
+        return restored
+
+    def reclaim(self):
+        """ Worker that removes the staged batches once they expire """
+        while True:
+            with self.cond:
+                while True:
+                    now = time.time()
+                    due = [b for b in self.batches if b.deadline <= now]
+                    if due:
+                        break
+                    timeout = None
+                    if self.batches:
+                        timeout = min(b.deadline for b in self.batches) - now
+                    self.cond.wait(timeout)
+                for batch in due:
+                    self.batches.remove(batch)
+            for batch in due:
+                # Entries before their batch folder
+                for orig, staged in batch.entries:
+                    if os.path.isdir(staged) and not os.path.islink(staged):
+                        shutil.rmtree(staged, ignore_errors=True)
+                    elif os.path.lexists(staged):
+                        try:
+                            os.remove(staged)
+                        except OSError as err:
+                            log('Could not reclaim %s: %s', staged, err,
+                                level=WARNING)
@@ -3,8 +3,12 @@
 # AUTHOR: Philip Karlsson <philipkarlsson at me.com>
 # License: MIT license
 # ============================================================================
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 nvim = None
+pool = None
 
 def init_utils(_nvim):
     global nvim
@@ -16,3 +20,79 @@ def python_input(message = 'input'):
     nvim.command("let user_input = input('" + message + ": ')")
     nvim.command('call inputrestore()')
     return nvim.eval('user_input')
+
+def echo(message):
+    """ Shows message in the message area, unlike print() this also
+        works from the callbacks of background work """
+    global nvim
+    nvim.out_write(message + '\n')
+
+def human_size(size):
+    for unit in ['B', 'K', 'M', 'G', 'T']:
+        if size < 1024 or unit == 'T':
+            break
+        size /= 1024.0
+    if unit == 'B':
+        return '%d%s' % (size, unit)
+    return '%.1f%s' % (size, unit)
+
+def thread_pool():
+    """ Shared pool for the background (mostly I/O bound) work """
+    global pool
+    if pool is None:
+        pool = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1)*4))
+    return pool
+
+
+class batcher(object):
+    """ Collects the results of background work and hands them to
+        callback(results, done) on the nvim loop, coalescing everything
+        that arrived since the last delivery """
+    def __init__(self, nvim, callback):
+        self.nvim = nvim
+        self.callback = callback
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.scheduled = False
+        self.remaining = 0
+
+    def expect(self, count):
+        with self.lock:
+            self.remaining += count
+
+    def put(self, key, value):
+        with self.lock:
+            if self.cancelled:
+                return
+            self.pending[key] = value
+            self.remaining -= 1
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.nvim.async_call(self.deliver)
+
+    def putAll(self, results, unitDone=True):
+        # Results of one unit of work at once, or a part of it
+        with self.lock:
+            if self.cancelled:
+                return
+            self.pending.update(results)
+            if unitDone:
+                self.remaining -= 1
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.nvim.async_call(self.deliver)
+
+    def deliver(self):
+        with self.lock:
+            results = self.pending
+            self.pending = {}
+            self.scheduled = False
+            done = self.remaining <= 0
+        if not self.cancelled:
+            self.callback(results, done)
+
+    def cancel(self):
+        self.cancelled = True
@@ -6,11 +6,26 @@
 import neovim
 import os
 import re
+import time
+from vim_tc_explorer import clipboard
 from vim_tc_explorer.copy import CopyUtilitiy
-from vim_tc_explorer.logger import log, log_list
+from vim_tc_explorer.logger import log, log_list, WARNING
 from vim_tc_explorer.explorer import explorer
 from vim_tc_explorer.searcher import searcher
-from vim_tc_explorer.utils import init_utils, python_input
+from vim_tc_explorer.archive import isFolder, extract, ERRORS
+from vim_tc_explorer.dirsize import dirSizeJob
+from vim_tc_explorer.frecency import history, jumper
+from vim_tc_explorer.listing import SORT_MODES
+from vim_tc_explorer.prefetch import prefetcher
+from vim_tc_explorer.preview import previewer
+from vim_tc_explorer.rename import renamer, applyBatch, undoBatch
+from vim_tc_explorer.replace import replaceJob, REPLACED, MODIFIED, FAILED
+from vim_tc_explorer.gitignore import findRepoRoot
+from vim_tc_explorer.trash import trash
+from vim_tc_explorer.utils import init_utils, python_input, human_size, echo
+
+# Seconds between redraws while background work streams in
+REDRAW_INTERVAL = 0.25
 
 
 class vim_tc_explorer(object):
@@ -21,12 +36,19 @@ class vim_tc_explorer(object):
         self.nvim = nvim
         init_utils(nvim)
         self.copyUtil = CopyUtilitiy(nvim)
+        self.trash = trash()
+        self.prefetcher = prefetcher()
+        # The F3 quick-view split
+        self.preview = previewer(nvim)
         # Start the explorer in cwd
         self.cwd = os.path.abspath(os.getcwd())
         # Create both explorers but only show one depending on cmd?
         self.explorers = []
-        self.explorers.append(explorer(self.cwd))
-        self.explorers.append(explorer(self.cwd))
+        # Off unless g:bolt_hide_hidden / g:bolt_hide_ignored are set
+        hide = (bool(nvim.vars.get('bolt_hide_hidden')),
+                bool(nvim.vars.get('bolt_hide_ignored')))
+        self.explorers.append(explorer(self.cwd, *hide))
+        self.explorers.append(explorer(self.cwd, *hide))
         # Index to keep track of which explorer that is currently selected
         self.selectedExplorer = 0
 
@@ -49,6 +71,7 @@ class vim_tc_explorer(object):
         # Method used to close the plugin
         # Delete both buffers
         self.nvim.command('stopinsert')
+        self.preview.close()
         if(withFile is False):
             # Shift to the OG buffer
             self.nvim.current.buffer = self.ogBuffer
@@ -57,6 +80,18 @@ class vim_tc_explorer(object):
             self.nvim.command('bwipeout %s' % self.explorerBufferNumberTwo)
         self.nvim.command('bwipeout %s' % self.inputBufferNumber)
 
+    def selectionChanged(self, exp):
+        self.prefetcher.schedule(exp)
+        self.updatePreview(exp)
+
+    def updatePreview(self, exp):
+        # The quick view follows the selection
+        if not self.preview.isShown() or not exp.fileredFiles:
+            return
+        path, lineNum = exp.getSelected()
+        self.preview.show(os.path.abspath(os.path.join(exp.cwd, path)),
+                          lineNum)
+
     def createKeyMap(self):
         # Remap keys for the input layer
         # Enter
@@ -92,10 +127,27 @@ class vim_tc_explorer(object):
         # Abort filter
         str = "inoremap <buffer> <C-w> <ESC>:BoltAbortFilter<CR>"
         self.nvim.command(str)
+        # Sort mode
+        self.nvim.command("inoremap <buffer> <C-o> <ESC>:BoltSort<CR>")
+        # Branch view
+        self.nvim.command("inoremap <buffer> <C-r> <ESC>:BoltBranch<CR>")
+        # Detail view
+        self.nvim.command("inoremap <buffer> <C-e> <ESC>:BoltDetails<CR>")
         # Set cwd
         self.nvim.command("inoremap <buffer> <C-s> <ESC>:BoltSetCwd<CR>")
         # Expand/Collapse search matches
         self.nvim.command("inoremap <buffer> <C-a> <ESC>:BoltSearchToggle<CR>")
+        # Jump to a visited folder
+        self.nvim.command("inoremap <buffer> <F9> <ESC>:BoltJump<CR>")
+        # Bulk marking, the keypad keys as in total commander
+        str = "inoremap <buffer> <kPlus> <ESC>:BoltMark pattern: "
+        self.nvim.command(str)
+        str = "inoremap <buffer> <kMinus> <ESC>:BoltUnmark pattern: "
+        self.nvim.command(str)
+        str = "inoremap <buffer> <kMultiply> <ESC>:BoltMarkInvert<CR>"
+        self.nvim.command(str)
+        self.nvim.command("inoremap <buffer> <C-l> <ESC>:BoltMarkAll<CR>")
+        self.nvim.command("inoremap <buffer> <C-x> <ESC>:BoltMarkRange<CR>")
         # File operations
         #
         # Original total commander shortcuts
@@ -108,12 +160,26 @@ class vim_tc_explorer(object):
         # F7 - Create directory
         # F8 - Delete file
         self.nvim.command("inoremap <buffer> <F2> <ESC>:BoltRename name: ")
+        remapStr = "inoremap <buffer> <S-F2> <ESC>:BoltMultiRename<CR>"
+        self.nvim.command(remapStr)
+        self.nvim.command("inoremap <buffer> <F3> <ESC>:BoltQuickView<CR>")
         self.nvim.command("inoremap <buffer> <C-c> <ESC>:BoltCopy<CR>")
         self.nvim.command("inoremap <buffer> <C-v> <ESC>:BoltPaste<CR>")
         self.nvim.command("inoremap <buffer> <F6> <ESC>:BoltMove name: ")
         self.nvim.command("inoremap <buffer> <F7> <ESC>:BoltMkdir name: ")
         remapStr = "inoremap <buffer> <F8> <ESC>:BoltDelete<CR>"
         self.nvim.command(remapStr)
+        remapStr = "inoremap <buffer> <C-z> <ESC>:BoltUndoDelete<CR>"
+        self.nvim.command(remapStr)
+        remapStr = "inoremap <buffer> <C-y> <ESC>:BoltSync<CR>"
+        self.nvim.command(remapStr)
+        # F5 stays reserved for Copy
+        remapStr = "inoremap <buffer> <M-y> <ESC>:BoltSyncApply<CR>"
+        self.nvim.command(remapStr)
+        remapStr = "inoremap <buffer> <S-F5> <ESC>:BoltReplaceApply<CR>"
+        self.nvim.command(remapStr)
+        remapStr = "inoremap <buffer> <M-F5> <ESC>:BoltPack name: "
+        self.nvim.command(remapStr)
         remapStr = "inoremap <buffer> <C-t> <ESC>:BoltCreateFile name: "
         self.nvim.command(remapStr)
         # Close
@@ -162,6 +228,7 @@ class vim_tc_explorer(object):
             self.explorers[self.selectedExplorer].refreshListing()
         self.explorers[self.selectedExplorer].updateListing("")
         self.explorers[self.selectedExplorer].draw()
+        self.selectionChanged(self.explorers[self.selectedExplorer])
 
     def tc_explore_cwd(self, args, range):
         exp = self.explorers[self.selectedExplorer]
@@ -214,6 +281,7 @@ class vim_tc_explorer(object):
         self.explorers[1].updateListing("")
         self.explorers[0].draw()
         self.explorers[1].draw()
+        self.selectionChanged(self.explorers[0])
 
 # ============================================================================
 # Handlers
@@ -221,18 +289,37 @@ class vim_tc_explorer(object):
     def tc_enter(self, args, range):
         # Handle enter
         exp = self.explorers[self.selectedExplorer]
+        if isinstance(exp, renamer):
+            self.applyRename(exp)
+            return
+        if not exp.fileredFiles:
+            self.nvim.command('startinsert')
+            return
         selFile, lineNum = exp.getSelected()
-        if os.path.isdir(os.path.join(exp.cwd,
-                         selFile)):
+        # Known from the listing, a folder on a hung mount is not stat'ed
+        isDir = exp.selectedIsFolder()
+        if exp.isSearcher and isDir:
+            # Folders listed by a searcher are opened in the explorer
+            selFile = os.path.join(exp.cwd, selFile)
+            exp = self.restoreExplorer()
+        if not exp.isSearcher and isDir:
             exp.cd(selFile)
             exp.draw()
+            self.selectionChanged(exp)
             # Clear the line
             self.nvim.current.line = ''
             self.nvim.command('startinsert')
             self.abortFilter(None, None)
         else:
             try:
-                filePath = os.path.join(exp.cwd, selFile)
+                # Archive members are extracted to a temp file first
+                filePath = extract(os.path.abspath(os.path.join(exp.cwd,
+                                                                selFile)))
+            except ERRORS as err:
+                echo('Extracting %s failed: %s' % (selFile, err))
+                self.nvim.command('startinsert')
+                return
+            try:
                 if(lineNum is not None):
                     # Would be nice to go to zz at the same time
                     self.nvim.command('e +%d %s' % (lineNum,
@@ -240,7 +327,7 @@ class vim_tc_explorer(object):
                 else:
                     self.nvim.command('e %s' % os.path.abspath(filePath))
             except neovim.api.nvim.NvimError as err:
-                print("Error/possibly warning opening file")
+                echo("Error/possibly warning opening file")
             self.close()
             return
 
@@ -255,6 +342,9 @@ class vim_tc_explorer(object):
         exp.buffer[ind] = exp.buffer[ind].replace("   ", "-->")
         if(exp.selected == 0):
             self.winCmd(exp.window, 'normal! zz')
+        if not exp.isSearcher:
+            exp.requestDetails()
+        self.selectionChanged(exp)
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
 
@@ -267,6 +357,9 @@ class vim_tc_explorer(object):
         exp.buffer[ind] = exp.buffer[ind].replace("-->", "   ")
         ind = exp.selected + exp.headerLength - 1
         exp.buffer[ind] = exp.buffer[ind].replace("   ", "-->")
+        if not exp.isSearcher:
+            exp.requestDetails()
+        self.selectionChanged(exp)
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
 
@@ -281,6 +374,9 @@ class vim_tc_explorer(object):
         exp.buffer[ind] = exp.buffer[ind].replace("-->", "   ")
         ind = exp.selected + exp.headerLength - 1
         exp.buffer[ind] = exp.buffer[ind].replace("   ", "-->")
+        if not exp.isSearcher:
+            exp.requestDetails()
+        self.selectionChanged(exp)
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
 
@@ -293,6 +389,9 @@ class vim_tc_explorer(object):
         exp.buffer[ind] = exp.buffer[ind].replace("-->", "   ")
         ind = exp.selected + exp.headerLength - 1
         exp.buffer[ind] = exp.buffer[ind].replace("   ", "-->")
+        if not exp.isSearcher:
+            exp.requestDetails()
+        self.selectionChanged(exp)
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
 
@@ -309,6 +408,19 @@ class vim_tc_explorer(object):
                 self.explorers[1].active = True
             self.explorers[0].draw()
             self.explorers[1].draw()
+            self.updatePreview(self.explorers[self.selectedExplorer])
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def quickView(self, args, range):
+        """ Toggle the quick-view split, it previews the selection (a
+            grep hit centred on its line) as it moves """
+        exp = self.explorers[self.selectedExplorer]
+        if self.preview.isShown():
+            self.preview.close()
+        else:
+            self.preview.open(exp.window)
+            self.updatePreview(exp)
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
 
@@ -325,7 +437,7 @@ class vim_tc_explorer(object):
     def tc_find(self, args, range):
         """ The find command """
         # Save the current explorer for restoration when the searcher finish
-        self.expSave = self.explorers[self.selectedExplorer]
+        self.saveExplorer(self.explorers[self.selectedExplorer])
         # Replace the current explorer with a searcher and borrow its buffer
         se = searcher(self.nvim, self.expSave.buffer, self.expSave.cwd)
         se.window = self.expSave.window
@@ -334,6 +446,7 @@ class vim_tc_explorer(object):
         se.find(dir, args[0])
         self.explorers[self.selectedExplorer] = se
         self.explorers[self.selectedExplorer].draw()
+        self.updatePreview(se)
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
         str = 'Help: <kbd> Filter pattern; <bs> Go to parent'
@@ -342,7 +455,7 @@ class vim_tc_explorer(object):
     def tc_grep(self, args, range):
         """ The grep command """
         # Save the current explorer for restoration when the searcher finish
-        self.expSave = self.explorers[self.selectedExplorer]
+        self.saveExplorer(self.explorers[self.selectedExplorer])
         # Replace the current explorer with a searcher and borrow its buffer
         se = searcher(self.nvim, self.expSave.buffer, self.expSave.cwd)
         se.window = self.expSave.window
@@ -357,23 +470,26 @@ class vim_tc_explorer(object):
         se.grep(dir, filePattern, pattern)
         self.explorers[self.selectedExplorer] = se
         self.explorers[self.selectedExplorer].draw()
+        self.updatePreview(se)
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
         str = 'Help: <kbd> Filter pattern; <bs> Go to parent'
         self.nvim.current.buffer.append(str)
 
     def gitStatus(self, args, range):
-        firstFile = self.explorers[self.selectedExplorer].getFirstFile()
-        filePath = os.path.join(self.explorers[self.selectedExplorer].cwd, firstFile)
-        self.nvim.command('e %s' % (os.path.abspath(filePath)))
-        self.close()
+        root = findRepoRoot(self.explorers[self.selectedExplorer].cwd)
+        if root is None:
+            echo('Not in a git repository')
+            return
+        self.close(False)
+        # Point fugitive to the repository without opening a file in it
+        self.nvim.call('FugitiveDetect', root)
         self.nvim.command('G')
-        self.nvim.command('bwipeout #')
 
     def tc_search(self, args, range):
         """ Search patterns comes from command line """
         # Save the current explorer for restoration when the searcher finish
-        self.expSave = self.explorers[self.selectedExplorer]
+        self.saveExplorer(self.explorers[self.selectedExplorer])
         # Replace the current explorer with a searcher and borrow its buffer
         se = searcher(self.nvim, self.expSave.buffer, self.expSave.cwd)
         se.window = self.expSave.window
@@ -387,11 +503,293 @@ class vim_tc_explorer(object):
         se.search(dir, filePattern, inputPattern)
         self.explorers[self.selectedExplorer] = se
         self.explorers[self.selectedExplorer].draw()
+        self.updatePreview(se)
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
         str = 'Help: <kbd> Filter pattern; <bs> Go to parent'
         self.nvim.current.buffer.append(str)
 
+    def tc_duplicates(self, args, range):
+        """ Find duplicate files below the current folder """
+        # Imported on use, like syncer, they bring in the process pool
+        from vim_tc_explorer.duplicates import duplicateFinder
+        self.saveExplorer(self.explorers[self.selectedExplorer])
+        df = duplicateFinder(self.nvim, self.expSave.buffer, self.expSave.cwd)
+        df.window = self.expSave.window
+        drawn = [0.0]
+
+        def update(done):
+            if df not in self.explorers or not df.buffer.valid:
+                df.cancel()
+                return
+            now = time.monotonic()
+            if not done and now - drawn[0] < REDRAW_INTERVAL:
+                return
+            drawn[0] = now
+            df.draw()
+            if self.explorers[self.selectedExplorer] is df:
+                self.updatePreview(df)
+        df.find(update)
+        self.explorers[self.selectedExplorer] = df
+        self.explorers[self.selectedExplorer].draw()
+        self.updatePreview(df)
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def jump(self, args, range):
+        """ Jump to a visited folder. With a pattern the best match is
+            entered right away, otherwise the folders are listed """
+        exp = self.explorers[self.selectedExplorer]
+        if exp.isSearcher:
+            self.nvim.command('startinsert')
+            return
+        if args:
+            matches = []
+            exp.filter.filter(history().ranking(), ' '.join(args), matches,
+                              keepOrder=True)
+            for folder in matches:
+                if folder == exp.cwd:
+                    continue
+                if isFolder(folder):
+                    exp.cd(folder)
+                    exp.updateListing('')
+                    exp.draw()
+                    self.selectionChanged(exp)
+                    break
+                # Gone since it was visited
+                history().forget(folder)
+            else:
+                echo('No visited folder matches %s' % ' '.join(args))
+            self.nvim.command('startinsert')
+            self.nvim.command('normal! $')
+            return
+        self.saveExplorer(exp)
+        jp = jumper(self.nvim, exp.buffer, exp.cwd, history())
+        jp.window = exp.window
+        self.explorers[self.selectedExplorer] = jp
+        jp.draw()
+        self.updatePreview(jp)
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def dirSizes(self, args, range):
+        """ Compute the sizes of the entries in the background, with
+            'sort' the listing is sorted by size as they come in """
+        exp = self.explorers[self.selectedExplorer]
+        if exp.isSearcher or exp.archive is not None:
+            return
+        if exp.sizeJob is not None:
+            exp.sizeJob.cancel()
+        if 'sort' in args:
+            exp.setSortMode('size')
+        folder = exp.cwd
+
+        def update(results, done):
+            # A newer job or another folder may own exp.sizeJob by now
+            if (exp not in self.explorers or exp.cwd != folder or
+                    not exp.buffer.valid or exp.sizeJob is not job):
+                job.cancel()
+                if exp.sizeJob is job:
+                    exp.sizeJob = None
+                return
+            exp.updateSizes(results)
+            if exp.sortMode == 'size' and exp.fileredFiles:
+                selName = exp.fileredFiles[exp.selected]
+                exp.sortFiles()
+                exp.updateListing(exp.pattern)
+                exp.setSelectionWithName(selName)
+            exp.draw()
+            if done:
+                exp.sizeJob = None
+        # Called back through the nvim loop only, after this assignment
+        job = exp.sizeJob = dirSizeJob(self.nvim, folder,
+                                       exp.currentFiles[:], update)
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def pack(self, args, range):
+        """ Pack the marked entries (the selected one when none are
+            marked) into a .zip or .tar.gz in the background """
+        # Imported on use, like syncer, it brings in the process pool
+        from vim_tc_explorer.pack import formatOf, FORMATS
+        exp = self.explorers[self.selectedExplorer]
+        if args and args[0] == 'name:':
+            args = args[1:]
+        if (exp.isSearcher or self.refuseReadOnly(exp) or
+                not exp.fileredFiles):
+            self.nvim.command('startinsert')
+            return
+        names = list(exp.markers)
+        if not names:
+            names = [exp.fileredFiles[exp.selected]]
+        if args:
+            name = ' '.join(args)
+        else:
+            name = (names[0] if len(names) == 1 else
+                    os.path.basename(exp.cwd)) + '.zip'
+        target = os.path.join(exp.cwd, name)
+        if formatOf(target) is None:
+            echo('Packs to %s' % ', '.join(FORMATS))
+        elif os.path.lexists(target):
+            echo('%s exists' % name)
+        else:
+            self.packStart(exp, target, names)
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def packStart(self, exp, target, names):
+        from vim_tc_explorer.pack import packJob
+        name = os.path.relpath(target, exp.cwd)
+        folder = exp.cwd
+        progress = {'bytes': 0, 'total': 0}
+        drawn = [0.0]
+
+        def update(results, done):
+            progress.update(results)
+            if not done:
+                now = time.monotonic()
+                if now - drawn[0] >= REDRAW_INTERVAL and progress['total']:
+                    drawn[0] = now
+                    echo('Packing %s: %d%% of %s' % (
+                        name, 100 * progress['bytes'] // progress['total'],
+                        human_size(progress['total'])))
+                return
+            count, error = progress['result']
+            if error is not None:
+                echo('Packing %s failed: %s' % (name, error))
+                return
+            echo('Packed %d entries into %s (%s)' % (
+                count, name, human_size(os.path.getsize(target))))
+            if (exp in self.explorers and exp.cwd == folder and
+                    exp.buffer.valid):
+                exp.cd('.')
+                exp.updateListing(exp.pattern)
+                exp.draw()
+        packJob(self.nvim, target, exp.cwd, names, update)
+
+    def branchView(self, args, range):
+        """ Toggle the flat listing of all files below the folder,
+            'gitignore' leaves out the ignored files """
+        exp = self.explorers[self.selectedExplorer]
+        if not exp.isSearcher and exp.archive is None:
+            exp.setBranchView(not exp.branchView, 'gitignore' in args)
+            exp.draw()
+            self.updatePreview(exp)
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def hide(self, args, range):
+        """ Toggle hiding the 'hidden' (dot) or 'ignored' (.gitignore)
+            entries, 'on'/'off' sets it """
+        exp = self.explorers[self.selectedExplorer]
+        what = args[0] if args else 'hidden'
+        if what not in ('hidden', 'ignored'):
+            echo('Hides hidden or ignored entries')
+        elif not exp.isSearcher:
+            current = exp.hideHidden if what == 'hidden' else exp.hideIgnored
+            on = not current
+            if len(args) > 1 and args[1] in ('on', 'off'):
+                on = args[1] == 'on'
+            exp.setHide(what, on)
+            exp.draw()
+            self.selectionChanged(exp)
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def toggleDetails(self, args, range):
+        exp = self.explorers[self.selectedExplorer]
+        if not exp.isSearcher:
+            exp.toggleDetails()
+            exp.draw()
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def sort(self, args, range):
+        """ Sort by the given mode, cycles through the modes without
+            arguments. 'reverse' flips the order """
+        exp = self.explorers[self.selectedExplorer]
+        if exp.isSearcher:
+            return
+        modes = [a for a in args if a in SORT_MODES]
+        if modes:
+            mode = modes[0]
+        else:
+            mode = SORT_MODES[(SORT_MODES.index(exp.sortMode) + 1) %
+                              len(SORT_MODES)]
+        exp.setSortMode(mode, 'reverse' in args)
+        exp.draw()
+        self.updatePreview(exp)
+        echo('Sorted by %s%s' % (mode, ' (reversed)' if 'reverse' in args
+                                 else ''))
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def tc_sync(self, args, range):
+        """ Compare the trees of the two panes """
+        from vim_tc_explorer.sync import syncer
+        if self.numExplorers < 2:
+            echo('Synchronize dirs requires the dual pane mode (Boltd)')
+            return
+        other = self.explorers[1 - self.selectedExplorer]
+        self.saveExplorer(self.explorers[self.selectedExplorer])
+        se = syncer(self.nvim, self.expSave.buffer, self.expSave.cwd,
+                    other.cwd)
+        se.window = self.expSave.window
+        drawn = [0.0]
+
+        def update(done):
+            if se not in self.explorers or not se.buffer.valid:
+                se.cancel()
+                return
+            # Large trees come in many batches, redrawn a few times a
+            # second at most
+            now = time.monotonic()
+            if not done and now - drawn[0] < REDRAW_INTERVAL:
+                return
+            drawn[0] = now
+            se.draw()
+            if self.explorers[self.selectedExplorer] is se:
+                self.updatePreview(se)
+        se.compare('hash' in args, update)
+        self.explorers[self.selectedExplorer] = se
+        self.explorers[self.selectedExplorer].draw()
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def syncApply(self, args, range):
+        """ Copy the delta listed by the syncer, optionally forcing
+            the direction with > or < """
+        from vim_tc_explorer.sync import syncer
+        se = self.explorers[self.selectedExplorer]
+        if not isinstance(se, syncer):
+            echo('Not in synchronize dirs mode (<C-y>)')
+            return
+        if se.comparing():
+            echo('Still comparing the trees')
+            self.nvim.command('startinsert')
+            self.nvim.command('normal! $')
+            return
+        direction = args[0] if args and args[0] in ('>', '<') else None
+        pairs, conflicts = se.getPairs(direction)
+        if conflicts:
+            echo('Left out %d entries that are a folder on one side and a '
+                 'file on the other' % conflicts)
+        try:
+            self.copyUtil.sync_list(pairs)
+        except OSError as err:
+            log('Sync failed: %s', err, level=WARNING)
+            echo('Sync failed: %s' % err)
+        se.compare(se.useHash)
+        se.updateListing(self.nvim.current.line)
+        se.draw()
+        other = self.explorers[1 - self.selectedExplorer]
+        if not other.isSearcher:
+            other.cd('.')
+            other.updateListing(other.pattern)
+            other.draw()
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
     def tc_search_toggle(self, args, range):
         exp = self.explorers[self.selectedExplorer]
         if(exp.isSearcher):
@@ -399,23 +797,48 @@ class vim_tc_explorer(object):
             exp.updateListing(self.nvim.current.line)
             exp.draw()
             self.winCmd(exp.window, 'normal! zz')
+            self.updatePreview(exp)
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
 
+    def refuseReadOnly(self, exp):
+        """ Tells the user when exp can't be modified, True then """
+        if exp.isSearcher or not exp.readOnly():
+            return False
+        echo('%s is read-only' % os.path.basename(exp.archive[0]))
+        return True
+
     def move(self, args, range):
         exp = self.explorers[self.selectedExplorer]
-        exp.move(args[1])
+        if not self.refuseReadOnly(exp):
+            exp.move(args[1])
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
         exp.draw()
 
     def delete(self, args, range):
         exp = self.explorers[self.selectedExplorer]
-        exp.delete()
+        # Only the explorer and the duplicates pane delete
+        if not hasattr(exp, 'delete'):
+            echo('Nothing to delete here')
+        elif not self.refuseReadOnly(exp):
+            exp.delete(self.trash)
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
         exp.draw()
 
+    def undoDelete(self, args, range):
+        exp = self.explorers[self.selectedExplorer]
+        restored = self.trash.undo()
+        if not restored:
+            echo('Nothing to undo')
+        elif not exp.isSearcher:
+            exp.cd('.')
+            exp.updateListing(exp.pattern)
+            exp.draw()
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
     def toggleMark(self, args, range):
         exp = self.explorers[self.selectedExplorer]
         if exp.isMarked(exp.fileredFiles[exp.selected]):
@@ -424,23 +847,185 @@ class vim_tc_explorer(object):
             exp.addMarker(exp.selected)
         exp.draw()
 
+    def markPattern(self, args, range, mark=True):
+        """ (Un)marks by glob, or by regex after -r """
+        exp = self.explorers[self.selectedExplorer]
+        if args and args[0] == 'pattern:':
+            args = args[1:]
+        isRegex = bool(args) and args[0] == '-r'
+        if isRegex:
+            args = args[1:]
+        if args and not exp.isSearcher:
+            try:
+                exp.markPattern(' '.join(args), isRegex, mark)
+            except re.error as err:
+                echo('Bad pattern: %s' % err)
+            exp.draw()
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def markBulk(self, args, range, how):
+        exp = self.explorers[self.selectedExplorer]
+        if not exp.isSearcher:
+            if how == 'all':
+                exp.markAll()
+            elif how == 'invert':
+                exp.invertMarks()
+            elif how == 'range':
+                exp.markRange()
+            exp.draw()
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
     def rename(self, args, range):
         exp = self.explorers[self.selectedExplorer]
-        exp.rename(args[1])
+        if not self.refuseReadOnly(exp):
+            exp.rename(args[1])
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
         exp.draw()
 
+    def multiRename(self, args, range):
+        """ Rename the marked entries (the filtered ones when none are
+            marked) in one batch, the rule is typed into the input line
+            and previewed in the pane """
+        exp = self.explorers[self.selectedExplorer]
+        if exp.isSearcher or self.refuseReadOnly(exp):
+            self.nvim.command('startinsert')
+            return
+        # In listing order, which is the order of the counter
+        names = [n for n in exp.currentFiles if exp.isMarked(n)]
+        if not names:
+            names = list(exp.fileredFiles)
+        self.saveExplorer(exp)
+        rn = renamer(self.nvim, exp.buffer, exp.cwd, names,
+                     set(exp.currentFiles))
+        rn.window = exp.window
+        rule = ' '.join(args)
+        rn.updateListing(rule)
+        self.explorers[self.selectedExplorer] = rn
+        rn.draw()
+        self.nvim.current.line = rule
+        self.updatePreview(rn)
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def applyRename(self, rn):
+        if not rn.ready():
+            if rn.error or rn.problems:
+                echo('Fix the rule first: %s' % (rn.error or '%d conflicts'
+                                                 % len(rn.problems)))
+            else:
+                echo('The rule renames nothing')
+            self.nvim.command('startinsert')
+            self.nvim.command('normal! $')
+            return
+        error = applyBatch(rn.cwd, rn.mapping)
+        exp = self.restoreExplorer()
+        # A single relisting for the whole batch
+        exp.cd('.')
+        self.abortFilter(None, None)
+        if error is not None:
+            echo('Nothing renamed, %s' % error)
+        else:
+            echo('Renamed %d entries, :BoltUndoRename reverts them' %
+                 len(rn.mapping))
+
+    def undoRename(self, args, range):
+        exp = self.explorers[self.selectedExplorer]
+        res = undoBatch()
+        if res is None:
+            echo('Nothing to undo')
+        elif res[1] is not None:
+            echo('Undo failed, %s' % res[1])
+        elif not exp.isSearcher:
+            exp.cd('.')
+            exp.updateListing(exp.pattern)
+            exp.draw()
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def replace(self, args, range):
+        """ Preview replacing the matches of the grep with the args (a
+            re.sub template, \\1 for groups), without args the replace mode
+            is left. <S-F5> carries it out """
+        se = self.explorers[self.selectedExplorer]
+        if isinstance(se, searcher):
+            if se.replaceJob is not None:
+                echo('A replace is still running')
+            else:
+                error = se.setReplacement(' '.join(args) if args else None)
+                if error is not None:
+                    echo(error)
+                se.updateListing(self.nvim.current.line)
+                se.draw()
+                self.updatePreview(se)
+        else:
+            echo('Replace works on the results of :BoltGrep/:BoltSearch')
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
+    def replaceApply(self, args, range):
+        """ Rewrite the listed files in the background, the pane shows
+            the outcome of each file as it comes in """
+        se = self.explorers[self.selectedExplorer]
+        if not isinstance(se, searcher) or se.replacement is None:
+            echo('Not in replace mode (:BoltReplace)')
+            self.nvim.command('startinsert')
+            self.nvim.command('normal! $')
+            return
+        lines = se.replaceLines()
+        if se.replaceJob is not None or not lines:
+            echo('A replace is still running' if se.replaceJob is not None
+                 else 'Nothing to replace')
+            self.nvim.command('startinsert')
+            self.nvim.command('normal! $')
+            return
+        outcomes = {}
+        drawn = [0.0]
+
+        def update(results, done):
+            se.replaced.update(results)
+            for outcome, count in results.values():
+                n, total = outcomes.get(outcome, (0, 0))
+                outcomes[outcome] = (n + 1, total + count)
+            if done:
+                se.replaceJob = None
+            # Thousands of files come in, the pane is redrawn a few
+            # times a second at most
+            now = time.monotonic()
+            if not done and now - drawn[0] < REDRAW_INTERVAL:
+                return
+            drawn[0] = now
+            if se.buffer.valid and self.explorers[self.selectedExplorer] is se:
+                se.getFileListFromResults()
+                se.changeSelection(0)
+                se.draw()
+            if done:
+                files, count = outcomes.get(REPLACED, (0, 0))
+                msg = 'Replaced %d matches in %d files' % (count, files)
+                if MODIFIED in outcomes:
+                    msg += ', %d modified since the search are left alone' \
+                        % outcomes[MODIFIED][0]
+                if FAILED in outcomes:
+                    msg += ', %d failed (:BoltDisplayLog)' % \
+                        outcomes[FAILED][0]
+                echo(msg)
+        se.replaceJob = replaceJob(self.nvim, se.cwd, se.regex,
+                                   se.replacement, lines, se.searchTime,
+                                   update)
+        self.nvim.command('startinsert')
+        self.nvim.command('normal! $')
+
     def cut(self, args, range):
         log('cut')
         # Get the selected files to clipboard
         exp = self.explorers[self.selectedExplorer]
-        cb = exp.get_markers_as_string()
-        # This way it is consistent between different instances
-        # of bolt => will be nice for the refactoring of
-        # multiple panes :)
-        # Add operation type (copy/move) as prefix
-        self.nvim.command("let g:BoltCb = '%s'" % ('mv#' + cb))
+        if exp.isSearcher:
+            self.nvim.command('startinsert')
+            return
+        # Shared with the other panes and nvim instances
+        clipboard.put(self.nvim, 'mv', exp.getMarkedPaths())
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
 
@@ -448,27 +1033,28 @@ class vim_tc_explorer(object):
         log('copy')
         # Get the selected files to clipboard
         exp = self.explorers[self.selectedExplorer]
-        cb = exp.get_markers_as_string()
-        # Add the path(s) to bolt ('b') register
-        self.nvim.command("let @b='%s'" % (cb.replace('_{%boltSplitter%}_', ',')))
-        # This way it is consistent between different instances
-        # of bolt => will be nice for the refactoring of
-        # multiple panes :)
-        # Add operation type (copy/move) as prefix
-        self.nvim.command("let g:BoltCb = '%s'" % ('cp#' + cb))
+        if exp.isSearcher:
+            self.nvim.command('startinsert')
+            return
+        paths = exp.getMarkedPaths()
+        if len(paths) <= clipboard.LIST_MAX:
+            # Add the path(s) to bolt ('b') register
+            self.nvim.call('setreg', 'b', ','.join(paths))
+        # Shared with the other panes and nvim instances
+        clipboard.put(self.nvim, 'cp', paths)
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
 
     def paste(self, args, range):
         exp = self.explorers[self.selectedExplorer]
-        rawCb = self.nvim.command_output('silent echo g:BoltCb')
-        rawCb = rawCb.strip('\n')
-        # Get opcode
-        p = re.compile('^(.*?)\#')
-        op = p.findall(rawCb)[0]
-        rawCb = re.sub(r'^.*\#', '', rawCb)
-        # Parse the raw clipboard and recreate the list
-        cb = rawCb.split('_{%boltSplitter%}_')
+        if self.refuseReadOnly(exp):
+            self.nvim.command('startinsert')
+            return
+        op, cb = clipboard.get(self.nvim)
+        if not cb:
+            echo('The clipboard is empty')
+            self.nvim.command('startinsert')
+            return
         if op == 'cp':
             self.copyUtil.copy_list(cb, exp.cwd)
         elif op == 'mv':
@@ -481,14 +1067,16 @@ class vim_tc_explorer(object):
 
     def mkdir(self, args, range):
         exp = self.explorers[self.selectedExplorer]
-        exp.mkdir(args[1])
+        if not self.refuseReadOnly(exp):
+            exp.mkdir(args[1])
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
         exp.draw()
 
     def createFile(self, args, range):
         exp = self.explorers[self.selectedExplorer]
-        exp.createFile(args[1])
+        if not self.refuseReadOnly(exp):
+            exp.createFile(args[1])
         self.nvim.command('startinsert')
         self.nvim.command('normal! $')
         # Set the new file as selected
@@ -504,13 +1092,38 @@ class vim_tc_explorer(object):
         exp = self.explorers[self.selectedExplorer]
         exp.updateListing("")
         exp.draw()
+        self.updatePreview(exp)
+
+    def saveExplorer(self, exp):
+        """ Keeps exp for restoreExplorer() while a searcher pane
+            borrows its buffer """
+        self.expSave = exp
+        if not exp.isSearcher:
+            exp.undecorate()
+        # Its background work must not draw over the searcher
+        exp.inBuffer = False
+
+    def restoreExplorer(self):
+        """ Puts the explorer a searcher pane replaced back """
+        exp = self.explorers[self.selectedExplorer]
+        self.expSave.window = exp.window
+        self.expSave.inBuffer = True
+        self.explorers[self.selectedExplorer] = self.expSave
+        exp = self.explorers[self.selectedExplorer]
+        prevbuffer = self.nvim.current.buffer
+        self.nvim.current.buffer = exp.buffer
+        self.nvim.command('setlocal filetype=vim_tc_explorer')
+        self.nvim.current.buffer = prevbuffer
+        return exp
 
     def handle_input(self):
         """ Input handler for filter """
         exp = self.explorers[self.selectedExplorer]
         inputLine = self.nvim.current.line
-        # Handle space for the markers
-        if inputLine == " ":
+        # Handle space for the markers, the rename rule takes spaces
+        if isinstance(exp, renamer):
+            pass
+        elif inputLine == " ":
             self.nvim.current.line = ""
             self.toggleMark(None, None)
             self.tc_down(None, None)
@@ -531,16 +1144,15 @@ class vim_tc_explorer(object):
             if not inputLine and (not self.nvim.current.buffer[1] ==
                                   'Filter active: (abort with <c-w>)'):
                 if(exp.isSearcher):
-                    # Restore
-                    self.expSave.window = exp.window
-                    self.explorers[self.selectedExplorer] = self.expSave
-                    exp = self.explorers[self.selectedExplorer]
-                    prevbuffer = self.nvim.current.buffer
-                    self.nvim.current.buffer = exp.buffer
-                    self.nvim.command('setlocal filetype=vim_tc_explorer')
-                    self.nvim.current.buffer = prevbuffer
+                    exp = self.restoreExplorer()
                     str = 'Help: <kbd> Filter pattern; <bs> Go to parent'
                     self.nvim.current.buffer.append(str)
+                elif exp.loadJob is not None:
+                    # A slow folder is left without waiting on it
+                    exp.cancelLoad()
+                elif exp.branchView:
+                    # Back to the normal listing
+                    exp.setBranchView(False)
                 else:
                     # Change directory to the parrent
                     exp.cd('..')
@@ -554,3 +1166,4 @@ class vim_tc_explorer(object):
         exp.draw()
         if(len(exp.fileredFiles) != 0):
             exp.window.cursor = (exp.selected + exp.headerLength, 0)
+        self.selectionChanged(exp)
@@ -0,0 +1,63 @@
+# ============================================================================
+# FILE: walker.py
+# AUTHOR: Philip Karlsson <philipkarlsson at me.com>
+# License: MIT license
+# ============================================================================
+import os
+from vim_tc_explorer.gitignore import load, matchersFor, isIgnored
+from vim_tc_explorer.listing import entry
+from vim_tc_explorer.logger import log, WARNING
+from vim_tc_explorer.profiler import section
+from vim_tc_explorer.utils import batcher, thread_pool
+
+
+class walkJob(batcher):
+    """ Walks the tree below root with one scandir task per folder on the
+        thread pool. callback({relative path: entry}, done) is called on
+        the nvim loop with the files found since the last call. With
+        hidden the dot entries are skipped, folders included """
+    def __init__(self, nvim, root, callback, gitignore=False, hidden=False):
+        batcher.__init__(self, nvim, callback)
+        self.root = root
+        self.gitignore = gitignore
+        self.hidden = hidden
+        matchers = matchersFor(root) if gitignore else None
+        self.expect(1)
+        thread_pool().submit(self.walk, '', matchers)
+
+    def walk(self, rel, matchers):
+        if self.cancelled:
+            return
+        folder = os.path.join(self.root, rel)
+        files = {}
+        subdirs = []
+        try:
+            with section('listdir'), os.scandir(folder) as it:
+                for e in it:
+                    if self.hidden and e.name.startswith('.'):
+                        continue
+                    try:
+                        isDir = e.is_dir(follow_symlinks=False)
+                    except OSError:
+                        isDir = False
+                    if matchers is not None and isIgnored(matchers, e.path,
+                                                          isDir):
+                        continue
+                    relPath = os.path.join(rel, e.name)
+                    if isDir:
+                        subdirs.append(relPath)
+                    else:
+                        files[relPath] = entry(relPath, False)
+        except OSError as err:
+            log('walk: cannot list %s: %s', folder, err, level=WARNING)
+        # Registered before this folder is reported as done
+        self.expect(len(subdirs))
+        for sub in subdirs:
+            subMatchers = matchers
+            if matchers is not None:
+                m = load(os.path.join(self.root, sub))
+                if m is not None:
+                    subMatchers = matchers + [(os.path.join(self.root, sub),
+                                               m)]
+            thread_pool().submit(self.walk, sub, subMatchers)
+        self.putAll(files)
@@ -0,0 +1,23 @@
+if exists("b:current_syntax")
+  finish
+endif
+
+syntax match commands "<F5>"
+syntax match commands "<C-a>"
+syntax match commands "<C-q>"
+
+syntax match path "$>.*$"
+syntax match copyTo "^... > .*$"
+syntax match copyFrom "^... < .*$"
+syntax match conflict "^... ! .*$"
+syntax match selection "<-{.*$"
+
+syntax match commands "-->.*"
+highlight link commands Statement
+highlight link path Debug
+highlight link copyTo Keyword
+highlight link copyFrom Type
+highlight link conflict Error
+highlight link selection String
+
+let b:current_syntax = "vim_tc_sync"